@@ -1,8 +1,39 @@
 import os
 import csv
 import json
-from pathlib import Path
+import time
+import argparse
+import queue
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import google.generativeai as genai  # ← API ANTIGUA
+from cache_respuestas import CacheRespuestas, DEFAULT_RUTA_CACHE
+from parser_json import ParserArrayIncremental, rescatar_casos, describir_descartado
+from division_hu import (
+    dividir_hu, agrupar_criterios, construir_hu_parcial, renumerar_casos,
+    DEFAULT_CRITERIOS_POR_BLOQUE, DEFAULT_UMBRAL_DIVISION,
+)
+from empaquetado import (
+    agrupar_hus, construir_texto_paquete, repartir_respuesta_paquete, INSTRUCCIONES_EMPAQUETADO,
+    DEFAULT_PRESUPUESTO_PAQUETE,
+)
+from metricas import METRICAS, DEFAULT_RUTA_RESUMEN, DEFAULT_RUTA_PROMETHEUS
+from resiliencia import (
+    ModeloResiliente, PoliticaReintentos, ConcurrenciaAdaptativa, InterruptorCircuito,
+    ControlHedging, ejecutar_con_hedging, DEFAULT_MAX_INTENTOS, DEFAULT_TASA_MAXIMA_HEDGING,
+)
+from backends import (
+    BackendRest, BackendLocal, GrabadorRespuestas, cerrar_modelo, BACKENDS, BACKEND_SDK, BACKEND_REST, BACKEND_LOCAL,
+    DEFAULT_MIN_TOKENS_PREFIJO,
+)
+from lectura_hu import leer_hus
+from manifiesto import ManifiestoEjecucion, DEFAULT_RUTA_MANIFIESTO, hash_contenido
+from cobertura import calcular_cobertura, construir_hu_faltantes, CAMPOS_COBERTURA
+from deduplicacion import (
+    deduplicar_archivo, leer_casos, MODOS as MODOS_DEDUPLICACION, MODO_FUSIONAR, DEFAULT_UMBRAL_DUPLICADOS,
+)
+from almacen_resultados import AlmacenResultados, DEFAULT_RUTA_ALMACEN, ORIGEN_CONSOLA
 
 # ==============================
 # CONFIGURACIÓN
@@ -10,11 +41,35 @@ import google.generativeai as genai  # ← API ANTIGUA
 
 DEFAULT_MODEL_NAME = "gemini-2.5-flash"
 DEFAULT_TEMPERATURE = 0.3
+DEFAULT_WORKERS = 4
 
-def setup_gemini(api_key, model_name=DEFAULT_MODEL_NAME, temperature=DEFAULT_TEMPERATURE):
+def setup_gemini(api_key, model_name=DEFAULT_MODEL_NAME, temperature=DEFAULT_TEMPERATURE,
+                 backend=BACKEND_SDK, grabar=None, **opciones):
     """
     Configura la API de Gemini y devuelve el MODELO (no una tupla).
+
+    backend: "sdk" (genai.GenerativeModel), "rest" (cliente HTTP propio con
+    pool keep-alive, sin estado global) o "local" (stub offline determinista).
+    grabar: ruta JSONL donde guardar cada respuesta para reproducirla luego
+    con el backend local. opciones: parámetros propios del backend
+    (timeouts, tamaño del pool, grabación a reproducir...).
     """
+    if backend not in BACKENDS:
+        raise ValueError(f"❌ Backend desconocido: {backend}. Opciones: {', '.join(BACKENDS)}")
+
+    if backend == BACKEND_LOCAL:
+        model = BackendLocal(model_name, temperature, **opciones)
+    elif backend == BACKEND_REST:
+        model = BackendRest(api_key, model_name, temperature, **opciones)
+    else:
+        model = _setup_sdk(api_key, model_name, temperature)
+
+    if grabar:
+        model = GrabadorRespuestas(model, grabar)
+    return model
+
+
+def _setup_sdk(api_key, model_name, temperature):
     if not api_key:
         raise ValueError("❌ La API Key no puede estar vacía.")
     
@@ -22,7 +77,7 @@ def setup_gemini(api_key, model_name=DEFAULT_MODEL_NAME, temperature=DEFAULT_TEM
     genai.configure(api_key=api_key)
     
     # Crear el modelo
-    model = genai.GenerativeModel(
+    model = ModeloSdkConInstrucciones(
         model_name,
         generation_config={"temperature": temperature}
     )
@@ -31,26 +86,60 @@ def setup_gemini(api_key, model_name=DEFAULT_MODEL_NAME, temperature=DEFAULT_TEM
     return model
 
 
+class ModeloSdkConInstrucciones(genai.GenerativeModel):
+    """
+    GenerativeModel que acepta generate_content(..., instrucciones=texto).
+    El SDK fija system_instruction al crear el modelo, así que se guarda un
+    modelo por prefijo (son pocos: el prompt QA y, en el chat, uno por HU).
+    """
+
+    admite_instrucciones = True
+    MAX_PREFIJOS = 32
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._con_instrucciones = {}
+        self._lock_instrucciones = threading.Lock()
+
+    def generate_content(self, contents, *args, instrucciones=None, **kwargs):
+        if not instrucciones:
+            return super().generate_content(contents, *args, **kwargs)
+        with self._lock_instrucciones:
+            modelo = self._con_instrucciones.get(instrucciones)
+            if modelo is None:
+                if len(self._con_instrucciones) >= self.MAX_PREFIJOS:
+                    self._con_instrucciones.pop(next(iter(self._con_instrucciones)))
+                modelo = genai.GenerativeModel(
+                    self.model_name,
+                    generation_config=self._generation_config,
+                    system_instruction=instrucciones,
+                )
+                self._con_instrucciones[instrucciones] = modelo
+        return modelo.generate_content(contents, *args, **kwargs)
+
+
+def describir_modelo(model):
+    """Devuelve (nombre, temperatura) del modelo, usado como parte de la clave de caché."""
+    nombre = getattr(model, "model_name", None) or type(model).__name__
+    config = getattr(model, "_generation_config", None) or {}
+    temperatura = config.get("temperature") if isinstance(config, dict) else getattr(config, "temperature", None)
+    return nombre, temperatura
+
+
 # ==============================
 # LECTOR DE HUs
 # ==============================
 
 def leer_archivos_hu(carpeta: str):
-    """Lee todos los archivos .txt de la carpeta."""
-    carpeta_path = Path(carpeta)
-
-    if not carpeta_path.exists():
-        raise FileNotFoundError(f"La carpeta {carpeta} no existe.")
-
-    archivos = list(carpeta_path.glob("*.txt"))
-
-    if not archivos:
-        raise ValueError("No se encontraron archivos .txt en la carpeta.")
+    """
+    Lee todas las HUs de la carpeta (.txt, .md, .jsonl; con subcarpetas) en
+    una lista. Para lotes grandes conviene lectura_hu.leer_hus, que las
+    entrega de a una.
+    """
+    lista_hu = list(leer_hus(carpeta))
 
-    lista_hu = []
-    for archivo in archivos:
-        texto = archivo.read_text(encoding="utf-8")
-        lista_hu.append((archivo.name, texto))
+    if not lista_hu:
+        raise ValueError("No se encontraron HUs (.txt, .md, .jsonl) en la carpeta.")
 
     return lista_hu
 
@@ -166,66 +255,721 @@ HU COMPLETA Y CRITERIOS PARA ANALIZAR:
 {hu_texto}
 """
 
-def generar_casos_prueba(model, hu_texto: str, custom_prompt=None):
+# Prompt separado en el prefijo fijo (instrucciones QA, igual para todas las HUs)
+# y la parte variable: el prefijo se envía como instrucción de sistema para que
+# el proveedor lo cachee en lugar de procesarlo de nuevo con cada HU
+PromptDividido = namedtuple("PromptDividido", ["instrucciones", "solicitud"])
+
+
+def dividir_prompt(hu_texto: str, custom_prompt=None):
+    """
+    Divide el prompt de una HU en (instrucciones, solicitud) por el marcador
+    {hu_texto}: lo anterior es el prefijo cacheable y lo demás, la solicitud.
+    Un prompt personalizado sin el marcador (o que no se puede formatear)
+    queda entero como prefijo y la HU se agrega al final, como siempre.
+    Unidas, las dos partes son exactamente el prompt de construir_prompt.
+    """
+    plantilla = custom_prompt or DEFAULT_PROMPT
+    antes, marcador, despues = plantilla.partition("{hu_texto}")
+    if marcador:
+        try:
+            return PromptDividido(antes.format(), (marcador + despues).format(hu_texto=hu_texto))
+        except (KeyError, IndexError, ValueError):
+            pass
+    return PromptDividido(plantilla, f"\n\nHU: {hu_texto}")
+
+
+def construir_prompt(hu_texto: str, custom_prompt=None):
+    """Arma el prompt final para una HU (prompt personalizado o el por defecto)."""
+    return "".join(dividir_prompt(hu_texto, custom_prompt))
+
+
+PROMPT_CONTINUACION = """
+{prompt}
+
+IMPORTANTE: una respuesta anterior a este mismo pedido se cortó antes de terminar.
+Ya se recibieron los casos hasta {ultimo_id} inclusive. NO los repitas: continúa
+desde {siguiente_id} en adelante, con el mismo formato JSON (un array de casos).
+"""
+
+
+def estimar_tokens(texto: str):
+    """Estimación aproximada de tokens (~4 caracteres por token)."""
+    return len(texto) // 4 + 1
+
+
+def generar_casos_prueba(model, hu_texto: str, custom_prompt=None, cache=None, limitador=None,
+                         max_continuaciones=0, hedging=None):
     """
     Genera casos de prueba usando el modelo.
     model: debe ser un objeto GenerativeModel (NO una tupla)
+    cache: CacheRespuestas opcional; si hay acierto no se llama al modelo.
+    limitador: LimitadorTasa opcional, se consulta solo si se llama al modelo.
+    max_continuaciones: si la respuesta llega cortada, cuántas solicitudes
+        "continúa desde CP-0NN" se permiten (0 = solo rescatar lo recibido).
+    hedging: ControlHedging opcional; si la solicitud supera el percentil de
+        latencia aprendido, se envía una copia y gana el primer resultado válido.
     """
-    if custom_prompt:
-        try:
-            prompt = custom_prompt.format(hu_texto=hu_texto)
-        except KeyError:
-            prompt = custom_prompt + f"\n\nHU: {hu_texto}"
+    prompt = dividir_prompt(hu_texto, custom_prompt)
+
+    clave = _clave_cache(model, cache, "".join(prompt), hu_texto)
+    if clave is not None:
+        casos = cache.obtener(clave)
+        if casos is not None:
+            return casos
+
+    def intento():
+        return _solicitar_casos(model, prompt, hu_texto, limitador, max_continuaciones)
+
+    if hedging is not None:
+        casos, completa = ejecutar_con_hedging(METRICAS.propagar(intento), hedging)
     else:
-        prompt = DEFAULT_PROMPT.format(hu_texto=hu_texto)
+        casos, completa = intento()
+
+    # Un resultado parcial no se guarda en caché, para que la próxima corrida lo reintente
+    if clave is not None and completa:
+        cache.guardar(clave, casos)
+
+    return casos
+
+
+def _solicitar_casos(model, prompt, hu_texto, limitador, max_continuaciones):
+    """Una solicitud completa al modelo: llamada, parseo, continuaciones y pasos normalizados."""
+    if limitador is not None:
+        limitador.adquirir(estimar_tokens(_texto_completo(prompt)))
 
     # ← AQUÍ se usa .generate_content() del modelo
-    respuesta = model.generate_content(prompt)
-    texto = respuesta.text
+    respuesta = _llamar_modelo(model, prompt)
+    with METRICAS.medir("parseo"):
+        casos, completa = parsear_respuesta_casos(respuesta.text, referencia=_referencia_hu(hu_texto))
+
+    if not completa and max_continuaciones:
+        nuevos, completa = continuar_casos_truncados(model, prompt, casos, hu_texto,
+                                                     limitador=limitador,
+                                                     max_continuaciones=max_continuaciones)
+        casos.extend(nuevos)
+
+    for caso in casos:
+        pasos_raw = caso.get("pasos", "")
+        caso["pasos"] = normalizar_pasos(pasos_raw)
+
+    return casos, completa
+
+
+def _texto_completo(prompt):
+    return "".join(prompt) if isinstance(prompt, PromptDividido) else prompt
 
+
+def _llamar_modelo(model, prompt, **kwargs):
+    """
+    Llamada instrumentada al modelo: tiempo, tokens y contadores de solicitudes.
+    En streaming solo mide la apertura; el resto se mide al consumir el stream.
+    Un PromptDividido manda su prefijo como instrucciones si el modelo las
+    admite; si no, se envía el texto completo de siempre.
+    """
+    if isinstance(prompt, PromptDividido):
+        if prompt.instrucciones.strip() and getattr(model, "admite_instrucciones", False):
+            kwargs["instrucciones"] = prompt.instrucciones
+            prompt = prompt.solicitud.lstrip()
+        else:
+            prompt = "".join(prompt)
+    METRICAS.incrementar("solicitudes_modelo")
+    with METRICAS.medir("modelo"):
+        respuesta = model.generate_content(prompt, **kwargs)
+    if not kwargs.get("stream"):
+        METRICAS.registrar_uso(getattr(respuesta, "usage_metadata", None))
+    return respuesta
+
+
+def _clave_cache(model, cache, prompt, hu_texto):
+    if cache is None:
+        return None
+    modelo_nombre, temperatura = describir_modelo(model)
+    return cache.clave(modelo_nombre, temperatura, prompt, hu_texto)
+
+
+def _referencia_hu(hu_texto: str):
+    primera_linea = hu_texto.strip().splitlines()[0] if hu_texto.strip() else ""
+    return primera_linea[:60]
+
+
+def parsear_respuesta_casos(texto: str, referencia=""):
+    """
+    Extrae la lista de casos del texto del modelo. Si el JSON está roto o
+    cortado, rescata los objetos completos en lugar de fallar.
+    Devuelve (casos, completa): completa=False si hubo rescate.
+    """
     inicio = texto.find("[")
     fin = texto.rfind("]") + 1
 
-    if inicio == -1 or fin == 0:
+    if inicio == -1:
         raise ValueError("No se encontró JSON válido en la respuesta.")
 
-    json_text = texto[inicio:fin]
-    casos = json.loads(json_text)
+    if fin > inicio:
+        try:
+            casos = json.loads(texto[inicio:fin])
+        except json.JSONDecodeError:
+            pass
+        else:
+            if not isinstance(casos, list):
+                raise ValueError("El JSON devuelto no es una lista de casos.")
+            return casos, True
 
-    if not isinstance(casos, list):
-        raise ValueError("El JSON devuelto no es una lista de casos.")
+    rescate = rescatar_casos(texto[inicio:])
+    METRICAS.rescate.registrar_rescate(rescate, referencia)
+    if not rescate.casos:
+        raise ValueError("No se pudo rescatar ningún caso de la respuesta.")
+    return rescate.casos, False
 
-    for caso in casos:
-        pasos_raw = caso.get("pasos", "")
-        caso["pasos"] = normalizar_pasos(pasos_raw)
 
-    return casos
+def _siguiente_id(id_caso, por_defecto):
+    digitos = "".join(ch for ch in str(id_caso) if ch.isdigit())
+    numero = int(digitos) + 1 if digitos else por_defecto
+    return f"CP-{numero:03d}"
+
+
+def continuar_casos_truncados(model, prompt, casos, hu_texto, limitador=None, max_continuaciones=1):
+    """
+    Pide al modelo solo los casos que faltan ("continúa desde CP-0NN") en
+    lugar de regenerar la HU completa. Devuelve (casos_nuevos, completa).
+    prompt: el texto original o un PromptDividido (se conserva su prefijo).
+    """
+    instrucciones, solicitud = prompt if isinstance(prompt, PromptDividido) else ("", prompt)
+    nuevos = []
+    ids_vistos = {c.get("id_caso") for c in casos}
+    completa = False
+
+    for _ in range(max_continuaciones):
+        ultimo_id = (nuevos or casos)[-1].get("id_caso", f"CP-{len(casos) + len(nuevos):03d}")
+        prompt_continuacion = PromptDividido(instrucciones, PROMPT_CONTINUACION.format(
+            prompt=solicitud,
+            ultimo_id=ultimo_id,
+            siguiente_id=_siguiente_id(ultimo_id, len(casos) + len(nuevos) + 1),
+        ))
+        if limitador is not None:
+            limitador.adquirir(estimar_tokens(_texto_completo(prompt_continuacion)))
+        METRICAS.rescate.registrar_continuacion()
+
+        respuesta = _llamar_modelo(model, prompt_continuacion)
+        try:
+            with METRICAS.medir("parseo"):
+                recibidos, completa = parsear_respuesta_casos(respuesta.text, referencia=_referencia_hu(hu_texto))
+        except ValueError:
+            break
+        for caso in recibidos:
+            if caso.get("id_caso") not in ids_vistos:
+                ids_vistos.add(caso.get("id_caso"))
+                nuevos.append(caso)
+        if completa:
+            break
+
+    return nuevos, completa
+
+
+def generar_casos_prueba_stream(model, hu_texto: str, custom_prompt=None, cache=None, limitador=None,
+                                max_continuaciones=0):
+    """
+    Variante en streaming de generar_casos_prueba: consume la respuesta por
+    fragmentos y entrega cada caso (con pasos normalizados) apenas su objeto
+    JSON se cierra, sin esperar la respuesta completa.
+    """
+    prompt = dividir_prompt(hu_texto, custom_prompt)
+
+    clave = _clave_cache(model, cache, "".join(prompt), hu_texto)
+    if clave is not None:
+        casos = cache.obtener(clave)
+        if casos is not None:
+            yield from casos
+            return
+
+    if limitador is not None:
+        limitador.adquirir(estimar_tokens("".join(prompt)))
+
+    inicio = time.perf_counter()
+    respuesta = _llamar_modelo(model, prompt, stream=True)
+    parser = ParserArrayIncremental()
+    casos = []
+    uso = None
+
+    for fragmento in respuesta:
+        uso = getattr(fragmento, "usage_metadata", None) or uso
+        for caso in parser.alimentar(fragmento.text):
+            if not isinstance(caso, dict):
+                raise ValueError("El JSON devuelto no es una lista de casos.")
+            caso["pasos"] = normalizar_pasos(caso.get("pasos", ""))
+            if not casos:
+                METRICAS.observar("primer_caso", time.perf_counter() - inicio)
+            casos.append(caso)
+            yield caso
+
+    METRICAS.observar("stream_completo", time.perf_counter() - inicio)
+    METRICAS.registrar_uso(uso)
+
+    if not parser.iniciado:
+        raise ValueError("No se encontró JSON válido en la respuesta.")
+
+    completa = parser.terminado and not parser.descartados
+    if not completa:
+        # Respuesta cortada o con objetos mal formados: se rescata lo que quedó abierto
+        rescate = rescatar_casos("[" + parser.pendiente)
+        rescatados = rescate.casos
+        METRICAS.rescate.registrar_rescate(
+            rescate._replace(
+                casos=casos + rescatados,
+                descartados=[describir_descartado(d) for d in parser.descartados] + rescate.descartados,
+            ),
+            _referencia_hu(hu_texto),
+        )
+        if not parser.terminado and max_continuaciones and (casos or rescatados):
+            nuevos, _ = continuar_casos_truncados(model, prompt, casos + rescatados, hu_texto,
+                                                  limitador=limitador,
+                                                  max_continuaciones=max_continuaciones)
+            rescatados = rescatados + nuevos
+        for caso in rescatados:
+            caso["pasos"] = normalizar_pasos(caso.get("pasos", ""))
+            casos.append(caso)
+            yield caso
+        if not casos:
+            raise ValueError("No se pudo rescatar ningún caso de la respuesta.")
+
+    if clave is not None and completa:
+        cache.guardar(clave, casos)
 
 
 # ==============================
-# GUARDAR CSV
+# HUs GRANDES: DIVISIÓN POR CRITERIOS
 # ==============================
 
-def guardar_csv(casos, archivo_salida="casos_prueba_total.csv"):
-    campos = [
-        "archivo_hu", 
-        "criterio", 
-        "id_caso", 
-        "tipo_prueba",
-        "prioridad",
-        "Automatizar", 
-        "descripcion", 
-        "precondiciones", 
-        "pasos", 
-        "resultado_esperado"
+def generar_casos_hu_dividida(model, hu_texto: str, custom_prompt=None, cache=None, limitador=None,
+                              max_continuaciones=0, criterios_por_bloque=DEFAULT_CRITERIOS_POR_BLOQUE,
+                              umbral_division=DEFAULT_UMBRAL_DIVISION, max_workers=DEFAULT_WORKERS,
+                              hedging=None):
+    """
+    Genera casos para una HU grande partiéndola por criterios de aceptación.
+
+    Si la HU tiene más de umbral_division criterios, se arma una parte por cada
+    bloque de criterios_por_bloque (todas con la narrativa completa), las partes
+    se generan en paralelo y los casos se unen con id_caso renumerado
+    CP-001..CP-N. Si no, se comporta igual que generar_casos_prueba.
+    """
+    narrativa, criterios = dividir_hu(hu_texto)
+    if not criterios_por_bloque or len(criterios) <= umbral_division:
+        return generar_casos_prueba(model, hu_texto, custom_prompt=custom_prompt, cache=cache,
+                                    limitador=limitador, max_continuaciones=max_continuaciones,
+                                    hedging=hedging)
+
+    bloques = agrupar_criterios(criterios, criterios_por_bloque)
+    partes = [
+        construir_hu_parcial(narrativa, bloque, i, len(bloques))
+        for i, bloque in enumerate(bloques, start=1)
     ]
 
-    with open(archivo_salida, "w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(f, fieldnames=campos, delimiter=';')
-        writer.writeheader()
+    @METRICAS.propagar
+    def generar_parte(parte):
+        return generar_casos_prueba(model, parte, custom_prompt=custom_prompt, cache=cache,
+                                    limitador=limitador, max_continuaciones=max_continuaciones,
+                                    hedging=hedging)
+
+    METRICAS.incrementar("hus_divididas")
+    METRICAS.incrementar("bloques_generados", len(partes))
+    with ThreadPoolExecutor(max_workers=max(1, min(int(max_workers), len(partes)))) as executor:
+        futuros = [executor.submit(generar_parte, parte) for parte in partes]
+        # Se espera a todas las partes; si alguna falla, falla la HU completa
+        resultados = [futuro.result() for futuro in futuros]
+
+    casos = [caso for resultado in resultados for caso in resultado]
+    return renumerar_casos(casos)
+
+
+# ==============================
+# COBERTURA: CRITERIOS SIN CASOS
+# ==============================
+
+def _numero_caso(id_caso):
+    digitos = "".join(ch for ch in str(id_caso) if ch.isdigit())
+    return int(digitos) if digitos else 0
+
+
+def completar_cobertura(model, hu_texto: str, casos, custom_prompt=None, cache=None, limitador=None,
+                        criterios_por_bloque=DEFAULT_CRITERIOS_POR_BLOQUE, hedging=None):
+    """
+    Pide casos solo para los criterios de aceptación que no quedaron cubiertos
+    por `casos`, en vez de regenerar la HU completa.
+
+    Devuelve los casos nuevos con id_caso a continuación del último existente.
+    Si la HU no tiene criterios reconocibles o todos están cubiertos, no hace
+    ninguna solicitud.
+    """
+    faltantes = calcular_cobertura(hu_texto, casos).sin_cubrir()
+    if not faltantes:
+        return []
+
+    narrativa, criterios = dividir_hu(hu_texto)
+    METRICAS.incrementar("criterios_sin_cubrir", len(faltantes))
+    ultimo = max((_numero_caso(c.get("id_caso", "")) for c in casos), default=0)
+
+    nuevos = []
+    for bloque in agrupar_criterios([criterios[i] for i in faltantes], criterios_por_bloque):
+        parte = construir_hu_faltantes(narrativa, bloque, f"CP-{ultimo + len(nuevos) + 1:03d}")
+        METRICAS.incrementar("solicitudes_cobertura")
+        nuevos.extend(generar_casos_prueba(model, parte, custom_prompt=custom_prompt, cache=cache,
+                                           limitador=limitador, hedging=hedging))
+
+    # La numeración se fuerza aunque el modelo no haya respetado el inicio pedido
+    for numero, caso in enumerate(nuevos, start=ultimo + 1):
+        caso["id_caso"] = f"CP-{numero:03d}"
+    METRICAS.incrementar("casos_cobertura", len(nuevos))
+    return nuevos
+
+
+# ==============================
+# HUs PEQUEÑAS: EMPAQUETADO
+# ==============================
+
+def generar_casos_paquete(model, hus, custom_prompt=None, cache=None, limitador=None):
+    """
+    Genera casos para varias HUs pequeñas con UNA sola solicitud.
+
+    hus: lista de (nombre, texto). Devuelve una lista paralela con los casos
+    de cada HU (id_caso numerado desde CP-001 por HU), o None en las HUs cuya
+    parte de la respuesta no se pudo atribuir: esas deben pedirse por separado.
+    Los resultados se guardan en caché con la misma clave que una solicitud
+    individual, así que luego se reutilizan desde cualquier camino.
+    """
+    resultados = [None] * len(hus)
+    claves = [None] * len(hus)
+    faltantes = []
+
+    for i, (_, texto) in enumerate(hus):
+        claves[i] = _clave_cache(model, cache, construir_prompt(texto, custom_prompt), texto)
+        if claves[i] is not None:
+            casos = cache.obtener(claves[i])
+            if casos is not None:
+                resultados[i] = casos
+                continue
+        faltantes.append(i)
+
+    if len(faltantes) < 2:
+        return resultados
+
+    paquete = [(i, hus[i][0], hus[i][1]) for i in faltantes]
+    instrucciones, solicitud = dividir_prompt(construir_texto_paquete(paquete), custom_prompt)
+    prompt = PromptDividido(instrucciones, solicitud + INSTRUCCIONES_EMPAQUETADO)
+
+    if limitador is not None:
+        limitador.adquirir(estimar_tokens("".join(prompt)))
+
+    METRICAS.incrementar("solicitudes_empaquetadas")
+    respuesta = _llamar_modelo(model, prompt)
+    with METRICAS.medir("parseo"):
+        repartidos = repartir_respuesta_paquete(respuesta.text, len(paquete))
+    METRICAS.incrementar("hus_empaquetadas", len(repartidos))
+
+    for posicion, i in enumerate(faltantes, start=1):
+        casos = repartidos.get(posicion)
+        if casos is None:
+            continue
         for caso in casos:
-            fila = {campo: caso.get(campo, "") for campo in campos}
-            writer.writerow(fila)
+            caso["pasos"] = normalizar_pasos(caso.get("pasos", ""))
+        resultados[i] = renumerar_casos(casos)
+        if claves[i] is not None:
+            cache.guardar(claves[i], casos)
+
+    return resultados
+
+
+# ==============================
+# GENERACIÓN CONCURRENTE
+# ==============================
+
+ResultadoHU = namedtuple("ResultadoHU", ["nombre", "casos", "error"])
+
+
+class LimitadorTasa:
+    """
+    Limita solicitudes y tokens por minuto con una ventana deslizante de 60 s.
+    Es seguro entre hilos: cada worker llama a adquirir() antes de usar el modelo.
+    """
+
+    VENTANA = 60.0
+
+    def __init__(self, solicitudes_por_minuto=None, tokens_por_minuto=None,
+                 reloj=time.monotonic, dormir=time.sleep):
+        self.solicitudes_por_minuto = solicitudes_por_minuto
+        self.tokens_por_minuto = tokens_por_minuto
+        self._reloj = reloj
+        self._dormir = dormir
+        self._registro = deque()  # (instante, tokens)
+        self._tokens_en_ventana = 0
+        self._lock = threading.Lock()
+
+    def _purgar(self, ahora):
+        while self._registro and ahora - self._registro[0][0] >= self.VENTANA:
+            _, tokens = self._registro.popleft()
+            self._tokens_en_ventana -= tokens
+
+    def _espera_necesaria(self, ahora, tokens):
+        espera = 0.0
+        if self.solicitudes_por_minuto and len(self._registro) >= self.solicitudes_por_minuto:
+            indice = len(self._registro) - self.solicitudes_por_minuto
+            espera = max(espera, self._registro[indice][0] + self.VENTANA - ahora)
+        if self.tokens_por_minuto and self._registro:
+            exceso = self._tokens_en_ventana + tokens - self.tokens_por_minuto
+            for instante, usados in self._registro:
+                if exceso <= 0:
+                    break
+                exceso -= usados
+                espera = max(espera, instante + self.VENTANA - ahora)
+        return espera
+
+    def adquirir(self, tokens=0):
+        """Bloquea hasta que la solicitud (y sus tokens) caben en la ventana."""
+        if not self.solicitudes_por_minuto and not self.tokens_por_minuto:
+            return
+        while True:
+            with self._lock:
+                ahora = self._reloj()
+                self._purgar(ahora)
+                espera = self._espera_necesaria(ahora, tokens)
+                if espera <= 0:
+                    self._registro.append((ahora, tokens))
+                    self._tokens_en_ventana += tokens
+                    return
+            self._dormir(espera)
+
+
+def generar_casos_lote(model, hus, custom_prompt=None, max_workers=DEFAULT_WORKERS,
+                       limitador=None, al_completar=None, cache=None, al_caso=None,
+                       max_continuaciones=0, criterios_por_bloque=DEFAULT_CRITERIOS_POR_BLOQUE,
+                       max_hus_por_paquete=0, presupuesto_paquete=DEFAULT_PRESUPUESTO_PAQUETE,
+                       hedging=None, completar_criterios=False):
+    """
+    Genera casos para varias HUs en paralelo con un pool de hilos.
+
+    hus: iterable de (nombre, texto); se consume de forma perezosa.
+    Produce ResultadoHU en el MISMO orden de entrada. Un error en una HU queda
+    en ResultadoHU.error y no afecta a las demás. al_completar(resultado) se
+    invoca en el hilo llamador a medida que cada HU termina (útil para barras
+    de progreso de Streamlit).
+
+    Si se pasa al_caso(nombre, caso), las respuestas se consumen en streaming
+    y los casos de cada HU se entregan en el hilo llamador apenas esa HU
+    termina bien, sin esperar a las anteriores. Los casos de una HU que falla
+    (p. ej. el stream se corta a la mitad) no se entregan.
+
+    Las HUs con muchos criterios de aceptación se parten en bloques de
+    criterios_por_bloque que se generan en paralelo (0 = no dividir).
+
+    Con max_hus_por_paquete > 1, las HUs pequeñas consecutivas se agrupan
+    (hasta presupuesto_paquete tokens) en una sola solicitud; si una parte de
+    la respuesta no se puede atribuir, esa HU se pide por separado.
+
+    hedging (ControlHedging) duplica las solicitudes más lentas; no aplica
+    en streaming ni a las solicitudes empaquetadas.
+
+    Con completar_criterios, los criterios de aceptación que quedaron sin
+    casos se piden con una solicitud dirigida y sus casos se agregan a la HU.
+    """
+    max_workers = max(1, int(max_workers))
+    ventana = max_workers * 2
+    eventos = queue.Queue()
+
+    def procesar_hu(nombre, texto):
+        dividir = criterios_por_bloque and len(dividir_hu(texto)[1]) > DEFAULT_UMBRAL_DIVISION
+        if al_caso is None or dividir:
+            casos = generar_casos_hu_dividida(model, texto, custom_prompt=custom_prompt,
+                                              cache=cache, limitador=limitador,
+                                              max_continuaciones=max_continuaciones,
+                                              criterios_por_bloque=criterios_por_bloque,
+                                              max_workers=max_workers, hedging=hedging)
+            return asignar_casos(nombre, casos + cubrir_faltantes(texto, casos))
+
+        # Se acumulan hasta que la HU termina: si el stream falla, sus casos no llegan a al_caso
+        casos = list(generar_casos_prueba_stream(model, texto, custom_prompt=custom_prompt,
+                                                 cache=cache, limitador=limitador,
+                                                 max_continuaciones=max_continuaciones))
+        return asignar_casos(nombre, casos + cubrir_faltantes(texto, casos))
+
+    def cubrir_faltantes(texto, casos):
+        if not completar_criterios:
+            return []
+        try:
+            return completar_cobertura(model, texto, casos, custom_prompt=custom_prompt, cache=cache,
+                                       limitador=limitador,
+                                       criterios_por_bloque=criterios_por_bloque or DEFAULT_CRITERIOS_POR_BLOQUE,
+                                       hedging=hedging)
+        except Exception:
+            # Completar es un extra: si falla, la HU se queda con los casos que ya tiene
+            METRICAS.incrementar("errores_cobertura")
+            return []
+
+    def asignar_casos(nombre, casos):
+        for c in casos:
+            c["archivo_hu"] = nombre
+            if al_caso is not None:
+                eventos.put((nombre, c))
+        return casos
+
+    def resultado_hu(nombre, texto):
+        try:
+            with METRICAS.hu(nombre):
+                return ResultadoHU(nombre, procesar_hu(nombre, texto), None)
+        except Exception as e:
+            return ResultadoHU(nombre, [], e)
+
+    def procesar_unidad(unidad):
+        """unidad: lista de (indice, nombre, texto). Devuelve [(indice, ResultadoHU)]."""
+        if len(unidad) == 1:
+            indice, nombre, texto = unidad[0]
+            return [(indice, resultado_hu(nombre, texto))]
+
+        try:
+            repartidos = generar_casos_paquete(model, [(n, t) for _, n, t in unidad],
+                                               custom_prompt=custom_prompt, cache=cache,
+                                               limitador=limitador)
+        except Exception:
+            # Si falla la solicitud empaquetada, cada HU se pide por separado
+            repartidos = [None] * len(unidad)
+
+        salida = []
+        for (indice, nombre, texto), casos in zip(unidad, repartidos):
+            if casos is None:
+                salida.append((indice, resultado_hu(nombre, texto)))
+            else:
+                METRICAS.incrementar("hus_ok")
+                casos = casos + cubrir_faltantes(texto, casos)
+                salida.append((indice, ResultadoHU(nombre, asignar_casos(nombre, casos), None)))
+        return salida
+
+    def entregar_casos():
+        while True:
+            try:
+                nombre, caso = eventos.get_nowait()
+            except queue.Empty:
+                return
+            al_caso(nombre, caso)
+
+    indexadas = ((i, nombre, texto) for i, (nombre, texto) in enumerate(hus))
+    if max_hus_por_paquete and max_hus_por_paquete > 1:
+        unidades = agrupar_hus(indexadas, estimar_tokens, presupuesto_paquete, max_hus_por_paquete)
+    else:
+        unidades = ([elemento] for elemento in indexadas)
+
+    pendientes = {}  # future -> cantidad de HUs de la unidad
+    listos = {}      # indice -> ResultadoHU
+    siguiente = 0
+    agotado = False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            while not agotado and len(pendientes) + len(listos) < ventana:
+                try:
+                    unidad = next(unidades)
+                except StopIteration:
+                    agotado = True
+                    break
+                pendientes[executor.submit(METRICAS.propagar(procesar_unidad), unidad)] = len(unidad)
+
+            if not pendientes:
+                break
+
+            if al_caso is None:
+                hechos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            else:
+                hechos, _ = wait(pendientes, timeout=0.05, return_when=FIRST_COMPLETED)
+                # Los casos de una HU terminada ya están en la cola: se entregan antes que su resultado
+                entregar_casos()
+            for futuro in hechos:
+                del pendientes[futuro]
+                for indice, resultado in futuro.result():
+                    listos[indice] = resultado
+                    if al_completar:
+                        al_completar(resultado)
+
+            while siguiente in listos:
+                yield listos.pop(siguiente)
+                siguiente += 1
+
+
+# ==============================
+# GUARDAR CSV
+# ==============================
+
+CAMPOS_CSV = [
+    "archivo_hu", 
+    "criterio", 
+    "id_caso", 
+    "tipo_prueba",
+    "prioridad",
+    "Automatizar", 
+    "descripcion", 
+    "precondiciones", 
+    "pasos", 
+    "resultado_esperado"
+]
+
+
+class EscritorCasos:
+    """
+    Escritor incremental de casos: agrega cada HU al archivo apenas se genera,
+    sin acumular el lote en memoria.
+
+    formato "csv" mantiene el layout de siempre (delimitador ';', utf-8-sig);
+    "jsonl" escribe un caso por línea. Si no se indica, se deduce de la extensión.
+    archivo_salida puede ser una ruta o un stream de texto ya abierto.
+    """
+
+    def __init__(self, archivo_salida, formato=None, campos=CAMPOS_CSV):
+        if formato is None:
+            nombre = str(getattr(archivo_salida, "name", archivo_salida))
+            formato = "jsonl" if nombre.lower().endswith(".jsonl") else "csv"
+        if formato not in ("csv", "jsonl"):
+            raise ValueError(f"Formato de salida no soportado: {formato}")
+
+        self.formato = formato
+        self.campos = campos
+        self.total = 0
+
+        if hasattr(archivo_salida, "write"):
+            self._archivo = archivo_salida
+            self._propio = False
+        else:
+            encoding = "utf-8-sig" if formato == "csv" else "utf-8"
+            self._archivo = open(archivo_salida, "w", newline="", encoding=encoding)
+            self._propio = True
+
+        if formato == "csv":
+            self._writer = csv.DictWriter(self._archivo, fieldnames=campos, delimiter=';')
+            self._writer.writeheader()
+            self._archivo.flush()
+
+    def escribir(self, casos):
+        """Agrega los casos de una HU y hace flush para que queden visibles."""
+        for caso in casos:
+            fila = {campo: caso.get(campo, "") for campo in self.campos}
+            if self.formato == "csv":
+                self._writer.writerow(fila)
+            else:
+                self._archivo.write(json.dumps(fila, ensure_ascii=False) + "\n")
+            self.total += 1
+        self._archivo.flush()
+
+    def cerrar(self):
+        if self._propio and not self._archivo.closed:
+            self._archivo.flush()
+            os.fsync(self._archivo.fileno())
+            self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+def guardar_csv(casos, archivo_salida="casos_prueba_total.csv", formato=None):
+    with EscritorCasos(archivo_salida, formato=formato) as escritor:
+        escritor.escribir(casos)
 
     print(f"✅ Archivo generado: {archivo_salida}")
 
@@ -234,42 +978,305 @@ def guardar_csv(casos, archivo_salida="casos_prueba_total.csv"):
 # PROGRAMA PRINCIPAL (para consola)
 # ==============================
 
-if __name__ == "__main__":
-    carpeta_hus = "HUs"
-    archivo_salida = "casos_prueba_total.csv"
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Genera casos de prueba a partir de HUs.")
+    parser.add_argument("--carpeta", default="HUs", help="Carpeta con las HUs (.txt).")
+    parser.add_argument("--salida", default="casos_prueba_total.csv",
+                        help="Archivo de salida (.csv o .jsonl).")
+    parser.add_argument("--formato", choices=["csv", "jsonl"], default=None,
+                        help="Formato de salida; por defecto se deduce de la extensión.")
+    parser.add_argument("--backend", choices=BACKENDS, default=BACKEND_SDK,
+                        help="sdk (google-generativeai), rest (HTTP con pool de conexiones) "
+                             "o local (respuestas grabadas/enlatadas, sin red).")
+    parser.add_argument("--grabacion", default=None,
+                        help="Con --backend local: JSONL de respuestas grabadas a reproducir.")
+    parser.add_argument("--grabar", default=None,
+                        help="Guardar cada respuesta del modelo en este JSONL (para reproducirla offline).")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Con --backend rest: timeout de lectura en segundos.")
+    parser.add_argument("--cachear-prefijo", action="store_true",
+                        help="Con --backend rest: subir las instrucciones fijas una vez como cachedContent. "
+                             f"Solo aplica a prefijos de al menos {DEFAULT_MIN_TOKENS_PREFIJO} tokens "
+                             "(~4 caracteres por token, también el mínimo de la caché implícita del "
+                             "proveedor); el prefijo del prompt por defecto (~760) no llega y se envía como "
+                             "instrucción de sistema, sin caché.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="HUs procesadas en paralelo.")
+    parser.add_argument("--rpm", type=int, default=None,
+                        help="Máximo de solicitudes por minuto al modelo.")
+    parser.add_argument("--tpm", type=int, default=None,
+                        help="Máximo de tokens de prompt por minuto al modelo.")
+    parser.add_argument("--cache", default=DEFAULT_RUTA_CACHE,
+                        help="Archivo SQLite con la caché de respuestas.")
+    parser.add_argument("--sin-cache", action="store_true",
+                        help="No leer ni escribir la caché de respuestas.")
+    parser.add_argument("--refrescar-cache", action="store_true",
+                        help="Ignorar la caché y regenerar, guardando las respuestas nuevas.")
+    parser.add_argument("--manifiesto", default=DEFAULT_RUTA_MANIFIESTO,
+                        help="Manifiesto de la corrida (permite reanudar corridas interrumpidas).")
+    parser.add_argument("--reiniciar", action="store_true",
+                        help="Reprocesar todas las HUs aunque el manifiesto indique que ya terminaron.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Consumir las respuestas en streaming y escribir los casos de cada HU apenas "
+                             "termina bien (el archivo queda en orden de llegada).")
+    parser.add_argument("--continuaciones", type=int, default=0,
+                        help="Si una respuesta llega cortada, solicitudes 'continúa desde CP-0NN' "
+                             "permitidas por HU (0 = solo rescatar los casos completos).")
+    parser.add_argument("--criterios-por-bloque", type=int, default=DEFAULT_CRITERIOS_POR_BLOQUE,
+                        help=f"HUs con más de {DEFAULT_UMBRAL_DIVISION} criterios se generan en bloques "
+                             f"paralelos de este tamaño (0 = no dividir).")
+    parser.add_argument("--empaquetar", type=int, default=0, metavar="N",
+                        help="Agrupar hasta N HUs pequeñas por solicitud (0 = una solicitud por HU).")
+    parser.add_argument("--presupuesto-paquete", type=int, default=DEFAULT_PRESUPUESTO_PAQUETE,
+                        help="Máximo de tokens de HU por paquete.")
+    parser.add_argument("--metricas-json", default=DEFAULT_RUTA_RESUMEN,
+                        help="Resumen de la corrida (tiempos, tokens, contadores) en JSON.")
+    parser.add_argument("--metricas-prom", default=DEFAULT_RUTA_PROMETHEUS,
+                        help="Métricas en formato de texto de Prometheus.")
+    parser.add_argument("--reintentos", type=int, default=DEFAULT_MAX_INTENTOS,
+                        help="Intentos por solicitud ante errores 429/5xx (1 = sin reintentos).")
+    parser.add_argument("--pausa-circuito", type=float, default=30.0,
+                        help="Segundos de pausa del lote cuando el modelo falla repetidamente.")
+    parser.add_argument("--hedging-percentil", type=float, default=0,
+                        help="Duplicar solicitudes que superen este percentil de latencia (0 = desactivado).")
+    parser.add_argument("--hedging-tasa", type=float, default=DEFAULT_TASA_MAXIMA_HEDGING,
+                        help="Fracción máxima de solicitudes que pueden duplicarse.")
+    parser.add_argument("--completar-criterios", action="store_true",
+                        help="Pedir casos solo para los criterios de aceptación que quedaron sin cubrir.")
+    parser.add_argument("--cobertura", default=None,
+                        help="Guardar la matriz de cobertura (criterio -> casos) en este CSV.")
+    parser.add_argument("--duplicados", choices=MODOS_DEDUPLICACION, default=None,
+                        help="Al terminar, marcar o fusionar los casos casi duplicados de la salida.")
+    parser.add_argument("--umbral-duplicados", type=float, default=DEFAULT_UMBRAL_DUPLICADOS,
+                        help="Similitud mínima para considerar dos casos duplicados.")
+    parser.add_argument("--almacen", default=DEFAULT_RUTA_ALMACEN,
+                        help="Histórico SQLite donde se agregan los casos de cada corrida "
+                             "(consultable con almacen_resultados.py).")
+    parser.add_argument("--sin-almacen", action="store_true",
+                        help="No agregar esta corrida al histórico.")
+    parser.add_argument("--nombre-corrida", default=None,
+                        help="Nombre de la corrida en el histórico (p. ej. el sprint); por defecto, la salida.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    carpeta_hus = args.carpeta
+    archivo_salida = args.salida
 
     print("📄 Leyendo HUs...")
-    hu_archivos = leer_archivos_hu(carpeta_hus)
+    # Generador: las HUs se leen a medida que el pool de generación las pide
+    hu_archivos = leer_hus(carpeta_hus)
 
     API_KEY = os.getenv("GEMINI_API_KEY")  # Cargar desde variable de entorno
     
-    if not API_KEY:
+    if not API_KEY and args.backend != BACKEND_LOCAL:
         print("❌ No se encontró GEMINI_API_KEY en las variables de entorno")
         print("💡 Crea un archivo .env con: GEMINI_API_KEY=tu_api_key")
-        exit(1)
+        return 1
+
+    opciones_backend = {}
+    if args.backend == BACKEND_LOCAL and args.grabacion:
+        opciones_backend["grabacion"] = args.grabacion
+    if args.backend == BACKEND_REST and args.timeout:
+        opciones_backend["timeout_lectura"] = args.timeout
+    if args.backend == BACKEND_REST and args.cachear_prefijo:
+        opciones_backend["cachear_prefijos"] = True
 
     try:
-        model = setup_gemini(API_KEY)
-        print(f"✅ Modelo configurado: {DEFAULT_MODEL_NAME}")
+        model = setup_gemini(API_KEY, backend=args.backend, grabar=args.grabar, **opciones_backend)
+        print(f"✅ Modelo configurado: {DEFAULT_MODEL_NAME} (backend {args.backend})")
     except Exception as e:
         print(f"❌ Error: {e}")
-        exit(1)
+        return 1
 
-    todos_los_casos = []
+    try:
+        return _ejecutar_corrida(args, model, hu_archivos)
+    finally:
+        # Borra los cachedContent de --cachear-prefijo y cierra el pool HTTP
+        cerrar_modelo(model)
 
-    for nombre_archivo, contenido in hu_archivos:
-        print(f"➡ Procesando HU: {nombre_archivo}...")
-        try:
-            casos = generar_casos_prueba(model, contenido)
-            for c in casos:
-                c["archivo_hu"] = nombre_archivo
-            todos_los_casos.extend(casos)
-            print(f"   ✔ {len(casos)} casos generados")
-        except Exception as e:
-            print(f"   ❌ Error: {e}")
 
-    if todos_los_casos:
-        guardar_csv(todos_los_casos, archivo_salida)
+def _ejecutar_corrida(args, model, hu_archivos):
+    """La corrida de consola, con el modelo ya configurado."""
+    archivo_salida = args.salida
+
+    hedging = None
+    if args.hedging_percentil:
+        hedging = ControlHedging(percentil=args.hedging_percentil, tasa_maxima=args.hedging_tasa)
+
+    # Reintentos con backoff, concurrencia AIMD y circuit breaker alrededor del modelo
+    model = ModeloResiliente(
+        model,
+        politica=PoliticaReintentos(max_intentos=args.reintentos),
+        concurrencia=ConcurrenciaAdaptativa(inicial=args.workers, maximo=args.workers),
+        interruptor=InterruptorCircuito(pausa=args.pausa_circuito),
+        hedging=hedging,
+    )
+
+    limitador = LimitadorTasa(args.rpm, args.tpm)
+    cache = CacheRespuestas(args.cache, habilitada=not args.sin_cache,
+                            refrescar=args.refrescar_cache)
+
+    manifiesto = ManifiestoEjecucion(args.manifiesto)
+    escritor = EscritorCasos(archivo_salida, formato=args.formato)
+
+    # Histórico de todas las corridas: recibe lo mismo que el archivo de salida, HU por HU
+    almacen = corrida = None
+    if not args.sin_almacen:
+        almacen = AlmacenResultados(args.almacen)
+        corrida = almacen.iniciar_corrida(ORIGEN_CONSOLA, nombre=args.nombre_corrida or archivo_salida,
+                                          modelo=DEFAULT_MODEL_NAME)
+
+    def archivar(casos):
+        if almacen is not None:
+            with METRICAS.medir("almacen"):
+                almacen.agregar(corrida, casos)
+
+    # Matriz de cobertura por HU (criterio -> casos), también incremental
+    archivo_cobertura = None
+    criterios_totales = criterios_cubiertos = 0
+    if args.cobertura:
+        archivo_cobertura = open(args.cobertura, "w", newline="", encoding="utf-8-sig")
+        escritor_cobertura = csv.DictWriter(archivo_cobertura, fieldnames=CAMPOS_COBERTURA, delimiter=';')
+        escritor_cobertura.writeheader()
+
+    def registrar_cobertura(nombre, texto, casos):
+        nonlocal criterios_totales, criterios_cubiertos
+        if archivo_cobertura is None:
+            return
+        matriz = calcular_cobertura(texto, casos)
+        criterios_totales += len(matriz.criterios)
+        criterios_cubiertos += matriz.cubiertos()
+        escritor_cobertura.writerows(matriz.filas(nombre))
+
+    # Hash y texto solo de las HUs en vuelo: la memoria no crece con la carpeta
+    en_vuelo = {}
+    leidas = omitidas = 0
+
+    def filtrar_pendientes():
+        """Reanudación: solo se procesan HUs nuevas, modificadas o que fallaron."""
+        nonlocal leidas, omitidas
+        for nombre, contenido in hu_archivos:
+            leidas += 1
+            hash_hu = hash_contenido(contenido)
+            if args.reiniciar or manifiesto.necesita_procesar(nombre, hash_hu):
+                en_vuelo[nombre] = (hash_hu, contenido)
+                yield nombre, contenido
+            else:
+                # Las HUs ya resueltas se vuelcan desde su checkpoint
+                omitidas += 1
+                casos_guardados = manifiesto.casos_guardados(nombre)
+                escritor.escribir(casos_guardados)
+                archivar(casos_guardados)
+                registrar_cobertura(nombre, contenido, casos_guardados)
+
+    def informar(resultado):
+        # Checkpoint inmediato de cada HU terminada
+        hash_hu, contenido = en_vuelo.pop(resultado.nombre)
+        if resultado.error:
+            manifiesto.registrar_error(resultado.nombre, hash_hu, resultado.error)
+            print(f"   ❌ {resultado.nombre}: Error: {resultado.error}")
+        else:
+            manifiesto.registrar_exito(resultado.nombre, hash_hu, resultado.casos)
+            registrar_cobertura(resultado.nombre, contenido, resultado.casos)
+            print(f"   ✔ {resultado.nombre}: {len(resultado.casos)} casos generados")
+
+    def escribir_caso(nombre, caso):
+        with METRICAS.medir("escritura"):
+            escritor.escribir([caso])
+
+    print(f"➡ Procesando HUs con {args.workers} workers...")
+    fallidas = 0
+    try:
+        for resultado in generar_casos_lote(model, filtrar_pendientes(), max_workers=args.workers,
+                                            limitador=limitador, al_completar=informar, cache=cache,
+                                            al_caso=escribir_caso if args.stream else None,
+                                            max_continuaciones=args.continuaciones,
+                                            criterios_por_bloque=args.criterios_por_bloque,
+                                            max_hus_por_paquete=args.empaquetar,
+                                            presupuesto_paquete=args.presupuesto_paquete,
+                                            hedging=hedging,
+                                            completar_criterios=args.completar_criterios):
+            if resultado.error:
+                fallidas += 1
+                continue
+            if not args.stream:
+                with METRICAS.medir("escritura"):
+                    escritor.escribir(resultado.casos)
+            # En el mismo orden que el archivo (en streaming, por HU en orden de entrada)
+            archivar(resultado.casos)
+    finally:
+        escritor.cerrar()
+        if archivo_cobertura is not None:
+            archivo_cobertura.close()
+
+    if not leidas:
+        print("⚠ No se encontraron HUs (.txt, .md, .jsonl) en la carpeta.")
+    if omitidas:
+        print(f"⏭ {omitidas} de {leidas} HUs sin cambios ya procesadas en una corrida anterior")
+
+    total_casos = escritor.total
+    if args.duplicados and escritor.total:
+        with METRICAS.medir("deduplicacion"):
+            _, duplicados = deduplicar_archivo(archivo_salida, modo=args.duplicados,
+                                               umbral=args.umbral_duplicados)
+        if args.duplicados == MODO_FUSIONAR:
+            total_casos -= duplicados
+            if almacen is not None and duplicados:
+                # El histórico queda igual que el archivo final
+                almacen.reemplazar(corrida, leer_casos(archivo_salida)[0])
+        accion = "fusionados" if args.duplicados == MODO_FUSIONAR else "marcados"
+        print(f"🧹 Duplicados: {duplicados} de {escritor.total} casos {accion}")
+
+    if cache.habilitada:
+        stats = cache.estadisticas()
+        print(f"🗃 Caché: {stats['hits']} aciertos, {stats['misses']} fallos")
+    rescate = METRICAS.rescate.como_dict()
+    if rescate["respuestas_rotas"]:
+        print(f"🩹 Rescate: {rescate['respuestas_rescatadas']}/{rescate['respuestas_rotas']} respuestas rotas "
+              f"recuperadas, {rescate['casos_descartados']} casos descartados, "
+              f"{rescate['solicitudes_continuacion']} solicitudes de continuación")
+        for descartado in rescate["detalle_descartados"]:
+            print(f"   ✂ {descartado['hu']}: {descartado['caso']}")
+    if fallidas:
+        print(f"⚠ {fallidas} HUs fallaron; vuelve a ejecutar para reintentar solo esas.")
+    contadores = METRICAS.resumen()["contadores"]
+    if args.completar_criterios and contadores.get("criterios_sin_cubrir"):
+        print(f"📐 Cobertura: {contadores['criterios_sin_cubrir']} criterios sin cubrir → "
+              f"{contadores.get('casos_cobertura', 0)} casos agregados con "
+              f"{contadores.get('solicitudes_cobertura', 0)} solicitudes dirigidas")
+    if almacen is not None:
+        almacen.terminar_corrida(corrida)
+        almacen.cerrar()
+        print(f"🗄 Histórico: corrida #{corrida} agregada a {args.almacen}")
+    if archivo_cobertura is not None:
+        print(f"📐 Matriz de cobertura: {criterios_cubiertos}/{criterios_totales} criterios con casos → {args.cobertura}")
+
+    extra = {"rescate": rescate}
+    if hedging is not None:
+        extra["hedging"] = hedging.como_dict()
+        print(f"🏇 Hedging: {extra['hedging']['hedges_enviados']} duplicadas, "
+              f"{extra['hedging']['hedges_ganados']} ganadas, "
+              f"{extra['hedging']['hedges_suspendidos']} evitadas con el servicio saturado")
+    if cache.habilitada:
+        extra["cache"] = cache.estadisticas()
+    METRICAS.exportar(args.metricas_json, args.metricas_prom, extra=extra)
+    resumen = METRICAS.resumen()
+    modelo = resumen["etapas"].get("modelo", {})
+    print(f"📈 {resumen['contadores'].get('solicitudes_modelo', 0)} solicitudes al modelo, "
+          f"p50 {modelo.get('p50_s', 0)} s / p95 {modelo.get('p95_s', 0)} s, "
+          f"{resumen['tokens'].get('prompt', 0)} tokens de prompt "
+          f"({resumen['tokens'].get('prompt_cacheado', 0)} desde caché de prefijo), "
+          f"{resumen['tokens'].get('respuesta', 0)} de respuesta → {args.metricas_json}")
+
+    if escritor.total:
+        print(f"✅ Archivo generado: {archivo_salida} ({total_casos} casos)")
         print("🎉 Proceso completado.")
     else:
-        print("⚠ No se generaron casos de prueba.")
\ No newline at end of file
+        print("⚠ No se generaron casos de prueba.")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,264 @@
+import csv
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+
+from caso_prueba import CAMPOS_CASO, CAMPOS_CATEGORICOS, normalizar_categoria
+
+# ==============================
+# HISTÓRICO DE RESULTADOS (todas las corridas en una sola base)
+# ==============================
+# Uso:
+#   python almacen_resultados.py corridas
+#   python almacen_resultados.py consultar --tipo Negative --prioridad Alta --automatizar si \
+#       --ultimas 20 --salida negativos_alta.csv
+
+DEFAULT_RUTA_ALMACEN = "resultados_casos.sqlite"
+
+ORIGEN_CONSOLA = "consola"
+ORIGEN_APP = "app"
+
+_TAMANO_LECTURA = 1000
+
+
+class AlmacenResultados:
+    """
+    Tabla única (SQLite) con los casos de todas las corridas, de la consola y
+    de la app, para consultar el histórico sin juntar CSVs.
+
+    Cada corrida se registra en `corridas` y sus casos se agregan HU por HU.
+    Los campos categóricos se guardan normalizados (Alta/Media/Baja, si/no,
+    Functional...) y tienen índices propios, igual que archivo_hu y la
+    corrida, así un filtro por esos campos no recorre toda la tabla.
+    """
+
+    def __init__(self, ruta=DEFAULT_RUTA_ALMACEN):
+        self.ruta = str(ruta)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.ruta, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS corridas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nombre TEXT,
+                origen TEXT NOT NULL,
+                modelo TEXT,
+                inicio REAL NOT NULL,
+                fin REAL,
+                casos INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS casos (
+                corrida INTEGER NOT NULL REFERENCES corridas (id),
+                {", ".join(f'"{campo}" TEXT NOT NULL DEFAULT ' + "''" for campo in CAMPOS_CASO)}
+            );
+            CREATE INDEX IF NOT EXISTS idx_casos_corrida ON casos (corrida);
+            CREATE INDEX IF NOT EXISTS idx_casos_hu ON casos (archivo_hu, corrida);
+            CREATE INDEX IF NOT EXISTS idx_casos_tipo ON casos (tipo_prueba, prioridad, Automatizar);
+            CREATE INDEX IF NOT EXISTS idx_casos_prioridad ON casos (prioridad, Automatizar);
+            CREATE INDEX IF NOT EXISTS idx_casos_automatizar ON casos (Automatizar);
+            """
+        )
+        self._conn.commit()
+
+    def cerrar(self):
+        with self._lock:
+            # Actualiza las estadísticas que usa el planificador para elegir índice
+            self._conn.execute("PRAGMA optimize")
+            self._conn.close()
+
+    # --- Escritura ---
+
+    def iniciar_corrida(self, origen, nombre=None, modelo=None):
+        """Registra una corrida nueva y devuelve su id."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO corridas (nombre, origen, modelo, inicio) VALUES (?, ?, ?, ?)",
+                (nombre, origen, modelo, time.time()),
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def agregar(self, corrida, casos):
+        """Agrega los casos (dicts o CasoPrueba) de una HU a la corrida."""
+        filas = [(corrida,) + _fila(caso) for caso in casos]
+        if not filas:
+            return
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO casos (corrida, {_COLUMNAS}) VALUES ({', '.join('?' * (len(CAMPOS_CASO) + 1))})",
+                filas,
+            )
+            self._conn.execute("UPDATE corridas SET casos = casos + ? WHERE id = ?", (len(filas), corrida))
+            self._conn.commit()
+
+    def reemplazar(self, corrida, casos):
+        """Sustituye los casos de la corrida (p. ej. después de fusionar duplicados)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM casos WHERE corrida = ?", (corrida,))
+            self._conn.execute("UPDATE corridas SET casos = 0 WHERE id = ?", (corrida,))
+            self._conn.commit()
+        self.agregar(corrida, casos)
+
+    def terminar_corrida(self, corrida):
+        with self._lock:
+            self._conn.execute("UPDATE corridas SET fin = ? WHERE id = ?", (time.time(), corrida))
+            self._conn.commit()
+
+    # --- Consultas ---
+
+    def corridas(self, limite=20):
+        """Las últimas corridas, de la más reciente a la más antigua."""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT id, nombre, origen, modelo, inicio, fin, casos FROM corridas ORDER BY id DESC LIMIT ?",
+                (limite,),
+            ).fetchall()
+        campos = ("id", "nombre", "origen", "modelo", "inicio", "fin", "casos")
+        return [dict(zip(campos, fila)) for fila in filas]
+
+    def consultar(self, tipos=(), prioridades=(), automatizar=(), hus=(), corridas=(), ultimas=None):
+        """
+        Generador de casos (dicts con `corrida` + los campos del CSV) que
+        cumplen todos los filtros; un filtro vacío no filtra. hus acepta
+        comodines (*, ?) como en GLOB. ultimas=N limita a las N corridas más
+        recientes. Se lee por bloques con fetchmany, sin cargar el resultado
+        entero; con WAL la lectura no bloquea a las corridas que escriben.
+        """
+        condiciones, parametros = [], []
+
+        def en(columna, valores):
+            condiciones.append(f'"{columna}" IN ({", ".join("?" * len(valores))})')
+            parametros.extend(valores)
+
+        for columna, valores in zip(CAMPOS_CATEGORICOS, (tipos, prioridades, automatizar)):
+            if valores:
+                en(columna, [normalizar_categoria(columna, v) for v in valores])
+        if hus:
+            exactos = [h for h in hus if not any(c in h for c in "*?[")]
+            patrones = [h for h in hus if h not in exactos]
+            alternativas = []
+            if exactos:
+                alternativas.append(f"archivo_hu IN ({', '.join('?' * len(exactos))})")
+                parametros.extend(exactos)
+            for patron in patrones:
+                alternativas.append("archivo_hu GLOB ?")
+                parametros.append(patron)
+            condiciones.append("(" + " OR ".join(alternativas) + ")")
+        if corridas:
+            en("corrida", list(corridas))
+        if ultimas:
+            condiciones.append("corrida IN (SELECT id FROM corridas ORDER BY id DESC LIMIT ?)")
+            parametros.append(ultimas)
+
+        donde = " WHERE " + " AND ".join(condiciones) if condiciones else ""
+        # Cursor propio: la conexión de escritura no queda ocupada mientras se exporta
+        conn = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            cursor = conn.execute(
+                f"SELECT corrida, {_COLUMNAS} FROM casos{donde} ORDER BY corrida, rowid", parametros
+            )
+            while True:
+                filas = cursor.fetchmany(_TAMANO_LECTURA)
+                if not filas:
+                    return
+                for fila in filas:
+                    yield dict(zip(("corrida",) + CAMPOS_CASO, fila))
+        finally:
+            conn.close()
+
+
+_COLUMNAS = ", ".join(f'"{campo}"' for campo in CAMPOS_CASO)
+
+
+def _fila(caso):
+    valores = []
+    for campo in CAMPOS_CASO:
+        valor = caso.get(campo, "")
+        if campo in CAMPOS_CATEGORICOS:
+            valor = normalizar_categoria(campo, valor)
+        elif isinstance(valor, list):
+            valor = "\n".join(str(v) for v in valor)
+        valores.append("" if valor is None else str(valor))
+    return tuple(valores)
+
+
+# ==============================
+# PROGRAMA PRINCIPAL (para consola)
+# ==============================
+
+def exportar(casos, salida, formato=None, con_corrida=False):
+    """Escribe los casos con el layout de siempre (';' y utf-8-sig en CSV). Devuelve cuántos."""
+    formato = formato or ("jsonl" if str(salida).lower().endswith(".jsonl") else "csv")
+    campos = (["corrida"] if con_corrida else []) + list(CAMPOS_CASO)
+    total = 0
+    if formato == "jsonl":
+        with open(salida, "w", encoding="utf-8") as f:
+            for caso in casos:
+                f.write(json.dumps({c: caso[c] for c in campos}, ensure_ascii=False) + "\n")
+                total += 1
+        return total
+    with open(salida, "w", newline="", encoding="utf-8-sig") as f:
+        escritor = csv.DictWriter(f, fieldnames=campos, delimiter=";", extrasaction="ignore")
+        escritor.writeheader()
+        for caso in casos:
+            escritor.writerow(caso)
+            total += 1
+    return total
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta el histórico de casos de prueba de todas las corridas.")
+    parser.add_argument("--almacen", default=DEFAULT_RUTA_ALMACEN, help="Archivo SQLite del histórico.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    corridas = comandos.add_parser("corridas", help="Listar las últimas corridas.")
+    corridas.add_argument("--limite", type=int, default=20)
+
+    consultar = comandos.add_parser("consultar", aliases=["exportar"],
+                                    help="Filtrar casos y exportarlos (CSV con el layout de siempre o JSONL).")
+    consultar.add_argument("--tipo", nargs="*", default=[], help="tipo_prueba (p. ej. Negative Boundary).")
+    consultar.add_argument("--prioridad", nargs="*", default=[], help="Alta, Media y/o Baja.")
+    consultar.add_argument("--automatizar", nargs="*", default=[], help="si y/o no.")
+    consultar.add_argument("--hu", nargs="*", default=[], help="archivo_hu exactos o con comodines (login*).")
+    consultar.add_argument("--corrida", nargs="*", type=int, default=[], help="Ids de corrida.")
+    consultar.add_argument("--ultimas", type=int, default=None, help="Solo las N corridas más recientes.")
+    consultar.add_argument("--salida", default=None,
+                           help="Archivo .csv o .jsonl; sin salida solo se cuentan los casos.")
+    consultar.add_argument("--formato", choices=["csv", "jsonl"], default=None)
+    consultar.add_argument("--con-corrida", action="store_true",
+                           help="Agregar la columna corrida (el CSV deja de tener el layout de siempre).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not Path(args.almacen).exists():
+        print(f"❌ No existe el histórico: {args.almacen}")
+        return 1
+    almacen = AlmacenResultados(args.almacen)
+    try:
+        if args.comando == "corridas":
+            for corrida in almacen.corridas(args.limite):
+                fecha = time.strftime("%Y-%m-%d %H:%M", time.localtime(corrida["inicio"]))
+                print(f"   #{corrida['id']} {fecha} · {corrida['origen']} · {corrida['casos']} casos"
+                      + (f" · {corrida['nombre']}" if corrida["nombre"] else ""))
+            return 0
+
+        casos = almacen.consultar(tipos=args.tipo, prioridades=args.prioridad, automatizar=args.automatizar,
+                                  hus=args.hu, corridas=args.corrida, ultimas=args.ultimas)
+        if args.salida:
+            total = exportar(casos, args.salida, args.formato, args.con_corrida)
+            print(f"✅ Archivo generado: {args.salida} ({total} casos)")
+        else:
+            print(f"🔍 {sum(1 for _ in casos)} casos cumplen los filtros")
+        return 0
+    finally:
+        almacen.cerrar()
+
+
+if __name__ == "__main__":
+    exit(main())
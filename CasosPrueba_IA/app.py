@@ -1,7 +1,18 @@
 import streamlit as st
 import pandas as pd
-import io
-from Casos_Prueba_IA import setup_gemini, generar_casos_prueba, DEFAULT_MODEL_NAME, DEFAULT_PROMPT
+from almacen_resultados import AlmacenResultados
+from backends import BACKENDS, BACKEND_LOCAL
+from Casos_Prueba_IA import setup_gemini, LimitadorTasa, DEFAULT_MODEL_NAME, DEFAULT_PROMPT, DEFAULT_WORKERS, estimar_tokens
+from cache_respuestas import CacheRespuestas
+from caso_prueba import contar_valores, filtrar_casos, pagina, total_paginas, CAMPOS_CATEGORICOS
+from deduplicacion import MODOS as MODOS_DEDUPLICACION, MODO_MARCAR, MODO_FUSIONAR
+from division_hu import DEFAULT_CRITERIOS_POR_BLOQUE, DEFAULT_UMBRAL_DIVISION
+from historial_chat import HistorialChat, ROL_USUARIO, ROL_MODELO
+from indice_busqueda import construir_indice, agregar_casos, formatear_pasajes, DEFAULT_TOP_K
+from lectura_hu import hus_de_bytes
+from metricas import tokens_prompt
+from resiliencia import ModeloResiliente, PoliticaReintentos, ConcurrenciaAdaptativa, ControlHedging, DEFAULT_MAX_INTENTOS
+from trabajo_generacion import TrabajoGeneracion, CANCELADO
 
 st.set_page_config(
     page_title="Generador de Casos de Prueba IA",
@@ -9,6 +20,19 @@ st.set_page_config(
     layout="wide"
 )
 
+COLS_ORDER = [
+    "archivo_hu", 
+    "id_caso", 
+    "tipo_prueba", 
+    "prioridad",
+    "Automatizar",
+    "descripcion", 
+    "precondiciones", 
+    "pasos", 
+    "resultado_esperado", 
+    "criterio"
+]
+
 st.markdown("""
 <style>
     .stButton>button {
@@ -48,6 +72,32 @@ que primero debe cargar una HU.
 {mensaje_usuario}
 """
 
+CHAT_PROMPT_CON_PASAJES = """
+Eres un ingeniero QA senior, experto en certificación, pruebas técnicas y diseño
+estructurado de casos de prueba.
+
+**CONTEXTO ACTUAL:**
+El usuario cargó un lote de Historias de Usuario y generó casos de prueba. Estos
+son los fragmentos del lote más relevantes para su pregunta (cada uno indica de
+qué HU o caso proviene):
+
+--- INICIO DE FRAGMENTOS ---
+{pasajes}
+--- FIN DE FRAGMENTOS ---
+
+Responde usando estos fragmentos y cita la HU o el caso del que sale cada dato.
+Si los fragmentos no alcanzan para responder, dilo y sugiere qué HU revisar.
+Responde de manera conversacional, clara y profesional.
+
+**Pregunta del usuario:**
+{mensaje_usuario}
+"""
+
+# Lo anterior al marcador es fijo entre turnos y va como instrucción de sistema
+# (el proveedor lo cachea); al historial solo se agrega la parte que cambia
+MARCADOR_PREGUNTA = "**Pregunta del usuario:**"
+MARCADOR_CONTEXTO = "**CONTEXTO ACTUAL:**"
+
 CHAT_PROMPT_SIN_CONTEXTO = """
 Eres un ingeniero QA senior, experto en certificación, pruebas técnicas y diseño
 estructurado de casos de prueba.
@@ -68,6 +118,259 @@ analizar una HU específica, debe primero cargarla usando las pestañas de arrib
 {mensaje_usuario}
 """
 
+def dividir_chat_prompt(chat_prompt, marcador=MARCADOR_PREGUNTA):
+    """(instrucciones, mensaje) del prompt del chat, cortado en el marcador."""
+    instrucciones, encontrado, resto = chat_prompt.partition(marcador)
+    if not encontrado:
+        return "", chat_prompt
+    return instrucciones.strip(), encontrado + resto
+
+
+def mostrar_panel_metricas(contenedor, resumen):
+    """Dibuja en el contenedor el resumen de métricas (RegistroMetricas.resumen()) de una generación."""
+    contadores = resumen["contadores"]
+    if not contadores:
+        return
+    modelo = resumen["etapas"].get("modelo", {})
+    with contenedor.container():
+        st.subheader("📈 Métricas de la generación")
+        col1, col2 = st.columns(2)
+        col1.metric("HUs OK", contadores.get("hus_ok", 0))
+        col2.metric("HUs con error", contadores.get("hus_error", 0))
+        col1.metric("Solicitudes", contadores.get("solicitudes_modelo", 0))
+        col2.metric("HUs/min", resumen["hus_por_minuto"])
+        col1.metric("Modelo p50 (s)", modelo.get("p50_s", 0))
+        col2.metric("Modelo p95 (s)", modelo.get("p95_s", 0))
+        st.caption(
+            f"Tokens: {resumen['tokens'].get('prompt', 0)} de prompt "
+            f"({resumen['tokens'].get('prompt_cacheado', 0)} desde caché de prefijo), "
+            f"{resumen['tokens'].get('respuesta', 0)} de respuesta · "
+            f"Reintentos: {contadores.get('reintentos', 0)}"
+        )
+        if resumen["hus_mas_lentas"]:
+            st.dataframe(
+                pd.DataFrame(
+                    [{"HU": d["hu"], "Total (s)": d["total_s"], "Error": d["error"] or ""}
+                     for d in resumen["hus_mas_lentas"][:5]]
+                ),
+                use_container_width=True,
+                hide_index=True
+            )
+
+
+@st.cache_resource(show_spinner=False)
+def obtener_modelo(api_key, model_name, temperature, backend):
+    """
+    Configura el modelo una sola vez y lo reutiliza entre reruns y clics.
+    Lo comparten todas las sesiones y vive lo que el proceso: ni los trabajos
+    ni el chat lo cierran.
+    """
+    return setup_gemini(api_key, model_name, temperature, backend=backend)
+
+
+def guardar_resultados(trabajo):
+    """Pasa el resultado de un trabajo terminado a la sesión para que sobreviva a los reruns."""
+    if st.session_state.get("indice_chat") is not None:
+        agregar_casos(st.session_state.indice_chat, trabajo.casos)
+
+    avisos = []
+    if trabajo.estadisticas_cache is not None and trabajo.cache.habilitada:
+        stats = trabajo.estadisticas_cache
+        avisos.append(f"🗃 Caché: {stats['hits']} aciertos, {stats['misses']} fallos")
+
+    hedging = trabajo.opciones_lote.get("hedging")
+    if hedging is not None:
+        datos_hedging = hedging.como_dict()
+        avisos.append(f"🏇 Hedging: {datos_hedging['hedges_enviados']} solicitudes duplicadas, "
+                      f"{datos_hedging['hedges_ganados']} ganadas, "
+                      f"{datos_hedging['hedges_suspendidos']} evitadas con el servicio saturado")
+
+    metricas = trabajo.metricas.resumen()
+    contadores = metricas["contadores"]
+    if contadores.get("criterios_sin_cubrir"):
+        avisos.append(f"📐 Cobertura: {contadores['criterios_sin_cubrir']} criterios sin cubrir → "
+                      f"{contadores.get('casos_cobertura', 0)} casos agregados")
+
+    if trabajo.corrida is not None:
+        avisos.append(f"🗄 Guardado en el histórico como corrida #{trabajo.corrida} ({trabajo.almacen.ruta})")
+    elif trabajo.error_almacen is not None:
+        avisos.append(f"⚠ No se pudo guardar en el histórico: {trabajo.error_almacen}")
+
+    if trabajo.deduplicar:
+        accion = "fusionados" if trabajo.deduplicar == MODO_FUSIONAR else "marcados"
+        avisos.append(f"🧹 Duplicados: {trabajo.duplicados} casos {accion}")
+
+    rescate = trabajo.metricas.rescate.como_dict()
+    if rescate["respuestas_rotas"]:
+        avisos.append(
+            f"🩹 Rescate: {rescate['respuestas_rescatadas']}/{rescate['respuestas_rotas']} respuestas rotas recuperadas "
+            f"({rescate['tasa_rescate']:.0%}), {rescate['casos_descartados']} casos descartados, "
+            f"{rescate['solicitudes_continuacion']} solicitudes extra"
+        )
+
+    st.session_state.resultados = {
+        "estado": trabajo.estado,
+        "procesadas": trabajo.completados,
+        "total": trabajo.total,
+        # Solo la lista compacta de casos: la tabla se arma por página al mostrarla
+        "casos": trabajo.casos,
+        "campos": trabajo.campos_salida,
+        "valores": {campo: contar_valores(trabajo.casos, campo) for campo in CAMPOS_FILTRO},
+        "csv": trabajo.csv_bytes,
+        "jsonl": trabajo.jsonl_bytes,
+        "errores": trabajo.errores,
+        "error_fatal": str(trabajo.error_fatal) if trabajo.error_fatal else None,
+        "avisos": avisos,
+        "metricas": metricas,
+    }
+
+
+@st.fragment(run_every=1.0)
+def mostrar_trabajo():
+    """Progreso del trabajo en segundo plano; se refresca solo, sin rerun de toda la app."""
+    trabajo = st.session_state.get("trabajo")
+    if trabajo is None:
+        return
+
+    if trabajo.terminado:
+        guardar_resultados(trabajo)
+        st.session_state.trabajo = None
+        st.rerun()
+
+    datos = trabajo.instantanea()
+    st.progress(datos["completados"] / datos["total"] if datos["total"] else 0.0)
+    if datos["ultimo"]:
+        st.text(f"Procesado: {datos['ultimo']} ({datos['completados']}/{datos['total']}) · "
+                f"{datos['casos']} casos · {datos['segundos']} s")
+    else:
+        st.text(f"Generando... ({datos['completados']}/{datos['total']}) · {datos['segundos']} s")
+
+    if datos["cancelando"]:
+        st.info("⏹ Cancelando: se esperan las HUs que ya estaban en curso...")
+    elif st.button("⏹ Cancelar generación"):
+        trabajo.cancelar()
+        st.rerun(scope="fragment")
+
+    for nombre, error in datos["errores"]:
+        st.error(f"Error procesando {nombre}: {error}")
+    if datos["recientes"]:
+        st.dataframe(tabla_casos(datos["recientes"], trabajo.campos), use_container_width=True)
+    mostrar_panel_metricas(st.empty(), trabajo.metricas.resumen())
+
+
+CAMPOS_FILTRO = CAMPOS_CATEGORICOS + ("archivo_hu",)
+ETIQUETAS_FILTRO = {"tipo_prueba": "Tipo", "prioridad": "Prioridad", "Automatizar": "Automatizar", "archivo_hu": "HU"}
+TAMANOS_PAGINA = [25, 50, 100, 200]
+
+
+def tabla_casos(casos, campos, indices=None):
+    """DataFrame solo con los casos recibidos (una página, no el lote completo)."""
+    return pd.DataFrame.from_records([caso.fila(campos) for caso in casos], columns=campos,
+                                     index=[i + 1 for i in indices] if indices is not None else None)
+
+
+def indices_filtrados(resultados, filtros, texto):
+    """Filtra una vez por combinación de filtros; los cambios de página reutilizan el resultado."""
+    clave = (id(resultados["casos"]), tuple((c, tuple(v)) for c, v in filtros.items()), texto)
+    memoria = st.session_state.get("filtro_resultados")
+    if memoria is None or memoria[0] != clave:
+        memoria = (clave, filtrar_casos(resultados["casos"], filtros, texto))
+        st.session_state.filtro_resultados = memoria
+    return memoria[1]
+
+
+def mostrar_tabla_paginada(resultados):
+    """Tabla de resultados filtrable que solo construye y envía la página visible."""
+    casos = resultados["casos"]
+    with st.expander("🔎 Filtros", expanded=False):
+        columnas = st.columns(len(CAMPOS_FILTRO))
+        filtros = {}
+        for columna, campo in zip(columnas, CAMPOS_FILTRO):
+            conteos = dict(resultados["valores"][campo])
+            filtros[campo] = columna.multiselect(
+                ETIQUETAS_FILTRO[campo],
+                options=list(conteos),
+                format_func=lambda valor, conteos=conteos: f"{valor or '(vacío)'} ({conteos[valor]})",
+                key=f"filtro_{campo}",
+            )
+        texto = st.text_input("Buscar en id, criterio o descripción", key="filtro_texto")
+
+    indices = indices_filtrados(resultados, filtros, texto)
+    col_tamano, col_pagina = st.columns(2)
+    tamano = col_tamano.selectbox("Casos por página", TAMANOS_PAGINA, index=1, key="tamano_pagina")
+    paginas = total_paginas(len(indices), tamano)
+    # Al filtrar puede haber menos páginas que la elegida
+    if st.session_state.get("pagina_resultados", 1) > paginas:
+        st.session_state.pagina_resultados = paginas
+    numero = col_pagina.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas,
+                                     step=1, key="pagina_resultados")
+
+    inicio = (numero - 1) * tamano
+    visibles = pagina(casos, indices, numero, tamano)
+    st.caption(f"Mostrando {inicio + 1 if visibles else 0}–{inicio + len(visibles)} de {len(indices)} casos"
+               + (f" (filtrados de {len(casos)})" if len(indices) != len(casos) else ""))
+    st.dataframe(tabla_casos(visibles, resultados["campos"], indices[inicio:inicio + tamano]),
+                 use_container_width=True)
+
+
+def mostrar_resultados(resultados):
+    for nombre, error in resultados["errores"]:
+        st.error(f"Error procesando {nombre}: {error}")
+    if resultados["error_fatal"]:
+        st.error(f"❌ La generación se interrumpió: {resultados['error_fatal']}")
+    for aviso in resultados["avisos"]:
+        st.caption(aviso)
+
+    if not resultados["casos"]:
+        st.warning("No se generaron casos de prueba. Revisa el log de errores.")
+        return
+
+    if resultados["estado"] == CANCELADO:
+        st.warning(f"⏹ Generación cancelada: {resultados['procesadas']}/{resultados['total']} HUs procesadas.")
+    else:
+        st.success("✅ ¡Generación completada!")
+    st.info(f"💡 El chat ahora tiene contexto de la HU. Puedes hacerle preguntas sobre ella.")
+
+    st.subheader("📋 Resultados")
+    mostrar_tabla_paginada(resultados)
+
+    # on_click="ignore": descargar no provoca un rerun
+    col_csv, col_jsonl = st.columns(2)
+    with col_csv:
+        st.download_button(
+            label="📥 Descargar CSV",
+            data=resultados["csv"],
+            file_name="casos_prueba_generados.csv",
+            mime="text/csv",
+            on_click="ignore"
+        )
+    with col_jsonl:
+        st.download_button(
+            label="📥 Descargar JSONL",
+            data=resultados["jsonl"],
+            file_name="casos_prueba_generados.jsonl",
+            mime="application/jsonl",
+            on_click="ignore"
+        )
+
+
+def fragmentos_texto(respuesta, uso=None):
+    """
+    Texto de cada fragmento de una respuesta en streaming, para st.write_stream.
+    uso: dict opcional donde queda el usage_metadata del último fragmento que lo trae.
+    """
+    for fragmento in respuesta:
+        if uso is not None and getattr(fragmento, "usage_metadata", None):
+            uso["metadata"] = fragmento.usage_metadata
+        try:
+            texto = fragmento.text
+        except ValueError:
+            # El SDK lanza ValueError en fragmentos sin partes (p. ej. el de cierre)
+            continue
+        if texto:
+            yield texto
+
+
 def main():
     st.title("🧪 Generador de Casos de Prueba con IA")
     st.markdown("Sube tus Historias de Usuario (HU) o pégalas directamente para generar casos de prueba exhaustivos.")
@@ -89,6 +392,14 @@ def main():
             index=0
         )
         
+        backend = st.selectbox(
+            "Backend",
+            options=list(BACKENDS),
+            index=0,
+            help="sdk: librería de Google; rest: HTTP directo con pool de conexiones; "
+                 "local: respuestas de prueba sin red."
+        )
+
         temperature = st.slider(
             "Creatividad (Temperatura)", 
             min_value=0.0, 
@@ -97,6 +408,95 @@ def main():
             step=0.1
         )
 
+        max_workers = st.number_input(
+            "HUs en paralelo",
+            min_value=1,
+            max_value=32,
+            value=DEFAULT_WORKERS,
+            help="Cantidad de HUs que se envían al modelo al mismo tiempo."
+        )
+
+        limite_rpm = st.number_input(
+            "Límite de solicitudes por minuto (0 = sin límite)",
+            min_value=0,
+            value=0,
+            step=1
+        )
+
+        max_intentos = st.number_input(
+            "Intentos ante errores 429/503",
+            min_value=1,
+            max_value=10,
+            value=DEFAULT_MAX_INTENTOS,
+            help="Reintenta con espera exponencial y reduce la concurrencia si se agota la cuota."
+        )
+
+        usar_hedging = st.checkbox(
+            "Duplicar solicitudes lentas (hedging)",
+            value=False,
+            help="Si una HU tarda más que el percentil 95 de las últimas, se envía una copia y se usa la primera que responda."
+        )
+
+        usar_cache = st.checkbox(
+            "Usar caché de respuestas",
+            value=True,
+            help="Reutiliza los casos ya generados para la misma HU, prompt y modelo."
+        )
+        refrescar_cache = st.checkbox(
+            "Forzar regeneración (refrescar caché)",
+            value=False,
+            disabled=not usar_cache
+        )
+
+        modo_stream = st.checkbox(
+            "Mostrar casos en vivo (streaming)",
+            value=True,
+            help="Muestra cada caso apenas el modelo lo termina de escribir."
+        )
+
+        max_continuaciones = st.number_input(
+            "Continuaciones si la respuesta se corta",
+            min_value=0,
+            max_value=5,
+            value=0,
+            help="Si el modelo corta la respuesta, pide solo los casos faltantes en vez de regenerar la HU."
+        )
+
+        criterios_por_bloque = st.number_input(
+            "Criterios por bloque (HUs grandes)",
+            min_value=0,
+            max_value=50,
+            value=DEFAULT_CRITERIOS_POR_BLOQUE,
+            help=f"Las HUs con más de {DEFAULT_UMBRAL_DIVISION} criterios se generan en bloques paralelos. 0 = no dividir."
+        )
+
+        completar_criterios = st.checkbox(
+            "Completar criterios sin cubrir",
+            value=False,
+            help="Revisa qué criterios de aceptación quedaron sin casos y los pide con una solicitud pequeña, sin regenerar la HU."
+        )
+
+        modo_duplicados = st.selectbox(
+            "Casos casi duplicados",
+            options=["no revisar", MODO_MARCAR, MODO_FUSIONAR],
+            index=0,
+            help="Al terminar el lote, marca los casos casi iguales (duplicado_de) o deja uno solo con sus origenes."
+        )
+
+        max_hus_por_paquete = st.number_input(
+            "HUs pequeñas por solicitud",
+            min_value=0,
+            max_value=20,
+            value=0,
+            help="Agrupa HUs cortas en una sola solicitud para ahorrar el prompt fijo. 0 = una solicitud por HU."
+        )
+
+        guardar_historico = st.checkbox(
+            "Guardar en el histórico de resultados",
+            value=True,
+            help="Agrega los casos a la base compartida con la consola (almacen_resultados.py consultar)."
+        )
+
         st.info("Nota: La API Key no se guarda, solo se usa para esta sesión.")
         
         # Mostrar contexto actual
@@ -112,11 +512,18 @@ def main():
                 )
             if st.button("🗑️ Limpiar Contexto"):
                 st.session_state.contexto_hu = ""
+                st.session_state.indice_chat = None
                 st.session_state.messages = []
+                st.session_state.historial_chat = HistorialChat(estimar_tokens)
                 st.rerun()
         else:
             st.warning("⚠️ No hay HU cargada. El chat responderá de forma general.")
         
+        # Métricas de la última generación terminada (las de la que está en curso se ven en su progreso)
+        resultados = st.session_state.get("resultados")
+        if resultados and resultados.get("metricas"):
+            mostrar_panel_metricas(st.empty(), resultados["metricas"])
+
         with st.expander("📝 Editar Prompt del Sistema (Para CSV)"):
             st.warning("⚠ Asegúrate de mantener `{hu_texto}` donde quieras que vaya la HU.")
             custom_prompt_input = st.text_area(
@@ -128,6 +535,9 @@ def main():
     # Inicializar contexto
     if "contexto_hu" not in st.session_state:
         st.session_state.contexto_hu = ""
+    # Lo que se envía al modelo: ventana de turnos recientes + resumen de los viejos
+    if "historial_chat" not in st.session_state:
+        st.session_state.historial_chat = HistorialChat(estimar_tokens)
 
     # --- ÁREA PRINCIPAL ---
     tab_archivos, tab_texto = st.tabs(["📂 Subir Archivos", "📝 Pegar Texto"])
@@ -136,15 +546,15 @@ def main():
 
     with tab_archivos:
         uploaded_files = st.file_uploader(
-            "Arrastra tus archivos .txt aquí", 
-            type=["txt"], 
+            "Arrastra tus archivos .txt, .md o .jsonl (una HU por línea) aquí", 
+            type=["txt", "md", "jsonl"], 
             accept_multiple_files=True
         )
         if uploaded_files:
             st.success(f"{len(uploaded_files)} archivos cargados.")
             for uploaded_file in uploaded_files:
-                string_data = uploaded_file.getvalue().decode("utf-8")
-                hus_para_procesar.append((uploaded_file.name, string_data))
+                # Acepta UTF-8, cp1252 o latin-1; un .jsonl aporta una HU por línea
+                hus_para_procesar.extend(hus_de_bytes(uploaded_file.name, uploaded_file.getvalue()))
 
     with tab_texto:
         texto_manual = st.text_area(
@@ -156,8 +566,10 @@ def main():
             hus_para_procesar.append(("Texto Manual", texto_manual))
 
     # --- BOTÓN DE GENERAR ---
-    if st.button("🚀 Generar Casos de Prueba", type="primary"):
-        if not api_key:
+    trabajo = st.session_state.get("trabajo")
+    en_curso = trabajo is not None and not trabajo.terminado
+    if st.button("🚀 Generar Casos de Prueba", type="primary", disabled=en_curso):
+        if not api_key and backend != BACKEND_LOCAL:
             st.error("❌ Por favor ingresa tu API Key en la barra lateral.")
             return
 
@@ -165,10 +577,19 @@ def main():
             st.warning("⚠ No hay HUs para procesar. Sube archivos o pega texto.")
             return
 
+        # El control de hedging vive en la sesión para seguir aprendiendo latencias entre corridas
+        if "hedging" not in st.session_state:
+            st.session_state.hedging = ControlHedging()
+        hedging = st.session_state.hedging if usar_hedging else None
+
         # SETUP DEL MODELO
         try:
-            model = setup_gemini(api_key, model_name, temperature)
-            st.session_state.model = model
+            model = ModeloResiliente(
+                obtener_modelo(api_key, model_name, temperature, backend),
+                politica=PoliticaReintentos(max_intentos=max_intentos),
+                concurrencia=ConcurrenciaAdaptativa(inicial=max_workers, maximo=max_workers),
+                hedging=hedging
+            )
         except Exception as e:
             st.error(f"Error al configurar Gemini: {e}")
             return
@@ -180,74 +601,44 @@ def main():
         # Opción 2: Guardar todas concatenadas (si son pocas)
         # st.session_state.contexto_hu = "\n\n---\n\n".join([contenido for _, contenido in hus_para_procesar])
 
-        # PROCESAMIENTO
-        all_cases = []
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        total_hus = len(hus_para_procesar)
-        
-        for i, (nombre, contenido) in enumerate(hus_para_procesar):
-            status_text.text(f"Procesando: {nombre}...")
-            try:
-                casos = generar_casos_prueba(model, contenido, custom_prompt=custom_prompt_input)
-                
-                for c in casos:
-                    c["archivo_hu"] = nombre
-                
-                all_cases.extend(casos)
-                
-            except Exception as e:
-                st.error(f"Error procesando {nombre}: {e}")
-            
-            progress_bar.progress((i + 1) / total_hus)
-
-        progress_bar.empty()
-        status_text.empty()
-
-        if all_cases:
-            st.success("✅ ¡Generación completada!")
-            st.info(f"💡 El chat ahora tiene contexto de la HU. Puedes hacerle preguntas sobre ella.")
-            
-            df = pd.DataFrame(all_cases)
-            
-            cols_order = [
-                "archivo_hu", 
-                "id_caso", 
-                "tipo_prueba", 
-                "prioridad",
-                "Automatizar",
-                "descripcion", 
-                "precondiciones", 
-                "pasos", 
-                "resultado_esperado", 
-                "criterio"
-            ]
-            cols_final = [c for c in cols_order if c in df.columns]
-            df = df[cols_final]
-
-            st.subheader("📋 Resultados")
-            st.dataframe(df, use_container_width=True)
-
-            csv_buffer = io.StringIO()
-            df.to_csv(csv_buffer, index=False, sep=';', encoding='utf-8-sig')
-            csv_data = csv_buffer.getvalue()
-
-            st.download_button(
-                label="📥 Descargar CSV",
-                data=csv_data,
-                file_name="casos_prueba_generados.csv",
-                mime="text/csv"
-            )
-        else:
-            st.warning("No se generaron casos de prueba. Revisa el log de errores.")
+        # El chat busca en TODAS las HUs del lote; los casos se agregan al terminar
+        st.session_state.indice_chat = construir_indice(hus_para_procesar)
+
+        # PROCESAMIENTO EN SEGUNDO PLANO (cada trabajo tiene su propio registro de métricas)
+        st.session_state.resultados = None
+        st.session_state.trabajo = TrabajoGeneracion(
+            model,
+            hus_para_procesar,
+            campos=COLS_ORDER,
+            cache=CacheRespuestas(habilitada=usar_cache, refrescar=refrescar_cache),
+            custom_prompt=custom_prompt_input,
+            max_workers=max_workers,
+            limitador=LimitadorTasa(solicitudes_por_minuto=limite_rpm or None),
+            max_continuaciones=max_continuaciones,
+            criterios_por_bloque=criterios_por_bloque,
+            max_hus_por_paquete=max_hus_por_paquete,
+            hedging=hedging,
+            completar_criterios=completar_criterios,
+            deduplicar=modo_duplicados if modo_duplicados in MODOS_DEDUPLICACION else None,
+            almacen=AlmacenResultados() if guardar_historico else None,
+            en_vivo=modo_stream
+        ).iniciar()
+
+    if st.session_state.get("trabajo") is not None:
+        mostrar_trabajo()
+
+    if st.session_state.get("resultados"):
+        mostrar_resultados(st.session_state.resultados)
 
     # --- SECCIÓN DE CHAT ---
     st.markdown("---")
     st.header("💬 Chat con IA sobre Testing")
     
     # Indicador de contexto
-    if st.session_state.contexto_hu:
+    indice_chat = st.session_state.get("indice_chat")
+    if indice_chat:
+        st.success(f"✅ Chat contextualizado con el lote actual ({len(indice_chat)} fragmentos de HUs y casos)")
+    elif st.session_state.contexto_hu:
         st.success("✅ Chat contextualizado con HU actual")
     else:
         st.info("ℹ️ Chat en modo general (sin HU cargada)")
@@ -263,7 +654,7 @@ def main():
 
     # Entrada de chat
     if prompt := st.chat_input("Pregúntame sobre la HU, casos de prueba, o metodologías QA..."):
-        if not api_key:
+        if not api_key and backend != BACKEND_LOCAL:
             st.error("❌ Por favor ingresa tu API Key en la barra lateral para chatear.")
             return
 
@@ -272,39 +663,68 @@ def main():
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # Configurar modelo si no existe
-        if "model" not in st.session_state:
-            try:
-                st.session_state.model = setup_gemini(api_key, model_name, temperature)
-            except Exception as e:
-                st.error(f"Error al configurar Gemini para chat: {e}")
-                return
+        # Modelo compartido (se configura una sola vez por combinación de parámetros)
+        try:
+            modelo_chat = obtener_modelo(api_key, model_name, temperature, backend)
+        except Exception as e:
+            st.error(f"Error al configurar Gemini para chat: {e}")
+            return
 
         # SELECCIONAR PROMPT SEGÚN CONTEXTO
-        if st.session_state.contexto_hu:
-            # Hay contexto → Usar prompt con HU
-            chat_prompt = CHAT_PROMPT_CON_CONTEXTO.format(
+        pasajes = ""
+        if indice_chat:
+            # La pregunta anterior ayuda a resolver repreguntas ("¿y el segundo caso?")
+            anteriores = [m["content"] for m in st.session_state.messages[:-1] if m["role"] == "user"]
+            consulta = " ".join(anteriores[-1:] + [prompt])
+            pasajes = formatear_pasajes(indice_chat.buscar(consulta, DEFAULT_TOP_K), estimar_tokens)
+
+        if pasajes:
+            # Hay lote indexado → solo los fragmentos relevantes (cambian en cada turno)
+            instrucciones, chat_prompt = dividir_chat_prompt(CHAT_PROMPT_CON_PASAJES.format(
+                pasajes=pasajes,
+                mensaje_usuario=prompt
+            ), MARCADOR_CONTEXTO)
+        elif st.session_state.contexto_hu:
+            # Hay contexto → Usar prompt con HU (la HU queda en las instrucciones fijas)
+            instrucciones, chat_prompt = dividir_chat_prompt(CHAT_PROMPT_CON_CONTEXTO.format(
                 contexto_hu=st.session_state.contexto_hu,
                 mensaje_usuario=prompt
-            )
+            ))
         else:
             # No hay contexto → Usar prompt general
-            chat_prompt = CHAT_PROMPT_SIN_CONTEXTO.format(
+            instrucciones, chat_prompt = dividir_chat_prompt(CHAT_PROMPT_SIN_CONTEXTO.format(
                 mensaje_usuario=prompt
-            )
-
-        # Generar respuesta
+            ))
+        if not getattr(modelo_chat, "admite_instrucciones", False):
+            chat_prompt, instrucciones = f"{instrucciones}\n\n{chat_prompt}", None
+
+        # Generar respuesta en streaming, con el historial acotado como conversación
+        historial = st.session_state.historial_chat
+        uso = {}
+        opciones_chat = {"instrucciones": instrucciones} if instrucciones else {}
         try:
-            with st.spinner("Pensando..."):
-                response = st.session_state.model.generate_content(chat_prompt)
-                respuesta_texto = response.text
-
-            # Agregar respuesta al historial
-            st.session_state.messages.append({"role": "assistant", "content": respuesta_texto})
             with st.chat_message("assistant"):
-                st.markdown(respuesta_texto)
+                respuesta = modelo_chat.generate_content(historial.contenidos(chat_prompt), stream=True,
+                                                         **opciones_chat)
+                respuesta_texto = st.write_stream(fragmentos_texto(respuesta, uso))
+                tokens, cacheados = tokens_prompt(uso.get("metadata"))
+                if tokens:
+                    st.caption(f"Tokens de prompt: {tokens - cacheados} nuevos · {cacheados} desde caché de prefijo")
         except Exception as e:
             st.error(f"Error en la respuesta del chat: {e}")
+            return
+
+        # Agregar respuesta al historial (la pregunta va sin la HU para no repetirla en cada turno)
+        st.session_state.messages.append({"role": "assistant", "content": respuesta_texto})
+        historial.agregar(ROL_USUARIO, prompt)
+        historial.agregar(ROL_MODELO, respuesta_texto)
+
+        # Los turnos que ya no entran en la ventana se resumen (después de mostrar la respuesta)
+        if historial.necesita_compactar():
+            try:
+                historial.compactar(modelo_chat)
+            except Exception as e:
+                st.caption(f"⚠ No se pudo resumir el historial del chat: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,423 @@
+import json
+import time
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from collections import deque
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ==============================
+# BACKENDS DE MODELO
+# ==============================
+# Todos los backends exponen la misma interfaz que genai.GenerativeModel que usa
+# el pipeline: generate_content(prompt, stream=False) -> objeto con .text y
+# .usage_metadata (o un iterable de fragmentos con .text si stream=True),
+# más model_name y _generation_config para la clave de caché. prompt puede ser
+# un texto o una conversación: lista de {"role": "user"|"model", "parts": [{"text": ...}]}.
+#
+# Los backends con admite_instrucciones aceptan además generate_content(...,
+# instrucciones=texto): un prefijo fijo (instrucciones QA, HU del chat) que se
+# envía como instrucción de sistema, así el proveedor puede cachearlo y no
+# procesarlo de nuevo en cada solicitud.
+
+BACKEND_SDK = "sdk"
+BACKEND_REST = "rest"
+BACKEND_LOCAL = "local"
+BACKENDS = (BACKEND_SDK, BACKEND_REST, BACKEND_LOCAL)
+
+DEFAULT_URL_API = "https://generativelanguage.googleapis.com/v1beta"
+DEFAULT_TIMEOUT_CONEXION = 10.0
+DEFAULT_TIMEOUT_LECTURA = 300.0
+DEFAULT_TAMANO_POOL = 16
+DEFAULT_TTL_PREFIJO = 3600
+DEFAULT_MIN_TOKENS_PREFIJO = 1024
+
+
+class ErrorBackend(RuntimeError):
+    """Error HTTP del backend; `code` permite clasificarlo (429, 503, ...)."""
+
+    def __init__(self, mensaje, code=None):
+        super().__init__(mensaje)
+        self.code = code
+
+
+class RespuestaModelo:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata or {}
+
+
+def texto_prompt(prompt):
+    """Texto plano de un prompt (las conversaciones se serializan de forma estable)."""
+    if isinstance(prompt, str):
+        return prompt
+    return json.dumps(prompt, ensure_ascii=False, sort_keys=True)
+
+
+def hash_prompt(prompt):
+    return hashlib.sha256(texto_prompt(prompt).encode("utf-8")).hexdigest()
+
+
+def clave_solicitud(prompt, instrucciones=None):
+    """Hash de todo lo que se envía: sin instrucciones coincide con hash_prompt (grabaciones previas)."""
+    if not instrucciones:
+        return hash_prompt(prompt)
+    return hash_prompt({"instrucciones": instrucciones, "prompt": prompt})
+
+
+def cerrar_modelo(model):
+    """
+    Libera lo que el modelo tenga abierto (sesión HTTP, cachedContent de los
+    prefijos). Acepta envoltorios (ModeloResiliente, GrabadorRespuestas) y
+    modelos sin nada que cerrar, como el del SDK.
+    """
+    cerrar = getattr(model, "cerrar", None)
+    if callable(cerrar):
+        cerrar()
+
+
+class BackendModelo(ABC):
+    """Base de los backends: nombre de modelo y configuración de generación."""
+
+    admite_instrucciones = True
+
+    def __init__(self, model_name, temperature):
+        self.model_name = model_name
+        self._generation_config = {"temperature": temperature}
+
+    @abstractmethod
+    def generate_content(self, prompt, stream=False, instrucciones=None):
+        """Respuesta con .text y .usage_metadata, o un iterable de fragmentos si stream=True."""
+
+    def cerrar(self):
+        pass
+
+
+# ------------------------------
+# REST directo con pool de conexiones
+# ------------------------------
+
+class BackendRest(BackendModelo):
+    """
+    Cliente REST de la API de Gemini con una sesión HTTP keep-alive y un pool
+    de conexiones compartido entre workers. No usa genai.configure, así que
+    pueden convivir varias configuraciones (API keys, modelos) en un proceso.
+
+    Las instrucciones van como systemInstruction (el proveedor cachea solo los
+    prefijos repetidos). Con cachear_prefijos, las instrucciones de al menos
+    min_tokens_prefijo (estimados a ~4 caracteres por token) se suben una vez
+    como cachedContent y las solicitudes lo referencian; si son más cortas, no
+    se puede crear o venció, se vuelve a systemInstruction y se avisa por consola.
+    """
+
+    def __init__(self, api_key, model_name, temperature, url_api=DEFAULT_URL_API,
+                 timeout_conexion=DEFAULT_TIMEOUT_CONEXION, timeout_lectura=DEFAULT_TIMEOUT_LECTURA,
+                 tamano_pool=DEFAULT_TAMANO_POOL, cachear_prefijos=False, ttl_prefijo=DEFAULT_TTL_PREFIJO,
+                 min_tokens_prefijo=DEFAULT_MIN_TOKENS_PREFIJO):
+        super().__init__(model_name, temperature)
+        if not api_key:
+            raise ValueError("❌ La API Key no puede estar vacía.")
+        self.url_api = url_api.rstrip("/")
+        self.timeout = (timeout_conexion, timeout_lectura)
+        self._sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=tamano_pool, max_retries=0)
+        self._sesion.mount("https://", adaptador)
+        self._sesion.mount("http://", adaptador)
+        self._sesion.headers.update({"x-goog-api-key": api_key, "Content-Type": "application/json"})
+        self.cachear_prefijos = cachear_prefijos
+        self.ttl_prefijo = ttl_prefijo
+        self.min_tokens_prefijo = min_tokens_prefijo
+        # hash de instrucciones -> (nombre del cachedContent, vence), None si no se pudo
+        # crear, o un Future mientras otro hilo lo está creando
+        self._prefijos = {}
+        self._lock_prefijos = threading.Lock()
+
+    def _cuerpo(self, prompt, instrucciones=None, contenido_cacheado=None):
+        if isinstance(prompt, str):
+            prompt = [{"role": "user", "parts": [{"text": prompt}]}]
+        cuerpo = {
+            "contents": prompt,
+            "generationConfig": dict(self._generation_config),
+        }
+        # La API no acepta systemInstruction junto con un cachedContent (ya lo incluye)
+        if contenido_cacheado:
+            cuerpo["cachedContent"] = contenido_cacheado
+        elif instrucciones:
+            cuerpo["systemInstruction"] = {"parts": [{"text": instrucciones}]}
+        return cuerpo
+
+    def _contenido_cacheado(self, instrucciones):
+        """Nombre del cachedContent de estas instrucciones (lo crea si hace falta) o None."""
+        if not (self.cachear_prefijos and instrucciones):
+            return None
+        clave = hash_prompt(instrucciones)
+        with self._lock_prefijos:
+            registro = self._prefijos.get(clave)
+            creando = False
+            if clave not in self._prefijos and len(instrucciones) // 4 < self.min_tokens_prefijo:
+                # Se avisa una sola vez por prefijo: el proveedor no cachea prefijos tan cortos
+                self._prefijos[clave] = None
+                print(f"⚠ Prefijo de ~{len(instrucciones) // 4} tokens, por debajo del mínimo de "
+                      f"{self.min_tokens_prefijo} para cachedContent: se envía como instrucción de sistema")
+                return None
+            if isinstance(registro, Future):
+                pass
+            elif clave in self._prefijos and (registro is None or registro[1] - 60 > time.time()):
+                # Se renueva un minuto antes de que venza
+                return registro and registro[0]
+            else:
+                registro = self._prefijos[clave] = Future()
+                creando = True
+
+        if not creando:
+            # Otro hilo lo está creando: se espera su resultado, no se crea otro
+            resultado = registro.result()
+            return resultado and resultado[0]
+
+        # La solicitud va fuera del lock, así los demás prefijos no esperan este ida y vuelta
+        resultado = None
+        try:
+            resultado = self._crear_contenido_cacheado(instrucciones)
+        finally:
+            with self._lock_prefijos:
+                if self._prefijos.get(clave) is registro:
+                    self._prefijos[clave] = resultado
+            registro.set_result(resultado)
+        return resultado and resultado[0]
+
+    def _crear_contenido_cacheado(self, instrucciones):
+        """(nombre, vence) del cachedContent nuevo, o None si no se pudo crear."""
+        try:
+            respuesta = self._sesion.post(
+                f"{self.url_api}/cachedContents",
+                json={
+                    "model": f"models/{self.model_name}",
+                    "systemInstruction": {"parts": [{"text": instrucciones}]},
+                    "ttl": f"{int(self.ttl_prefijo)}s",
+                },
+                timeout=self.timeout,
+            )
+            self._verificar(respuesta)
+            return respuesta.json()["name"], time.time() + self.ttl_prefijo
+        except (ErrorBackend, requests.RequestException, KeyError, ValueError) as e:
+            # Modelo sin caché explícita, prefijo rechazado...: no se vuelve a intentar
+            print(f"⚠ No se pudo crear el cachedContent del prefijo ({e}): se envía como instrucción de sistema")
+            return None
+
+    def _olvidar_contenido_cacheado(self, instrucciones):
+        with self._lock_prefijos:
+            self._prefijos.pop(hash_prompt(instrucciones), None)
+
+    def _enviar(self, url, prompt, instrucciones, **kwargs):
+        contenido = self._contenido_cacheado(instrucciones)
+        respuesta = self._sesion.post(url, json=self._cuerpo(prompt, instrucciones, contenido),
+                                      timeout=self.timeout, **kwargs)
+        if contenido and respuesta.status_code in (403, 404):
+            # El cachedContent venció o se borró: se repite con systemInstruction
+            respuesta.close()
+            self._olvidar_contenido_cacheado(instrucciones)
+            respuesta = self._sesion.post(url, json=self._cuerpo(prompt, instrucciones),
+                                          timeout=self.timeout, **kwargs)
+        self._verificar(respuesta)
+        return respuesta
+
+    @staticmethod
+    def _texto(datos):
+        partes = []
+        for candidato in datos.get("candidates", [])[:1]:
+            for parte in candidato.get("content", {}).get("parts", []):
+                partes.append(parte.get("text", ""))
+        return "".join(partes)
+
+    @staticmethod
+    def _uso(datos):
+        uso = datos.get("usageMetadata", {})
+        return {
+            "prompt_token_count": uso.get("promptTokenCount", 0),
+            "candidates_token_count": uso.get("candidatesTokenCount", 0),
+            "total_token_count": uso.get("totalTokenCount", 0),
+            "cached_content_token_count": uso.get("cachedContentTokenCount", 0),
+        }
+
+    def _verificar(self, respuesta):
+        if respuesta.status_code >= 400:
+            try:
+                mensaje = respuesta.json().get("error", {}).get("message", respuesta.text)
+            except ValueError:
+                mensaje = respuesta.text
+            raise ErrorBackend(f"{respuesta.status_code}: {mensaje}", code=respuesta.status_code)
+
+    def generate_content(self, prompt, stream=False, instrucciones=None):
+        if stream:
+            return self._generar_stream(prompt, instrucciones)
+
+        url = f"{self.url_api}/models/{self.model_name}:generateContent"
+        datos = self._enviar(url, prompt, instrucciones).json()
+        return RespuestaModelo(self._texto(datos), self._uso(datos))
+
+    def _generar_stream(self, prompt, instrucciones=None):
+        url = f"{self.url_api}/models/{self.model_name}:streamGenerateContent?alt=sse"
+        respuesta = self._enviar(url, prompt, instrucciones, stream=True)
+
+        def fragmentos():
+            with respuesta:
+                for linea in respuesta.iter_lines(decode_unicode=True):
+                    if not linea or not linea.startswith("data:"):
+                        continue
+                    datos = json.loads(linea[len("data:"):].strip())
+                    yield RespuestaModelo(self._texto(datos), self._uso(datos))
+
+        return fragmentos()
+
+    def cerrar(self):
+        # Los cachedContent se cobran por hora de almacenamiento: se borran al terminar.
+        # La sesión se puede seguir usando después (abre conexiones nuevas).
+        with self._lock_prefijos:
+            nombres = [registro[0] for registro in self._prefijos.values() if isinstance(registro, tuple)]
+            self._prefijos.clear()
+        for nombre in nombres:
+            try:
+                self._sesion.delete(f"{self.url_api}/{nombre}", timeout=self.timeout)
+            except requests.RequestException:
+                pass
+        self._sesion.close()
+
+
+# ------------------------------
+# Stub local determinista (sin red)
+# ------------------------------
+
+def _respuesta_enlatada(prompt, casos=3):
+    """Respuesta JSON válida y determinista derivada del hash del prompt."""
+    semilla = hash_prompt(prompt)[:8]
+    return json.dumps([
+        {
+            "criterio": f"Criterio derivado {semilla}",
+            "id_caso": f"CP-{i:03d}",
+            "tipo_prueba": "Functional",
+            "descripcion": f"Caso local {semilla}-{i}",
+            "precondiciones": "Ninguna",
+            "pasos": ["Abrir la aplicación", "Ejecutar la acción", "Comprobar el resultado"],
+            "resultado_esperado": "El sistema responde según la HU.",
+            "prioridad": "Media",
+            "Automatizar": "si",
+        }
+        for i in range(1, casos + 1)
+    ], ensure_ascii=False)
+
+
+class BackendLocal(BackendModelo):
+    """
+    Backend offline y determinista para pruebas y demos.
+
+    Sirve, por hash del prompt, las respuestas de una grabación JSONL (ver
+    GrabadorRespuestas); si el prompt no está grabado usa `respuestas`
+    (texto fijo o función prompt -> texto) o, por defecto, una respuesta
+    enlatada. Con estricto=True un prompt no grabado es un error.
+    Lleva la cuenta de las llamadas recibidas y, como haría la caché implícita
+    del proveedor, de las instrucciones repetidas: desde su segundo uso, sus
+    tokens se informan como cached_content_token_count.
+    """
+
+    def __init__(self, model_name="local", temperature=0.0, grabacion=None, respuestas=None,
+                 latencia=0.0, estricto=False, tamano_fragmento=64):
+        super().__init__(model_name, temperature)
+        self.grabadas = {}
+        if grabacion and Path(grabacion).exists():
+            with open(grabacion, encoding="utf-8") as f:
+                for linea in f:
+                    if linea.strip():
+                        registro = json.loads(linea)
+                        self.grabadas[registro["clave"]] = registro["texto"]
+        self.respuestas = respuestas
+        self.latencia = latencia
+        self.estricto = estricto
+        self.tamano_fragmento = tamano_fragmento
+        self.llamadas = 0
+        self.prompts = deque(maxlen=1000)
+        self.usos_prefijo = {}  # hash de instrucciones -> veces usadas
+        self.reutilizaciones_prefijo = 0
+        self._lock = threading.Lock()
+
+    def _resolver(self, prompt, instrucciones=None):
+        clave = clave_solicitud(prompt, instrucciones)
+        if clave in self.grabadas:
+            return self.grabadas[clave]
+        if self.estricto:
+            raise ErrorBackend(f"Prompt no grabado ({clave[:12]})", code=404)
+        if callable(self.respuestas):
+            return self.respuestas(prompt)
+        if self.respuestas is not None:
+            return self.respuestas
+        return _respuesta_enlatada(prompt)
+
+    def generate_content(self, prompt, stream=False, instrucciones=None):
+        reutilizado = False
+        with self._lock:
+            self.llamadas += 1
+            self.prompts.append(prompt)
+            if instrucciones:
+                clave = hash_prompt(instrucciones)
+                self.usos_prefijo[clave] = self.usos_prefijo.get(clave, 0) + 1
+                reutilizado = self.usos_prefijo[clave] > 1
+                self.reutilizaciones_prefijo += reutilizado
+        if self.latencia:
+            time.sleep(self.latencia)
+        texto = self._resolver(prompt, instrucciones)
+        tokens_prefijo = len(instrucciones) // 4 if instrucciones else 0
+        uso = {
+            "prompt_token_count": tokens_prefijo + len(texto_prompt(prompt)) // 4,
+            "candidates_token_count": len(texto) // 4,
+            "cached_content_token_count": tokens_prefijo if reutilizado else 0,
+        }
+        if stream:
+            return iter([
+                RespuestaModelo(texto[i:i + self.tamano_fragmento],
+                                uso if i + self.tamano_fragmento >= len(texto) else None)
+                for i in range(0, len(texto), self.tamano_fragmento)
+            ])
+        return RespuestaModelo(texto, uso)
+
+
+class GrabadorRespuestas:
+    """
+    Envuelve otro backend y guarda cada (prompt, respuesta) en un JSONL que
+    luego BackendLocal puede reproducir sin red.
+    """
+
+    def __init__(self, backend, ruta):
+        self._backend = backend
+        self.ruta = Path(ruta)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, nombre):
+        return getattr(self._backend, nombre)
+
+    def _guardar(self, clave, texto):
+        registro = json.dumps({"clave": clave, "texto": texto}, ensure_ascii=False)
+        with self._lock, open(self.ruta, "a", encoding="utf-8") as f:
+            f.write(registro + "\n")
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        clave = clave_solicitud(prompt, kwargs.get("instrucciones"))
+        if not stream:
+            respuesta = self._backend.generate_content(prompt, **kwargs)
+            self._guardar(clave, respuesta.text)
+            return respuesta
+
+        # El stream se abre acá, dentro de la llamada: un error al abrirlo lo ven
+        # los reintentos y las métricas de quien envuelve al grabador
+        respuesta = self._backend.generate_content(prompt, stream=True, **kwargs)
+
+        def fragmentos():
+            partes = []
+            for fragmento in respuesta:
+                partes.append(fragmento.text)
+                yield fragmento
+            self._guardar(clave, "".join(partes))
+
+        return fragmentos()
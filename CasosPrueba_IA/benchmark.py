@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import queue
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import multiprocessing
+from pathlib import Path
+
+from Casos_Prueba_IA import leer_archivos_hu, generar_casos_lote, EscritorCasos
+
+# ==============================
+# BENCHMARK DEL PIPELINE CON MODELO FALSO
+# ==============================
+# Uso: python benchmark.py --tamanos 10,1000,50000 --latencia-ms 20 --salida bench.json
+
+DEFAULT_TAMANOS = [10, 1000, 50000]
+MARCADOR_HU = "HU-SINT-"
+
+
+class RespuestaFalsa:
+    def __init__(self, texto, tokens_prompt=0):
+        self.text = texto
+        self.usage_metadata = {
+            "prompt_token_count": tokens_prompt,
+            "candidates_token_count": len(texto) // 4,
+        }
+
+
+class ModeloFalso:
+    """
+    Reemplazo de GenerativeModel con latencia, jitter, tasa de fallos y
+    tamaño de respuesta configurables. Registra el instante en que recibe
+    cada HU para medir la latencia de punta a punta.
+    """
+
+    model_name = "modelo-falso"
+
+    def __init__(self, latencia_ms=20.0, jitter_ms=5.0, tasa_fallos=0.0, casos_por_respuesta=10,
+                 semilla=1234):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tasa_fallos = tasa_fallos
+        self.casos_por_respuesta = casos_por_respuesta
+        self.inicios = {}
+        self._random = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._respuesta = json.dumps([
+            {
+                "criterio": f"Criterio sintético {i}",
+                "id_caso": f"CP-{i:03d}",
+                "tipo_prueba": "Functional",
+                "descripcion": "Validar el flujo principal de la HU sintética.",
+                "precondiciones": "El usuario tiene sesión iniciada.",
+                "pasos": ["Abrir la pantalla", "Completar el formulario", "Hacer clic en Guardar"],
+                "resultado_esperado": "El sistema guarda los datos y muestra confirmación.",
+                "prioridad": "Alta",
+                "Automatizar": "si",
+            }
+            for i in range(1, casos_por_respuesta + 1)
+        ], ensure_ascii=False)
+
+    def generate_content(self, prompt, stream=False):
+        inicio = time.perf_counter()
+        marca = prompt.find(MARCADOR_HU)
+        if marca != -1:
+            clave = prompt[marca:prompt.find("\n", marca)]
+            self.inicios.setdefault(clave, inicio)
+
+        with self._lock:
+            espera = max(0.0, self.latencia_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms))
+            falla = self._random.random() < self.tasa_fallos
+        time.sleep(espera / 1000)
+        if falla:
+            raise RuntimeError("Fallo simulado del modelo falso")
+
+        if stream:
+            return iter([RespuestaFalsa(self._respuesta[i:i + 256])
+                         for i in range(0, len(self._respuesta), 256)])
+        return RespuestaFalsa(self._respuesta, len(prompt) // 4)
+
+
+def crear_hus_sinteticas(carpeta: Path, cantidad: int):
+    carpeta.mkdir(parents=True, exist_ok=True)
+    for i in range(cantidad):
+        (carpeta / f"hu_{i:06d}.txt").write_text(
+            f"{MARCADOR_HU}{i:06d}\n"
+            "Como usuario registrado quiero actualizar mis datos de contacto\n"
+            "para recibir notificaciones en el canal correcto.\n\n"
+            "Criterios de aceptación:\n"
+            "1. El correo debe tener un formato válido.\n"
+            "2. El teléfono debe tener 10 dígitos.\n"
+            "3. Se muestra un mensaje de confirmación al guardar.\n",
+            encoding="utf-8",
+        )
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100
+    bajo = int(k)
+    alto = min(bajo + 1, len(ordenados) - 1)
+    return ordenados[bajo] + (ordenados[alto] - ordenados[bajo]) * (k - bajo)
+
+
+def ejecutar_escenario(cantidad, config):
+    """Corre el pipeline completo para `cantidad` HUs sintéticas y devuelve sus métricas."""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        crear_hus_sinteticas(tmp / "HUs", cantidad)
+        modelo = ModeloFalso(config["latencia_ms"], config["jitter_ms"], config["tasa_fallos"],
+                             config["casos_por_respuesta"])
+
+        uso_inicio = resource.getrusage(resource.RUSAGE_SELF)
+        inicio = time.perf_counter()
+
+        hus = leer_archivos_hu(str(tmp / "HUs"))
+        latencias = []
+        errores = 0
+
+        def al_completar(resultado):
+            fin = time.perf_counter()
+            clave = MARCADOR_HU + Path(resultado.nombre).stem.split("_")[-1]
+            if clave in modelo.inicios:
+                latencias.append((fin - modelo.inicios[clave]) * 1000)
+
+        with EscritorCasos(tmp / "salida.csv") as escritor:
+            for resultado in generar_casos_lote(modelo, hus, max_workers=config["workers"],
+                                                al_completar=al_completar):
+                if resultado.error:
+                    errores += 1
+                else:
+                    escritor.escribir(resultado.casos)
+
+        duracion = time.perf_counter() - inicio
+        uso_fin = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu = (uso_fin.ru_utime - uso_inicio.ru_utime) + (uso_fin.ru_stime - uso_inicio.ru_stime)
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "hus": cantidad,
+        "casos": escritor.total,
+        "errores": errores,
+        "duracion_s": round(duracion, 4),
+        "throughput_hus_s": round(cantidad / duracion, 2) if duracion else 0.0,
+        "latencia_ms": {
+            "p50": round(percentil(latencias, 50), 3),
+            "p95": round(percentil(latencias, 95), 3),
+            "p99": round(percentil(latencias, 99), 3),
+        },
+        "cpu_s": round(cpu, 4),
+        "cpu_por_hu_ms": round(cpu * 1000 / cantidad, 4) if cantidad else 0.0,
+        "rss_pico_mb": round(uso_fin.ru_maxrss / divisor, 2),
+    }
+
+
+def escenario_fallido(cantidad, motivo):
+    return {"hus": cantidad, "error": motivo}
+
+
+def _escenario_en_proceso(cantidad, config, cola):
+    try:
+        resultado = ejecutar_escenario(cantidad, config)
+    except Exception as e:
+        resultado = escenario_fallido(cantidad, f"{type(e).__name__}: {e}")
+    cola.put(resultado)
+
+
+def ejecutar_aislado(cantidad, config, intervalo=1.0, objetivo=_escenario_en_proceso):
+    """
+    Corre el escenario en un proceso nuevo para que el RSS pico no se mezcle entre tamaños.
+    Si el proceso muere sin entregar resultado (p. ej. por falta de memoria), el
+    escenario se informa como fallido en lugar de esperar para siempre.
+    objetivo(cantidad, config, cola) es lo que corre el proceso.
+    """
+    contexto = multiprocessing.get_context("spawn")
+    cola = contexto.Queue()
+    proceso = contexto.Process(target=objetivo, args=(cantidad, config, cola))
+    proceso.start()
+    try:
+        while True:
+            try:
+                return cola.get(timeout=intervalo)
+            except queue.Empty:
+                if proceso.is_alive():
+                    continue
+            # El proceso terminó: el resultado pudo llegar justo antes de salir
+            try:
+                return cola.get(timeout=intervalo)
+            except queue.Empty:
+                return escenario_fallido(cantidad, f"El proceso terminó sin resultado (código {proceso.exitcode})")
+    finally:
+        proceso.join()
+
+
+def comparar(actual, base):
+    """Imprime la variación de throughput, p95 y CPU contra un JSON previo."""
+    previos = {e["hus"]: e for e in base.get("escenarios", [])}
+    for escenario in actual["escenarios"]:
+        previo = previos.get(escenario["hus"])
+        if not previo or "error" in escenario or "error" in previo:
+            continue
+
+        def delta(a, b):
+            return f"{(a - b) / b * 100:+.1f}%" if b else "n/a"
+
+        print(
+            f"   {escenario['hus']:>6} HUs | throughput {delta(escenario['throughput_hus_s'], previo['throughput_hus_s'])}"
+            f" | p95 {delta(escenario['latencia_ms']['p95'], previo['latencia_ms']['p95'])}"
+            f" | cpu/HU {delta(escenario['cpu_por_hu_ms'], previo['cpu_por_hu_ms'])}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de generación con un modelo falso.")
+    parser.add_argument("--tamanos", default=",".join(map(str, DEFAULT_TAMANOS)),
+                        help="Cantidades de HUs sintéticas, separadas por coma.")
+    parser.add_argument("--latencia-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--fallos", type=float, default=0.0, help="Probabilidad de fallo por solicitud.")
+    parser.add_argument("--casos", type=int, default=10, help="Casos por respuesta del modelo falso.")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--salida", default="benchmark_resultados.json")
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida anterior para comparar.")
+    parser.add_argument("--sin-aislar", action="store_true",
+                        help="Correr todos los tamaños en este mismo proceso.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {
+        "latencia_ms": args.latencia_ms,
+        "jitter_ms": args.jitter_ms,
+        "tasa_fallos": args.fallos,
+        "casos_por_respuesta": args.casos,
+        "workers": args.workers,
+    }
+
+    escenarios = []
+    for cantidad in (int(t) for t in args.tamanos.split(",") if t.strip()):
+        print(f"⏱ Ejecutando escenario con {cantidad} HUs...")
+        resultado = (ejecutar_escenario(cantidad, config) if args.sin_aislar
+                     else ejecutar_aislado(cantidad, config))
+        escenarios.append(resultado)
+        if "error" in resultado:
+            print(f"   ❌ Escenario fallido: {resultado['error']}")
+            continue
+        print(f"   {resultado['throughput_hus_s']} HUs/s | p50 {resultado['latencia_ms']['p50']} ms"
+              f" | p99 {resultado['latencia_ms']['p99']} ms | RSS {resultado['rss_pico_mb']} MB")
+
+    informe = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": config,
+        "escenarios": escenarios,
+    }
+    Path(args.salida).write_text(json.dumps(informe, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"✅ Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        print(f"📊 Comparación contra {args.comparar}:")
+        comparar(informe, json.loads(Path(args.comparar).read_text(encoding="utf-8")))
+    return 1 if any("error" in e for e in escenarios) else 0
+
+
+if __name__ == "__main__":
+    exit(main())
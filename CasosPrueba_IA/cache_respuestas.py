@@ -0,0 +1,169 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# ==============================
+# CACHÉ PERSISTENTE DE RESPUESTAS
+# ==============================
+
+DEFAULT_RUTA_CACHE = ".cache_casos_prueba.sqlite"
+DEFAULT_MAX_ENTRADAS = 5000
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+class CacheRespuestas:
+    """
+    Caché en disco (SQLite) de la lista de casos ya parseada para cada HU.
+
+    La clave es un hash de (modelo, temperatura, prompt final, texto de la HU),
+    por lo que cualquier cambio en la HU, el prompt o la configuración produce
+    una entrada nueva. Se desaloja por antigüedad (max_edad_segundos) y luego
+    por LRU hasta respetar max_entradas y max_bytes.
+
+    habilitada=False omite la caché por completo, sin abrir ni crear el archivo;
+    refrescar=True no lee pero sí guarda (fuerza regenerar y sobrescribe lo que
+    hubiera).
+    """
+
+    def __init__(self, ruta=DEFAULT_RUTA_CACHE, max_entradas=DEFAULT_MAX_ENTRADAS,
+                 max_bytes=DEFAULT_MAX_BYTES, max_edad_segundos=None,
+                 habilitada=True, refrescar=False):
+        self.ruta = str(ruta)
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.max_edad_segundos = max_edad_segundos
+        self.habilitada = habilitada
+        self.refrescar = refrescar
+        self.hits = 0
+        self.misses = 0
+        self.escrituras = 0
+        self.desalojos = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if not habilitada:
+            return
+        self._conn = sqlite3.connect(self.ruta, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS respuestas (
+                clave TEXT PRIMARY KEY,
+                casos TEXT NOT NULL,
+                tamano INTEGER NOT NULL,
+                creado REAL NOT NULL,
+                accedido REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accedido ON respuestas (accedido)")
+        self._conn.commit()
+
+    @staticmethod
+    def clave(modelo, temperatura, prompt, hu_texto):
+        """Hash estable de todo lo que determina la respuesta del modelo."""
+        h = hashlib.sha256()
+        for parte in (modelo, temperatura, prompt, hu_texto):
+            dato = str(parte).encode("utf-8")
+            h.update(len(dato).to_bytes(8, "big"))
+            h.update(dato)
+        return h.hexdigest()
+
+    def obtener(self, clave):
+        """Devuelve la lista de casos guardada o None si no existe / expiró."""
+        if not self.habilitada or self.refrescar:
+            return None
+        ahora = time.time()
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT casos, creado FROM respuestas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None or self._expirada(fila[1], ahora):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE respuestas SET accedido = ? WHERE clave = ?", (ahora, clave))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(fila[0])
+
+    def guardar(self, clave, casos):
+        if not self.habilitada:
+            return
+        datos = json.dumps(casos, ensure_ascii=False)
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, casos, tamano, creado, accedido) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (clave, datos, len(datos.encode("utf-8")), ahora, ahora),
+            )
+            self.escrituras += 1
+            self._desalojar(ahora)
+            self._conn.commit()
+
+    def limpiar(self):
+        """Elimina todas las entradas."""
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM respuestas")
+            self._conn.commit()
+
+    def cerrar(self):
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.close()
+
+    def estadisticas(self):
+        entradas = total = 0
+        if self._conn is not None:
+            with self._lock:
+                entradas, total = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM respuestas"
+                ).fetchone()
+        consultas = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "tasa_aciertos": self.hits / consultas if consultas else 0.0,
+            "escrituras": self.escrituras,
+            "desalojos": self.desalojos,
+            "entradas": entradas,
+            "bytes": total,
+        }
+
+    def _expirada(self, creado, ahora):
+        return self.max_edad_segundos is not None and ahora - creado > self.max_edad_segundos
+
+    def _desalojar(self, ahora):
+        if self.max_edad_segundos is not None:
+            cursor = self._conn.execute(
+                "DELETE FROM respuestas WHERE creado < ?", (ahora - self.max_edad_segundos,)
+            )
+            self.desalojos += max(cursor.rowcount, 0)
+
+        if self.max_entradas is not None:
+            (entradas,) = self._conn.execute("SELECT COUNT(*) FROM respuestas").fetchone()
+            exceso = entradas - self.max_entradas
+            if exceso > 0:
+                self._conn.execute(
+                    "DELETE FROM respuestas WHERE clave IN "
+                    "(SELECT clave FROM respuestas ORDER BY accedido ASC LIMIT ?)",
+                    (exceso,),
+                )
+                self.desalojos += exceso
+
+        if self.max_bytes is not None:
+            (total,) = self._conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM respuestas").fetchone()
+            if total > self.max_bytes:
+                filas = self._conn.execute(
+                    "SELECT clave, tamano FROM respuestas ORDER BY accedido ASC"
+                ).fetchall()
+                for clave, tamano in filas:
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute("DELETE FROM respuestas WHERE clave = ?", (clave,))
+                    total -= tamano
+                    self.desalojos += 1
@@ -0,0 +1,180 @@
+import sys
+import unicodedata
+from functools import lru_cache
+from collections import Counter
+from collections.abc import Mapping
+
+# ==============================
+# REGISTRO COMPACTO DE CASOS DE PRUEBA
+# ==============================
+
+CAMPOS_CASO = (
+    "archivo_hu",
+    "criterio",
+    "id_caso",
+    "tipo_prueba",
+    "prioridad",
+    "Automatizar",
+    "descripcion",
+    "precondiciones",
+    "pasos",
+    "resultado_esperado",
+)
+
+TIPOS_PRUEBA = ("Functional", "Negative", "Edge Case", "Boundary", "Usability", "Regression")
+PRIORIDADES = ("Alta", "Media", "Baja")
+VALORES_AUTOMATIZAR = ("si", "no")
+
+CAMPOS_CATEGORICOS = ("tipo_prueba", "prioridad", "Automatizar")
+
+
+def _clave_catalogo(valor):
+    """Minúsculas, sin acentos ni separadores: 'Edge-case' y 'edge case' coinciden."""
+    plano = unicodedata.normalize("NFD", valor.lower())
+    return "".join(c for c in plano if c.isalnum())
+
+
+def _catalogo(canonicos, sinonimos=()):
+    catalogo = {_clave_catalogo(v): v for v in canonicos}
+    catalogo.update((_clave_catalogo(s), v) for s, v in sinonimos)
+    return catalogo
+
+
+# El modelo a veces responde en español o con otra capitalización
+_CATALOGOS = {
+    "tipo_prueba": _catalogo(TIPOS_PRUEBA, [
+        ("Funcional", "Functional"), ("Negativa", "Negative"), ("Negativo", "Negative"),
+        ("Caso extremo", "Edge Case"), ("Límite", "Boundary"), ("Limite", "Boundary"),
+        ("Usabilidad", "Usability"), ("Regresión", "Regression"),
+    ]),
+    "prioridad": _catalogo(PRIORIDADES, [("High", "Alta"), ("Medium", "Media"), ("Low", "Baja")]),
+    "Automatizar": _catalogo(VALORES_AUTOMATIZAR, [("sí", "si"), ("yes", "si"), ("true", "si"),
+                                                   ("false", "no")]),
+}
+
+
+def normalizar_categoria(campo, valor):
+    """
+    Valor canónico e internado de un campo categórico. Los valores fuera del
+    catálogo se conservan tal cual (recortados), también internados.
+    """
+    return _normalizar_texto(campo, str(valor if valor is not None else "").strip())
+
+
+@lru_cache(maxsize=4096)
+def _normalizar_texto(campo, texto):
+    # Los valores se repiten muchísimo: cada variante se normaliza una sola vez
+    return sys.intern(_CATALOGOS[campo].get(_clave_catalogo(texto), texto))
+
+
+def _texto(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, list):
+        return "\n".join(f"{i}. {str(p).strip()}" for i, p in enumerate(valor, start=1) if str(p).strip())
+    return str(valor)
+
+
+class CasoPrueba(Mapping):
+    """
+    Caso de prueba con slots en lugar de un dict por caso.
+
+    Los campos categóricos (tipo_prueba, prioridad, Automatizar) y archivo_hu
+    se normalizan e internan, así miles de casos comparten las mismas
+    cadenas. Se comporta como un mapping de solo lectura (get, dict(caso),
+    caso["campo"]), que es lo que usan el índice del chat, la cobertura, la
+    deduplicación y EscritorCasos. Los campos que no son del caso
+    (duplicado_de, origenes...) van en `extra`.
+    """
+
+    __slots__ = CAMPOS_CASO + ("extra",)
+
+    def __init__(self, **campos):
+        extra = None
+        for campo in CAMPOS_CASO:
+            setattr(self, campo, "")
+        for campo, valor in campos.items():
+            if campo in CAMPOS_CATEGORICOS:
+                setattr(self, campo, normalizar_categoria(campo, valor))
+            elif campo == "archivo_hu":
+                self.archivo_hu = sys.intern(_texto(valor))
+            elif campo in _CAMPOS:
+                setattr(self, campo, _texto(valor))
+            else:
+                if extra is None:
+                    extra = {}
+                extra[campo] = valor
+        self.extra = extra
+
+    @classmethod
+    def desde_dict(cls, caso):
+        """Valida y convierte un caso parseado (dict o CasoPrueba)."""
+        return caso if type(caso) is cls else cls(**caso)
+
+    def __getitem__(self, campo):
+        if campo in _CAMPOS:
+            return getattr(self, campo)
+        if self.extra is not None and campo in self.extra:
+            return self.extra[campo]
+        raise KeyError(campo)
+
+    def __iter__(self):
+        yield from CAMPOS_CASO
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return len(CAMPOS_CASO) + (len(self.extra) if self.extra else 0)
+
+    def fila(self, campos):
+        """Valores de los campos pedidos ("" si no existen), para una tabla."""
+        return [self.get(campo, "") for campo in campos]
+
+    def __repr__(self):
+        return f"CasoPrueba({self.archivo_hu!r}, {self.id_caso!r}, {self.tipo_prueba!r})"
+
+
+_CAMPOS = frozenset(CAMPOS_CASO)
+
+
+def convertir_casos(casos):
+    return [CasoPrueba.desde_dict(caso) for caso in casos]
+
+
+# ==============================
+# FILTRADO Y PAGINACIÓN (vista de resultados)
+# ==============================
+
+def contar_valores(casos, campo):
+    """Valores distintos de un campo con su cantidad, del más frecuente al menos."""
+    return Counter(caso.get(campo, "") for caso in casos).most_common()
+
+
+def filtrar_casos(casos, filtros=None, texto=""):
+    """
+    Índices de los casos que cumplen todos los filtros.
+    filtros: {campo: valores aceptados}; un conjunto vacío no filtra.
+    texto: búsqueda sin distinguir mayúsculas en id, criterio y descripción.
+    """
+    activos = [(campo, set(valores)) for campo, valores in (filtros or {}).items() if valores]
+    buscado = texto.strip().lower()
+    indices = []
+    for i, caso in enumerate(casos):
+        if any(caso.get(campo, "") not in valores for campo, valores in activos):
+            continue
+        if buscado and not any(
+            buscado in str(caso.get(campo, "")).lower() for campo in ("id_caso", "criterio", "descripcion")
+        ):
+            continue
+        indices.append(i)
+    return indices
+
+
+def total_paginas(cantidad, tamano_pagina):
+    return max(1, -(-cantidad // tamano_pagina))
+
+
+def pagina(casos, indices, numero, tamano_pagina):
+    """Casos de la página `numero` (desde 1) dentro de los índices filtrados."""
+    inicio = (numero - 1) * tamano_pagina
+    return [casos[i] for i in indices[inicio:inicio + tamano_pagina]]
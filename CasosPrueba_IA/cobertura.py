@@ -0,0 +1,133 @@
+import re
+
+from division_hu import dividir_hu
+from indice_busqueda import tokenizar
+
+# ==============================
+# COBERTURA DE CRITERIOS DE ACEPTACIÓN
+# ==============================
+
+DEFAULT_SIMILITUD_MINIMA = 0.5
+
+CAMPOS_COBERTURA = ["archivo_hu", "numero_criterio", "criterio", "casos", "cubierto"]
+
+# "CA-3", "AC 3", "Criterio 3", "Criterio de aceptación 3", o un "3." / "3)" al inicio
+_REFERENCIA_CRITERIO = re.compile(
+    r"^\s*(?:(?:CA|AC)\s*-?\s*(\d+)|criterio(?:\s+de\s+aceptaci[oó]n)?\s*#?\s*(\d+)|(\d+)\s*[.)])",
+    re.IGNORECASE,
+)
+
+
+def numero_referenciado(texto):
+    """Número de criterio al que hace referencia el texto, o None."""
+    coincidencia = _REFERENCIA_CRITERIO.match(str(texto or ""))
+    if not coincidencia:
+        return None
+    return int(next(g for g in coincidencia.groups() if g))
+
+
+def _solapamiento(a, b):
+    """Coeficiente de solapamiento entre dos conjuntos de palabras."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def _contencion(criterio, texto):
+    """Fracción de las palabras del criterio que aparecen en el texto."""
+    return len(criterio & texto) / len(criterio) if criterio else 0.0
+
+
+class MatrizCobertura:
+    """
+    Qué casos cubren cada criterio de aceptación de una HU.
+
+    casos_por_criterio[i] tiene los id_caso asignados al criterio i; cada caso
+    se asigna a un solo criterio (el de mayor similitud) o a ninguno.
+    """
+
+    def __init__(self, criterios):
+        self.criterios = criterios
+        self.casos_por_criterio = [[] for _ in criterios]
+        self.sin_asignar = []
+
+    def sin_cubrir(self):
+        return [i for i, casos in enumerate(self.casos_por_criterio) if not casos]
+
+    def cubiertos(self):
+        return len(self.criterios) - len(self.sin_cubrir())
+
+    def filas(self, archivo_hu=""):
+        """Filas planas (una por criterio) para exportar la matriz."""
+        return [
+            {
+                "archivo_hu": archivo_hu,
+                "numero_criterio": i + 1,
+                "criterio": criterio,
+                "casos": ", ".join(self.casos_por_criterio[i]),
+                "cubierto": "si" if self.casos_por_criterio[i] else "no",
+            }
+            for i, criterio in enumerate(self.criterios)
+        ]
+
+
+def _texto_caso(caso):
+    pasos = caso.get("pasos", "")
+    if isinstance(pasos, list):
+        pasos = " ".join(str(p) for p in pasos)
+    return f"{caso.get('descripcion', '')} {pasos} {caso.get('resultado_esperado', '')}"
+
+
+def asignar_criterio(caso, tokens_criterios, similitud_minima=DEFAULT_SIMILITUD_MINIMA):
+    """
+    Índice del criterio que cubre el caso, o None.
+
+    Primero se usa una referencia explícita en el campo `criterio` ("CA-2",
+    "Criterio 2", "2. ..."); si no hay, el criterio más parecido a ese campo;
+    y como último recurso, el criterio cuyas palabras más aparecen en la
+    descripción, pasos y resultado esperado del caso.
+    """
+    campo = caso.get("criterio", "")
+    numero = numero_referenciado(campo)
+    if numero is not None and 1 <= numero <= len(tokens_criterios):
+        return numero - 1
+
+    tokens_campo = set(tokenizar(str(campo)))
+    tokens_texto = None
+    mejor, puntaje_mejor = None, 0.0
+    for i, tokens in enumerate(tokens_criterios):
+        puntaje = _solapamiento(tokens_campo, tokens)
+        if puntaje < similitud_minima:
+            if tokens_texto is None:
+                tokens_texto = set(tokenizar(_texto_caso(caso)))
+            # Vale algo menos que coincidir con el campo criterio
+            puntaje = 0.9 * _contencion(tokens, tokens_texto)
+        if puntaje > puntaje_mejor:
+            mejor, puntaje_mejor = i, puntaje
+    return mejor if puntaje_mejor >= similitud_minima else None
+
+
+def calcular_cobertura(hu_texto, casos, similitud_minima=DEFAULT_SIMILITUD_MINIMA):
+    """Matriz de cobertura de la HU; vacía si la HU no tiene criterios reconocibles."""
+    _, criterios = dividir_hu(hu_texto)
+    matriz = MatrizCobertura(criterios)
+    tokens_criterios = [set(tokenizar(c)) for c in criterios]
+    for caso in casos:
+        indice = asignar_criterio(caso, tokens_criterios, similitud_minima) if criterios else None
+        if indice is None:
+            matriz.sin_asignar.append(caso.get("id_caso", ""))
+        else:
+            matriz.casos_por_criterio[indice].append(caso.get("id_caso", ""))
+    return matriz
+
+
+def construir_hu_faltantes(narrativa, criterios_faltantes, primer_id):
+    """Texto de la solicitud dirigida: la narrativa más solo los criterios sin casos."""
+    criterios_texto = "\n".join(criterios_faltantes)
+    return (
+        f"{narrativa}\n\n"
+        f"CRITERIOS DE ACEPTACIÓN SIN CUBRIR:\n"
+        f"{criterios_texto}\n\n"
+        f"NOTA: los demás criterios de la HU ya tienen casos. Genera casos SOLO para "
+        f"estos criterios y numera id_caso desde {primer_id}."
+    )
@@ -0,0 +1,555 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from collections import deque
+
+from Casos_Prueba_IA import (
+    setup_gemini, generar_casos_lote, LimitadorTasa, EscritorCasos,
+    DEFAULT_MODEL_NAME, DEFAULT_WORKERS,
+)
+from backends import cerrar_modelo, BACKENDS, BACKEND_SDK, BACKEND_LOCAL
+from cache_respuestas import CacheRespuestas, DEFAULT_RUTA_CACHE
+from division_hu import DEFAULT_CRITERIOS_POR_BLOQUE
+from lectura_hu import leer_hus
+from manifiesto import hash_contenido
+from resiliencia import (
+    ModeloResiliente, PoliticaReintentos, ConcurrenciaAdaptativa, InterruptorCircuito, DEFAULT_MAX_INTENTOS,
+)
+
+# ==============================
+# COLA DE TRABAJO PERSISTENTE (varios procesos / máquinas)
+# ==============================
+# Uso:
+#   python cola_trabajos.py enviar --carpeta HUs --lote release-42
+#   python cola_trabajos.py worker --rpm 60          (uno por proceso / API key)
+#   python cola_trabajos.py estado
+#   python cola_trabajos.py exportar --lote release-42 --salida casos.csv
+
+DEFAULT_RUTA_COLA = "cola_trabajos.sqlite"
+DEFAULT_LOTE = "default"
+DEFAULT_LEASE = 300.0
+DEFAULT_MAX_INTENTOS_TAREA = 3
+DEFAULT_ESPERA = 5.0
+DEFAULT_PAUSA_REINTENTO = 30.0
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+COMPLETADA = "completada"
+FALLIDA = "fallida"
+ESTADOS = (PENDIENTE, EN_CURSO, COMPLETADA, FALLIDA)
+
+_TAMANO_ENVIO = 500
+
+
+def id_trabajador():
+    """Identificador por defecto de un worker: host:pid."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ColaTrabajos:
+    """
+    Cola de HUs en SQLite que varios workers (procesos del mismo host o de
+    hosts que comparten el sistema de archivos) consumen a la vez.
+
+    Cada worker reclama una HU con un lease: la tarea queda a su nombre hasta
+    `vence`, y el worker lo renueva mientras la procesa. Si el worker muere,
+    el lease vence y otro la vuelve a tomar (hasta max_intentos). Los
+    resultados solo se aceptan del worker que tiene el lease vigente, así una
+    HU reasignada no se escribe dos veces.
+
+    Se usa el journal clásico (no WAL) porque WAL necesita memoria compartida
+    y no funciona sobre sistemas de archivos de red; los leases usan la hora
+    de pared, así que los hosts deben tener el reloj sincronizado.
+    """
+
+    def __init__(self, ruta=DEFAULT_RUTA_COLA, reloj=time.time):
+        self.ruta = str(ruta)
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        # isolation_level=None: las transacciones se abren a mano con BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(self.ruta, check_same_thread=False, timeout=60, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout = 60000")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tareas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                lote TEXT NOT NULL,
+                nombre TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                texto TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                intentos INTEGER NOT NULL DEFAULT 0,
+                trabajador TEXT,
+                vence REAL,
+                casos TEXT,
+                total_casos INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                creado REAL NOT NULL,
+                actualizado REAL NOT NULL,
+                UNIQUE (lote, nombre)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tareas_estado ON tareas (estado, id)")
+
+    def _transaccion(self, operacion):
+        """Ejecuta operacion(conn) en una transacción de escritura exclusiva."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                resultado = operacion(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return resultado
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Envío ---
+
+    def enviar(self, hus, lote=DEFAULT_LOTE):
+        """
+        Encola (nombre, texto). Una HU ya encolada en el lote con el mismo
+        contenido no se toca; si cambió, vuelve a pendiente con los intentos
+        en cero. Devuelve (nuevas_o_modificadas, sin_cambios).
+        """
+        encoladas = sin_cambios = 0
+        bloque = []
+
+        def insertar(conn):
+            antes = conn.total_changes
+            conn.executemany(
+                """
+                INSERT INTO tareas (lote, nombre, hash, texto, estado, creado, actualizado)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (lote, nombre) DO UPDATE SET
+                    hash = excluded.hash, texto = excluded.texto, estado = excluded.estado,
+                    intentos = 0, trabajador = NULL, vence = NULL, casos = NULL,
+                    total_casos = 0, error = NULL, actualizado = excluded.actualizado
+                WHERE tareas.hash != excluded.hash
+                """,
+                bloque,
+            )
+            return conn.total_changes - antes
+
+        for nombre, texto in hus:
+            ahora = self._reloj()
+            bloque.append((lote, nombre, hash_contenido(texto), texto, PENDIENTE, ahora, ahora))
+            if len(bloque) >= _TAMANO_ENVIO:
+                cambios = self._transaccion(insertar)
+                encoladas += cambios
+                sin_cambios += len(bloque) - cambios
+                bloque = []
+        if bloque:
+            cambios = self._transaccion(insertar)
+            encoladas += cambios
+            sin_cambios += len(bloque) - cambios
+        return encoladas, sin_cambios
+
+    def reencolar_fallidas(self, lote=None):
+        """Devuelve a pendiente las tareas fallidas (con los intentos en cero)."""
+        def operacion(conn):
+            consulta = ("UPDATE tareas SET estado = ?, intentos = 0, vence = NULL, actualizado = ? WHERE estado = ?"
+                        + (" AND lote = ?" if lote else ""))
+            parametros = (PENDIENTE, self._reloj(), FALLIDA) + ((lote,) if lote else ())
+            return conn.execute(consulta, parametros).rowcount
+        return self._transaccion(operacion)
+
+    # --- Lado del worker ---
+
+    def reclamar(self, trabajador, lease=DEFAULT_LEASE, max_intentos=DEFAULT_MAX_INTENTOS_TAREA, lote=None):
+        """
+        Toma la próxima tarea pendiente (o con lease vencido) y la deja a
+        nombre del trabajador. Devuelve (id, nombre, texto) o None si no hay.
+        Las tareas con lease vencido que ya agotaron sus intentos pasan a fallida.
+        """
+        def operacion(conn):
+            ahora = self._reloj()
+            filtro_lote = " AND lote = ?" if lote else ""
+            parametros_lote = (lote,) if lote else ()
+            conn.execute(
+                "UPDATE tareas SET estado = ?, trabajador = NULL, actualizado = ?, "
+                "error = COALESCE(error, 'lease vencido') "
+                f"WHERE estado = ? AND vence < ? AND intentos >= ?{filtro_lote}",
+                (FALLIDA, ahora, EN_CURSO, ahora, max_intentos) + parametros_lote,
+            )
+            fila = conn.execute(
+                "SELECT id, nombre, texto FROM tareas "
+                "WHERE ((estado = ? AND (vence IS NULL OR vence <= ?)) OR (estado = ? AND vence < ?))"
+                f"{filtro_lote} ORDER BY id LIMIT 1",
+                (PENDIENTE, ahora, EN_CURSO, ahora) + parametros_lote,
+            ).fetchone()
+            if fila is None:
+                return None
+            conn.execute(
+                "UPDATE tareas SET estado = ?, trabajador = ?, vence = ?, intentos = intentos + 1, "
+                "actualizado = ? WHERE id = ?",
+                (EN_CURSO, trabajador, ahora + lease, ahora, fila[0]),
+            )
+            return fila
+        return self._transaccion(operacion)
+
+    def renovar(self, trabajador, lease=DEFAULT_LEASE):
+        """Extiende el lease de todas las tareas en curso del trabajador."""
+        def operacion(conn):
+            ahora = self._reloj()
+            return conn.execute(
+                "UPDATE tareas SET vence = ?, actualizado = ? WHERE trabajador = ? AND estado = ?",
+                (ahora + lease, ahora, trabajador, EN_CURSO),
+            ).rowcount
+        return self._transaccion(operacion)
+
+    def completar(self, id_tarea, trabajador, casos):
+        """Guarda los casos; False si el trabajador ya no tenía el lease."""
+        def operacion(conn):
+            return conn.execute(
+                "UPDATE tareas SET estado = ?, casos = ?, total_casos = ?, error = NULL, "
+                "vence = NULL, actualizado = ? WHERE id = ? AND trabajador = ? AND estado = ?",
+                (COMPLETADA, json.dumps(casos, ensure_ascii=False), len(casos), self._reloj(),
+                 id_tarea, trabajador, EN_CURSO),
+            ).rowcount == 1
+        return self._transaccion(operacion)
+
+    def fallar(self, id_tarea, trabajador, error, max_intentos=DEFAULT_MAX_INTENTOS_TAREA,
+               pausa=DEFAULT_PAUSA_REINTENTO):
+        """
+        Registra el error: sin intentos restantes queda fallida; si no, vuelve
+        a pendiente pero no se puede reclamar hasta pasados pausa * intentos
+        segundos (en una tarea pendiente, `vence` es "disponible desde").
+        """
+        def operacion(conn):
+            ahora = self._reloj()
+            return conn.execute(
+                "UPDATE tareas SET estado = CASE WHEN intentos >= ? THEN ? ELSE ? END, "
+                "trabajador = NULL, vence = ? + ? * intentos, error = ?, actualizado = ? "
+                "WHERE id = ? AND trabajador = ? AND estado = ?",
+                (max_intentos, FALLIDA, PENDIENTE, ahora, pausa, str(error), ahora,
+                 id_tarea, trabajador, EN_CURSO),
+            ).rowcount == 1
+        return self._transaccion(operacion)
+
+    def liberar(self, trabajador):
+        """Devuelve a pendiente las tareas en curso del trabajador (salida ordenada)."""
+        def operacion(conn):
+            return conn.execute(
+                "UPDATE tareas SET estado = ?, trabajador = NULL, vence = NULL, intentos = MAX(intentos - 1, 0), "
+                "actualizado = ? WHERE trabajador = ? AND estado = ?",
+                (PENDIENTE, self._reloj(), trabajador, EN_CURSO),
+            ).rowcount
+        return self._transaccion(operacion)
+
+    # --- Consultas ---
+
+    def estado(self, lote=None):
+        """Conteos por estado, casos generados y workers con lease vigente."""
+        filtro, parametros = (" WHERE lote = ?", (lote,)) if lote else ("", ())
+        with self._lock:
+            filas = self._conn.execute(
+                f"SELECT estado, COUNT(*), COALESCE(SUM(total_casos), 0) FROM tareas{filtro} GROUP BY estado",
+                parametros,
+            ).fetchall()
+            trabajadores = self._conn.execute(
+                "SELECT trabajador, COUNT(*) FROM tareas WHERE estado = ? AND vence >= ?"
+                + (" AND lote = ?" if lote else "") + " GROUP BY trabajador",
+                (EN_CURSO, self._reloj()) + parametros,
+            ).fetchall()
+            errores = self._conn.execute(
+                "SELECT nombre, intentos, error FROM tareas WHERE estado = ?"
+                + (" AND lote = ?" if lote else "") + " ORDER BY id LIMIT 10",
+                (FALLIDA,) + parametros,
+            ).fetchall()
+        conteos = {e: 0 for e in ESTADOS}
+        casos = 0
+        for estado, cantidad, total in filas:
+            conteos[estado] = cantidad
+            casos += total
+        return {
+            "tareas": conteos,
+            "total": sum(conteos.values()),
+            "casos": casos,
+            "trabajadores": dict(trabajadores),
+            "fallidas": [{"nombre": n, "intentos": i, "error": e} for n, i, e in errores],
+        }
+
+    def hay_trabajo(self, lote=None):
+        """True mientras queden tareas pendientes o en curso."""
+        filtro, parametros = (" AND lote = ?", (lote,)) if lote else ("", ())
+        with self._lock:
+            (cantidad,) = self._conn.execute(
+                f"SELECT COUNT(*) FROM tareas WHERE estado IN (?, ?){filtro}",
+                (PENDIENTE, EN_CURSO) + parametros,
+            ).fetchone()
+        return cantidad > 0
+
+    def casos_completados(self, lote=None):
+        """Generador de listas de casos de las tareas completadas, en orden de envío."""
+        filtro, parametros = (" AND lote = ?", (lote,)) if lote else ("", ())
+        ultimo = 0
+        while True:
+            with self._lock:
+                filas = self._conn.execute(
+                    f"SELECT id, casos FROM tareas WHERE estado = ? AND id > ?{filtro} ORDER BY id LIMIT ?",
+                    (COMPLETADA, ultimo) + parametros + (_TAMANO_ENVIO,),
+                ).fetchall()
+            if not filas:
+                return
+            for id_tarea, casos in filas:
+                ultimo = id_tarea
+                yield json.loads(casos)
+
+
+# ==============================
+# WORKER
+# ==============================
+
+class TrabajadorCola:
+    """
+    Consume la cola con generar_casos_lote: las HUs se reclaman de a una a
+    medida que el pool tiene lugar, y un hilo aparte renueva los leases cada
+    lease/3 segundos mientras se procesan. Cada worker usa su propio
+    limitador de tasa, así que varios procesos pueden repartirse API keys.
+    """
+
+    def __init__(self, cola, model, trabajador=None, lease=DEFAULT_LEASE,
+                 max_intentos=DEFAULT_MAX_INTENTOS_TAREA, lote=None, **opciones_lote):
+        self.cola = cola
+        self.model = model
+        self.trabajador = trabajador or id_trabajador()
+        self.lease = lease
+        self.max_intentos = max_intentos
+        self.lote = lote
+        self.opciones_lote = opciones_lote
+        self.completadas = 0
+        self.fallidas = 0
+        self.perdidas = 0
+        self._detener = threading.Event()
+
+    def _renovar_leases(self):
+        while not self._detener.wait(self.lease / 3):
+            try:
+                self.cola.renovar(self.trabajador, self.lease)
+            except sqlite3.Error as e:
+                # Un error puntual (p. ej. base bloqueada) se reintenta en la próxima vuelta
+                print(f"   ⚠ No se pudo renovar el lease: {e}")
+
+    def procesar_disponibles(self):
+        """Procesa tareas hasta que no quede ninguna para reclamar. Devuelve cuántas tomó."""
+        reclamadas = deque()  # ids en el mismo orden en que generar_casos_lote devuelve resultados
+
+        def hus_reclamadas():
+            while not self._detener.is_set():
+                tarea = self.cola.reclamar(self.trabajador, self.lease, self.max_intentos, self.lote)
+                if tarea is None:
+                    return
+                id_tarea, nombre, texto = tarea
+                reclamadas.append(id_tarea)
+                yield nombre, texto
+
+        tomadas = 0
+        for resultado in generar_casos_lote(self.model, hus_reclamadas(), **self.opciones_lote):
+            id_tarea = reclamadas.popleft()
+            tomadas += 1
+            if resultado.error:
+                self.fallidas += 1
+                self.cola.fallar(id_tarea, self.trabajador, resultado.error, self.max_intentos)
+                print(f"   ❌ {resultado.nombre}: Error: {resultado.error}")
+            elif self.cola.completar(id_tarea, self.trabajador, resultado.casos):
+                self.completadas += 1
+                print(f"   ✔ {resultado.nombre}: {len(resultado.casos)} casos generados")
+            else:
+                self.perdidas += 1
+                print(f"   ⚠ {resultado.nombre}: el lease venció y otro worker tomó la HU; se descarta")
+        return tomadas
+
+    def ejecutar(self, continuo=False, espera=DEFAULT_ESPERA):
+        """
+        Bucle principal. Sin `continuo`, termina cuando no quedan tareas
+        pendientes ni en curso (las en curso de otros workers se esperan,
+        por si su lease vence y hay que retomarlas).
+        """
+        renovador = threading.Thread(target=self._renovar_leases, daemon=True)
+        renovador.start()
+        try:
+            while not self._detener.is_set():
+                if self.procesar_disponibles():
+                    continue
+                if not continuo and not self.cola.hay_trabajo(self.lote):
+                    break
+                self._detener.wait(espera)
+        finally:
+            self._detener.set()
+            liberadas = self.cola.liberar(self.trabajador)
+            if liberadas:
+                print(f"↩ {liberadas} HUs en curso devueltas a la cola")
+
+    def detener(self):
+        self._detener.set()
+
+
+# ==============================
+# PROGRAMA PRINCIPAL (para consola)
+# ==============================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cola de trabajo persistente para generar casos con varios workers.")
+    parser.add_argument("--cola", default=DEFAULT_RUTA_COLA, help="Archivo SQLite de la cola.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    enviar = comandos.add_parser("enviar", aliases=["submit"], help="Encolar las HUs de una carpeta.")
+    enviar.add_argument("--carpeta", default="HUs", help="Carpeta con las HUs (.txt, .md, .jsonl).")
+    enviar.add_argument("--lote", default=DEFAULT_LOTE, help="Nombre del lote (p. ej. la release).")
+    enviar.add_argument("--reintentar-fallidas", action="store_true",
+                        help="Devolver a pendiente las HUs fallidas del lote.")
+
+    worker = comandos.add_parser("worker", help="Procesar HUs de la cola hasta vaciarla.")
+    worker.add_argument("--id", default=None, help="Identificador del worker (por defecto host:pid).")
+    worker.add_argument("--lote", default=None, help="Procesar solo este lote.")
+    worker.add_argument("--backend", choices=BACKENDS, default=BACKEND_SDK,
+                        help="sdk, rest o local (respuestas grabadas/enlatadas, sin red).")
+    worker.add_argument("--grabacion", default=None,
+                        help="Con --backend local: JSONL de respuestas grabadas a reproducir.")
+    worker.add_argument("--api-key-env", default="GEMINI_API_KEY",
+                        help="Variable de entorno con la API key de este worker.")
+    worker.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="HUs procesadas en paralelo dentro de este worker.")
+    worker.add_argument("--rpm", type=int, default=None,
+                        help="Máximo de solicitudes por minuto de este worker.")
+    worker.add_argument("--tpm", type=int, default=None,
+                        help="Máximo de tokens de prompt por minuto de este worker.")
+    worker.add_argument("--lease", type=float, default=DEFAULT_LEASE,
+                        help="Segundos que una HU queda reservada sin renovar antes de volver a la cola.")
+    worker.add_argument("--max-intentos", type=int, default=DEFAULT_MAX_INTENTOS_TAREA,
+                        help="Intentos por HU (errores o leases vencidos) antes de marcarla fallida.")
+    worker.add_argument("--continuo", action="store_true",
+                        help="No terminar al vaciar la cola: esperar nuevos envíos.")
+    worker.add_argument("--espera", type=float, default=DEFAULT_ESPERA,
+                        help="Segundos entre consultas cuando no hay HUs para tomar.")
+    worker.add_argument("--cache", default=DEFAULT_RUTA_CACHE,
+                        help="Archivo SQLite con la caché de respuestas.")
+    worker.add_argument("--sin-cache", action="store_true",
+                        help="No leer ni escribir la caché de respuestas.")
+    worker.add_argument("--reintentos", type=int, default=DEFAULT_MAX_INTENTOS,
+                        help="Intentos por solicitud ante errores 429/5xx (1 = sin reintentos).")
+    worker.add_argument("--continuaciones", type=int, default=0,
+                        help="Solicitudes 'continúa desde CP-0NN' permitidas por HU cortada.")
+    worker.add_argument("--criterios-por-bloque", type=int, default=DEFAULT_CRITERIOS_POR_BLOQUE,
+                        help="Tamaño de bloque al dividir HUs grandes (0 = no dividir).")
+    worker.add_argument("--completar-criterios", action="store_true",
+                        help="Pedir casos solo para los criterios de aceptación que quedaron sin cubrir.")
+
+    estado = comandos.add_parser("estado", aliases=["status"], help="Mostrar el avance de la cola.")
+    estado.add_argument("--lote", default=None, help="Mostrar solo este lote.")
+    estado.add_argument("--json", action="store_true", help="Imprimir el estado en JSON.")
+
+    exportar = comandos.add_parser("exportar", aliases=["export"], help="Escribir los casos completados.")
+    exportar.add_argument("--lote", default=None, help="Exportar solo este lote.")
+    exportar.add_argument("--salida", default="casos_prueba_total.csv", help="Archivo de salida (.csv o .jsonl).")
+    exportar.add_argument("--formato", choices=["csv", "jsonl"], default=None,
+                          help="Formato de salida; por defecto se deduce de la extensión.")
+
+    args = parser.parse_args(argv)
+    # Los alias se normalizan al nombre en español
+    args.comando = {"submit": "enviar", "status": "estado", "export": "exportar"}.get(args.comando, args.comando)
+    return args
+
+
+def comando_enviar(cola, args):
+    print(f"📄 Encolando HUs de {args.carpeta} en el lote '{args.lote}'...")
+    encoladas, sin_cambios = cola.enviar(leer_hus(args.carpeta), lote=args.lote)
+    print(f"✅ {encoladas} HUs nuevas o modificadas encoladas, {sin_cambios} sin cambios")
+    if args.reintentar_fallidas:
+        print(f"🔁 {cola.reencolar_fallidas(args.lote)} HUs fallidas devueltas a pendiente")
+    return 0
+
+
+def comando_worker(cola, args):
+    api_key = os.getenv(args.api_key_env)
+    if not api_key and args.backend != BACKEND_LOCAL:
+        print(f"❌ No se encontró {args.api_key_env} en las variables de entorno")
+        return 1
+
+    opciones_backend = {"grabacion": args.grabacion} if args.backend == BACKEND_LOCAL and args.grabacion else {}
+    try:
+        model = setup_gemini(api_key, backend=args.backend, **opciones_backend)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return 1
+    model = ModeloResiliente(
+        model,
+        politica=PoliticaReintentos(max_intentos=args.reintentos),
+        concurrencia=ConcurrenciaAdaptativa(inicial=args.workers, maximo=args.workers),
+        interruptor=InterruptorCircuito(),
+    )
+    cache = CacheRespuestas(args.cache, habilitada=not args.sin_cache)
+
+    trabajador = TrabajadorCola(
+        cola, model, trabajador=args.id, lease=args.lease, max_intentos=args.max_intentos, lote=args.lote,
+        max_workers=args.workers, limitador=LimitadorTasa(args.rpm, args.tpm), cache=cache,
+        max_continuaciones=args.continuaciones, criterios_por_bloque=args.criterios_por_bloque,
+        completar_criterios=args.completar_criterios,
+    )
+    print(f"👷 Worker {trabajador.trabajador} ({DEFAULT_MODEL_NAME}, backend {args.backend}) "
+          f"tomando HUs de {cola.ruta}...")
+    try:
+        trabajador.ejecutar(continuo=args.continuo, espera=args.espera)
+    except KeyboardInterrupt:
+        print("⏹ Interrumpido")
+    finally:
+        cache.cerrar()
+        cerrar_modelo(model)
+    print(f"🎉 Worker terminado: {trabajador.completadas} HUs completadas, {trabajador.fallidas} con error"
+          + (f", {trabajador.perdidas} descartadas por lease vencido" if trabajador.perdidas else ""))
+    return 0
+
+
+def comando_estado(cola, args):
+    estado = cola.estado(args.lote)
+    if args.json:
+        print(json.dumps(estado, ensure_ascii=False, indent=2))
+        return 0
+    tareas = estado["tareas"]
+    print(f"📊 {estado['total']} HUs: {tareas[PENDIENTE]} pendientes, {tareas[EN_CURSO]} en curso, "
+          f"{tareas[COMPLETADA]} completadas, {tareas[FALLIDA]} fallidas ({estado['casos']} casos)")
+    for trabajador, cantidad in estado["trabajadores"].items():
+        print(f"   👷 {trabajador}: {cantidad} HUs en curso")
+    for fallida in estado["fallidas"]:
+        print(f"   ❌ {fallida['nombre']} ({fallida['intentos']} intentos): {fallida['error']}")
+    return 0
+
+
+def comando_exportar(cola, args):
+    hus = 0
+    with EscritorCasos(args.salida, formato=args.formato) as escritor:
+        for casos in cola.casos_completados(args.lote):
+            escritor.escribir(casos)
+            hus += 1
+    print(f"✅ Archivo generado: {args.salida} ({escritor.total} casos de {hus} HUs)")
+    return 0
+
+
+COMANDOS = {
+    "enviar": comando_enviar,
+    "worker": comando_worker,
+    "estado": comando_estado,
+    "exportar": comando_exportar,
+}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cola = ColaTrabajos(args.cola)
+    try:
+        return COMANDOS[args.comando](cola, args)
+    finally:
+        cola.cerrar()
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,256 @@
+import os
+import re
+import csv
+import json
+import zlib
+import argparse
+from array import array
+from pathlib import Path
+
+from indice_busqueda import tokenizar
+
+# ==============================
+# DETECCIÓN DE CASOS CASI DUPLICADOS (MinHash + LSH)
+# ==============================
+# Uso: python deduplicacion.py casos_prueba.csv --modo fusionar --umbral 0.8
+
+DEFAULT_UMBRAL_DUPLICADOS = 0.8
+DEFAULT_PERMUTACIONES = 128
+DEFAULT_BANDAS = 32
+
+MODO_MARCAR = "marcar"
+MODO_FUSIONAR = "fusionar"
+MODOS = (MODO_MARCAR, MODO_FUSIONAR)
+
+CAMPOS_MARCAR = ["duplicado_de", "similitud_duplicado"]
+CAMPOS_FUSIONAR = ["origenes"]
+
+_NUMERO_PASO = re.compile(r"^\s*\d+\s*[.)-]\s*", re.MULTILINE)
+_MASCARA = 0xFFFFFFFF
+VACIO = _MASCARA + 1
+
+
+def texto_comparable(caso):
+    """descripcion + pasos + resultado_esperado, sin la numeración de los pasos."""
+    pasos = caso.get("pasos", "")
+    if isinstance(pasos, list):
+        pasos = "\n".join(str(p) for p in pasos)
+    pasos = _NUMERO_PASO.sub("", str(pasos))
+    return f"{caso.get('descripcion', '')}\n{pasos}\n{caso.get('resultado_esperado', '')}"
+
+
+def shingles(texto, tamano=3):
+    """Hashes (crc32) de los n-gramas de palabras normalizadas."""
+    palabras = tokenizar(texto)
+    if len(palabras) < tamano:
+        return {zlib.crc32(p.encode("utf-8")) for p in palabras}
+    ngramas = zip(*(palabras[i:] for i in range(tamano)))
+    return {zlib.crc32(" ".join(ngrama).encode("utf-8")) for ngrama in ngramas}
+
+
+def firma_minhash(hashes, permutaciones=DEFAULT_PERMUTACIONES):
+    """
+    Firma MinHash por "one permutation hashing": un solo hash por shingle,
+    repartido en `permutaciones` casilleros donde se guarda el mínimo, así el
+    costo es lineal en la cantidad de shingles. Los casilleros sin shingles
+    quedan en VACIO.
+    """
+    firma = array("Q", [VACIO]) * permutaciones
+    for h in hashes:
+        # Se mezclan los bits para que el casillero no dependa solo de los bajos del crc
+        h = (h * 0x9E3779B1) & _MASCARA
+        casillero = h % permutaciones
+        valor = h // permutaciones
+        if valor < firma[casillero]:
+            firma[casillero] = valor
+    return firma
+
+
+def similitud_firmas(a, b):
+    """
+    Estimación de Jaccard para one permutation hashing: casilleros iguales
+    sobre los casilleros que no están vacíos en ambas firmas.
+    """
+    iguales = vacios = 0
+    for x, y in zip(a, b):
+        if x == y:
+            if x == VACIO:
+                vacios += 1
+            else:
+                iguales += 1
+    return iguales / (len(a) - vacios) if len(a) > vacios else 0.0
+
+
+def _raiz(padres, i):
+    while padres[i] != i:
+        padres[i] = padres[padres[i]]
+        i = padres[i]
+    return i
+
+
+def detectar_duplicados(casos, umbral=DEFAULT_UMBRAL_DUPLICADOS, permutaciones=DEFAULT_PERMUTACIONES,
+                        bandas=DEFAULT_BANDAS):
+    """
+    Agrupa casos casi duplicados (Jaccard estimado >= umbral).
+
+    Devuelve (representantes, similitudes): representantes[i] es el índice del
+    primer caso de su grupo (i mismo si es único) y similitudes[i] la mayor
+    similitud con la que se unió al grupo. Cada banda de LSH se procesa por
+    separado y cada caso se compara solo con el primero de su cubeta, así el
+    tiempo y la memoria crecen linealmente con la cantidad de casos.
+    """
+    filas = permutaciones // bandas
+    firmas = []
+    for caso in casos:
+        hashes = shingles(texto_comparable(caso))
+        firmas.append(firma_minhash(hashes, permutaciones) if hashes else None)
+
+    padres = list(range(len(casos)))
+    similitudes = [0.0] * len(casos)
+
+    for banda in range(bandas):
+        inicio, fin = banda * filas, (banda + 1) * filas
+        banda_vacia = (array("Q", [VACIO]) * filas).tobytes()
+        cubetas = {}
+        for i, firma in enumerate(firmas):
+            if firma is None:
+                continue
+            clave = firma[inicio:fin].tobytes()
+            if clave == banda_vacia:
+                # Con pocos shingles muchas bandas quedan vacías: no dicen nada
+                continue
+            primero = cubetas.setdefault(clave, i)
+            if primero == i:
+                continue
+            raiz_i, raiz_primero = _raiz(padres, i), _raiz(padres, primero)
+            if raiz_i == raiz_primero:
+                continue
+            similitud = similitud_firmas(firmas[primero], firma)
+            if similitud >= umbral:
+                # La raíz es siempre el caso que aparece primero; la similitud queda en
+                # la raíz que pasa a ser duplicado (puede no ser i si i ya tenía grupo)
+                duplicado = max(raiz_i, raiz_primero)
+                padres[duplicado] = min(raiz_i, raiz_primero)
+                similitudes[duplicado] = max(similitudes[duplicado], similitud)
+
+    return [_raiz(padres, i) for i in range(len(casos))], similitudes
+
+
+def _referencia(caso):
+    return f"{caso.get('archivo_hu', '')}:{caso.get('id_caso', '')}"
+
+
+def marcar_duplicados(casos, umbral=DEFAULT_UMBRAL_DUPLICADOS):
+    """Copia de los casos con duplicado_de / similitud_duplicado en los repetidos."""
+    representantes, similitudes = detectar_duplicados(casos, umbral)
+    marcados = []
+    for i, caso in enumerate(casos):
+        caso = dict(caso)
+        representante = representantes[i]
+        caso["duplicado_de"] = _referencia(casos[representante]) if representante != i else ""
+        caso["similitud_duplicado"] = round(similitudes[i], 3) if representante != i else ""
+        marcados.append(caso)
+    return marcados
+
+
+def fusionar_duplicados(casos, umbral=DEFAULT_UMBRAL_DUPLICADOS):
+    """
+    Deja un caso por grupo (el primero) y registra en `origenes` el
+    archivo_hu:id_caso de todos los casos fusionados en él.
+    Devuelve (casos_unicos, cantidad_fusionados).
+    """
+    representantes, _ = detectar_duplicados(casos, umbral)
+    origenes = {}
+    for i, representante in enumerate(representantes):
+        origenes.setdefault(representante, []).append(_referencia(casos[i]))
+
+    unicos = []
+    for i, caso in enumerate(casos):
+        if representantes[i] == i:
+            caso = dict(caso)
+            caso["origenes"] = " | ".join(origenes[i])
+            unicos.append(caso)
+    return unicos, len(casos) - len(unicos)
+
+
+def aplicar_deduplicacion(casos, modo, umbral=DEFAULT_UMBRAL_DUPLICADOS):
+    """Devuelve (casos, campos_extra, cantidad_duplicados) según el modo."""
+    if modo == MODO_MARCAR:
+        marcados = marcar_duplicados(casos, umbral)
+        return marcados, CAMPOS_MARCAR, sum(1 for c in marcados if c["duplicado_de"])
+    if modo == MODO_FUSIONAR:
+        unicos, fusionados = fusionar_duplicados(casos, umbral)
+        return unicos, CAMPOS_FUSIONAR, fusionados
+    raise ValueError(f"Modo de deduplicación no soportado: {modo}")
+
+
+# ==============================
+# PASO INDEPENDIENTE SOBRE UN ARCHIVO
+# ==============================
+
+def _es_jsonl(ruta):
+    return str(ruta).lower().endswith(".jsonl")
+
+
+def leer_casos(ruta):
+    """Lee un CSV (';', utf-8-sig) o JSONL generado por el pipeline. Devuelve (casos, campos)."""
+    with open(ruta, encoding="utf-8-sig", newline="") as f:
+        if _es_jsonl(ruta):
+            casos = [json.loads(linea) for linea in f if linea.strip()]
+            return casos, list(casos[0].keys()) if casos else []
+        lector = csv.DictReader(f, delimiter=";")
+        return list(lector), list(lector.fieldnames or [])
+
+
+def escribir_casos(ruta, casos, campos):
+    """Escribe en el mismo formato del pipeline, vía archivo temporal + rename."""
+    temporal = Path(f"{ruta}.tmp")
+    if _es_jsonl(ruta):
+        with open(temporal, "w", encoding="utf-8") as f:
+            for caso in casos:
+                f.write(json.dumps({c: caso.get(c, "") for c in campos}, ensure_ascii=False) + "\n")
+    else:
+        with open(temporal, "w", encoding="utf-8-sig", newline="") as f:
+            escritor = csv.DictWriter(f, fieldnames=campos, delimiter=";", extrasaction="ignore")
+            escritor.writeheader()
+            escritor.writerows(casos)
+    os.replace(temporal, ruta)
+
+
+def deduplicar_archivo(entrada, salida=None, modo=MODO_FUSIONAR, umbral=DEFAULT_UMBRAL_DUPLICADOS):
+    """Deduplica un archivo de casos; salida=None lo reescribe en el lugar."""
+    casos, campos = leer_casos(entrada)
+    resultado, campos_extra, duplicados = aplicar_deduplicacion(casos, modo, umbral)
+    escribir_casos(salida or entrada, resultado, campos + [c for c in campos_extra if c not in campos])
+    return len(casos), duplicados
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Detecta y consolida casos de prueba casi duplicados.")
+    parser.add_argument("entrada", help="CSV o JSONL de casos (p. ej. casos_prueba.csv).")
+    parser.add_argument("--salida", default=None,
+                        help="Archivo de salida (por defecto <entrada>_sin_duplicados).")
+    parser.add_argument("--modo", choices=MODOS, default=MODO_FUSIONAR,
+                        help="marcar: agrega duplicado_de; fusionar: deja uno por grupo con sus origenes.")
+    parser.add_argument("--umbral", type=float, default=DEFAULT_UMBRAL_DUPLICADOS,
+                        help="Similitud mínima (Jaccard de 3-gramas de palabras) para considerar duplicados.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    entrada = Path(args.entrada)
+    if not entrada.exists():
+        print(f"❌ No existe el archivo: {entrada}")
+        return 1
+    salida = args.salida or str(entrada.with_name(f"{entrada.stem}_sin_duplicados{entrada.suffix}"))
+
+    print(f"🔍 Buscando duplicados en {entrada} (umbral {args.umbral})...")
+    total, duplicados = deduplicar_archivo(entrada, salida, args.modo, args.umbral)
+    accion = "fusionados" if args.modo == MODO_FUSIONAR else "marcados"
+    print(f"✅ {duplicados} de {total} casos {accion} como duplicados → {salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,86 @@
+import re
+import unicodedata
+
+# ==============================
+# DIVISIÓN DE HUs POR CRITERIO DE ACEPTACIÓN
+# ==============================
+
+DEFAULT_CRITERIOS_POR_BLOQUE = 8
+DEFAULT_UMBRAL_DIVISION = 15
+
+_ENCABEZADO_CRITERIOS = re.compile(r"criterios?\s+de\s+aceptacion|acceptance\s+criteria", re.IGNORECASE)
+_INICIO_CRITERIO = re.compile(
+    r"^\s*(?:[-*•·]\s+|\d+\s*[.)-]\s*|[a-zA-Z]\)\s+|(?:CA|AC)\s*-?\s*\d+\s*[:.)-]?\s*"
+    r"|criterio\s+\d+\s*[:.)-]?\s*|escenario\s*\d*\s*[:.)-]\s*)",
+    re.IGNORECASE,
+)
+
+
+def _sin_acentos(texto: str):
+    return "".join(
+        c for c in unicodedata.normalize("NFD", texto) if unicodedata.category(c) != "Mn"
+    )
+
+
+def dividir_hu(hu_texto: str):
+    """
+    Separa una HU en (narrativa, [criterios]).
+
+    La narrativa es todo lo anterior al encabezado "Criterios de aceptación"
+    (o "Acceptance criteria"); cada criterio es un ítem con viñeta o numeración,
+    incluidas sus líneas de continuación. Si no hay encabezado se devuelve
+    (hu_texto, []).
+    """
+    lineas = hu_texto.splitlines()
+    indice_encabezado = None
+    for i, linea in enumerate(lineas):
+        if _ENCABEZADO_CRITERIOS.search(_sin_acentos(linea)):
+            indice_encabezado = i
+            break
+
+    if indice_encabezado is None:
+        return hu_texto.strip(), []
+
+    narrativa = "\n".join(lineas[:indice_encabezado]).strip()
+    criterios = []
+    actual = []
+
+    for linea in lineas[indice_encabezado + 1:]:
+        if not linea.strip():
+            continue
+        if _INICIO_CRITERIO.match(linea) or not actual:
+            if actual:
+                criterios.append("\n".join(actual).strip())
+            actual = [linea.strip()]
+        else:
+            actual.append(linea.strip())
+
+    if actual:
+        criterios.append("\n".join(actual).strip())
+
+    return narrativa, criterios
+
+
+def agrupar_criterios(criterios, criterios_por_bloque=DEFAULT_CRITERIOS_POR_BLOQUE):
+    """Parte la lista de criterios en bloques consecutivos de tamaño fijo."""
+    tamano = max(1, int(criterios_por_bloque))
+    return [criterios[i:i + tamano] for i in range(0, len(criterios), tamano)]
+
+
+def construir_hu_parcial(narrativa: str, criterios_bloque, indice: int, total: int):
+    """Arma el texto de una parte: la narrativa completa más solo sus criterios."""
+    criterios_texto = "\n".join(criterios_bloque)
+    return (
+        f"{narrativa}\n\n"
+        f"CRITERIOS DE ACEPTACIÓN (parte {indice} de {total}):\n"
+        f"{criterios_texto}\n\n"
+        f"NOTA: genera casos SOLO para los criterios de esta parte; "
+        f"los demás criterios de la HU se cubren por separado."
+    )
+
+
+def renumerar_casos(casos, prefijo="CP"):
+    """Asigna id_caso contiguos (CP-001..CP-N) en el orden recibido."""
+    for i, caso in enumerate(casos, start=1):
+        caso["id_caso"] = f"{prefijo}-{i:03d}"
+    return casos
@@ -0,0 +1,82 @@
+import re
+import json
+
+# ==============================
+# EMPAQUETADO DE HUs PEQUEÑAS
+# ==============================
+
+DEFAULT_PRESUPUESTO_PAQUETE = 2000
+DEFAULT_MAX_HUS_POR_PAQUETE = 5
+
+INSTRUCCIONES_EMPAQUETADO = """
+ATENCIÓN: en este pedido vienen VARIAS HUs, cada una marcada con "=== HU-<n> ===" (HU-1, HU-2...).
+Genera los casos de cada HU por separado y devuelve UN ÚNICO objeto JSON cuyas
+claves sean exactamente esos identificadores y cuyos valores sean el array de
+casos de esa HU, con el formato indicado arriba. Numera "id_caso" desde CP-001
+dentro de cada HU. Ejemplo: {"HU-1": [ ... ], "HU-2": [ ... ]}
+"""
+
+
+def identificador_paquete(posicion: int):
+    return f"HU-{posicion}"
+
+
+def agrupar_hus(hus, estimar_tokens, presupuesto_tokens=DEFAULT_PRESUPUESTO_PAQUETE,
+                max_hus_por_paquete=DEFAULT_MAX_HUS_POR_PAQUETE):
+    """
+    Agrupa HUs consecutivas en paquetes bajo un presupuesto de tokens.
+
+    hus: iterable de (indice, nombre, texto). Produce listas de esos mismos
+    elementos. Las HUs que por sí solas superan la mitad del presupuesto
+    salen en un paquete propio.
+    """
+    paquete = []
+    tokens_paquete = 0
+
+    for elemento in hus:
+        tokens = estimar_tokens(elemento[2])
+        if tokens > presupuesto_tokens // 2:
+            yield [elemento]
+            continue
+        if paquete and (tokens_paquete + tokens > presupuesto_tokens
+                        or len(paquete) >= max_hus_por_paquete):
+            yield paquete
+            paquete = []
+            tokens_paquete = 0
+        paquete.append(elemento)
+        tokens_paquete += tokens
+
+    if paquete:
+        yield paquete
+
+
+def construir_texto_paquete(paquete):
+    """Concatena las HUs del paquete, cada una bajo su identificador."""
+    secciones = []
+    for posicion, (_, _, texto) in enumerate(paquete, start=1):
+        secciones.append(f"=== {identificador_paquete(posicion)} ===\n{texto.strip()}")
+    return "\n\n".join(secciones)
+
+
+def repartir_respuesta_paquete(texto: str, cantidad: int):
+    """
+    Separa la respuesta de un paquete por identificador de HU.
+
+    Devuelve {posicion: [casos]} solo para las HUs cuyo array se pudo
+    atribuir y decodificar; las que falten deben pedirse por separado.
+    """
+    decoder = json.JSONDecoder()
+    repartidos = {}
+
+    for posicion in range(1, cantidad + 1):
+        clave = re.search(r'"%s"\s*:\s*\[' % re.escape(identificador_paquete(posicion)), texto)
+        if not clave:
+            continue
+        try:
+            casos, _ = decoder.raw_decode(texto, clave.end() - 1)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(casos, list) and all(isinstance(c, dict) for c in casos):
+            repartidos[posicion] = casos
+
+    return repartidos
@@ -0,0 +1,111 @@
+# ==============================
+# HISTORIAL DEL CHAT CON VENTANA DE TOKENS
+# ==============================
+
+DEFAULT_PRESUPUESTO_HISTORIAL = 3000
+DEFAULT_PRESUPUESTO_RESUMEN = 400
+
+ROL_USUARIO = "user"
+ROL_MODELO = "model"
+
+PROMPT_RESUMEN_CHAT = """
+Resume la siguiente conversación entre un usuario y un asistente QA en un máximo
+de {max_palabras} palabras. Conserva las HUs, criterios de aceptación y casos de
+prueba mencionados, las decisiones tomadas y las preguntas que quedaron abiertas.
+Devuelve solo el resumen, sin introducciones.
+
+Resumen anterior (puede estar vacío):
+{resumen_previo}
+
+Conversación a incorporar:
+{conversacion}
+"""
+
+
+class HistorialChat:
+    """
+    Historial multi-turno del chat acotado por tokens.
+
+    Los turnos más recientes que entran en presupuesto_tokens se envían tal
+    cual al modelo; los anteriores se condensan en un resumen con compactar().
+    Así el prompt no crece con la sesión y el contexto viejo no se pierde.
+    estimar_tokens: función texto -> tokens aproximados.
+    """
+
+    def __init__(self, estimar_tokens, presupuesto_tokens=DEFAULT_PRESUPUESTO_HISTORIAL,
+                 presupuesto_resumen=DEFAULT_PRESUPUESTO_RESUMEN):
+        self.estimar_tokens = estimar_tokens
+        self.presupuesto_tokens = presupuesto_tokens
+        self.presupuesto_resumen = presupuesto_resumen
+        self.turnos = []  # (rol, texto, tokens)
+        self.resumen = ""
+
+    def agregar(self, rol, texto):
+        self.turnos.append((rol, texto, self.estimar_tokens(texto)))
+
+    def limpiar(self):
+        self.turnos = []
+        self.resumen = ""
+
+    def _inicio_ventana(self):
+        """Índice del turno más antiguo que todavía entra en el presupuesto."""
+        total = 0
+        inicio = len(self.turnos)
+        for i in range(len(self.turnos) - 1, -1, -1):
+            total += self.turnos[i][2]
+            if total > self.presupuesto_tokens:
+                break
+            inicio = i
+        # La ventana arranca en una pregunta para no dejar una respuesta huérfana
+        while inicio < len(self.turnos) and self.turnos[inicio][0] != ROL_USUARIO:
+            inicio += 1
+        return inicio
+
+    def ventana(self):
+        return self.turnos[self._inicio_ventana():]
+
+    def tokens_contexto(self):
+        return sum(t for _, _, t in self.ventana()) + (self.estimar_tokens(self.resumen) if self.resumen else 0)
+
+    def necesita_compactar(self):
+        return self._inicio_ventana() > 0
+
+    def contenidos(self, mensaje):
+        """
+        Conversación para generate_content: resumen + ventana + mensaje actual
+        (en el formato de contents de la API de Gemini).
+        """
+        if self.resumen:
+            mensaje = f"**Resumen de la conversación anterior:**\n{self.resumen}\n\n{mensaje}"
+        contenidos = [{"role": rol, "parts": [{"text": texto}]} for rol, texto, _ in self.ventana()]
+        contenidos.append({"role": ROL_USUARIO, "parts": [{"text": mensaje}]})
+        return contenidos
+
+    def compactar(self, model):
+        """
+        Pasa al resumen los turnos que quedaron fuera de la ventana, con una
+        solicitud aparte al modelo. Si la solicitud falla, la excepción sube
+        y esos turnos quedan para el próximo intento (igual ya no se envían).
+        """
+        corte = self._inicio_ventana()
+        if corte == 0:
+            return False
+
+        conversacion = "\n".join(
+            f"{'Usuario' if rol == ROL_USUARIO else 'Asistente'}: {texto}"
+            for rol, texto, _ in self.turnos[:corte]
+        )
+        respuesta = model.generate_content(PROMPT_RESUMEN_CHAT.format(
+            max_palabras=self.presupuesto_resumen * 3 // 4,
+            resumen_previo=self.resumen or "(vacío)",
+            conversacion=conversacion,
+        ))
+        resumen = respuesta.text.strip()
+
+        tokens = self.estimar_tokens(resumen)
+        if tokens > self.presupuesto_resumen:
+            resumen = resumen[:len(resumen) * self.presupuesto_resumen // tokens]
+
+        self.resumen = resumen
+        del self.turnos[:corte]
+        return True
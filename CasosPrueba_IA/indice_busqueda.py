@@ -0,0 +1,149 @@
+import re
+import math
+import heapq
+import unicodedata
+from collections import namedtuple, Counter, defaultdict
+
+from division_hu import dividir_hu
+
+# ==============================
+# ÍNDICE BM25 PARA EL CHAT
+# ==============================
+
+DEFAULT_TOP_K = 6
+DEFAULT_PALABRAS_POR_PASAJE = 120
+DEFAULT_CRITERIOS_POR_PASAJE = 3
+
+_PALABRA = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+a al algo ante como con cual cuando de del desde donde el ella en entre es esa ese
+esta este esto hay la las le les lo los mas me mi muy no o para pero por que quiero
+se segun si sin sobre su sus tambien tiene un una uno unos y ya yo
+the of and to in is for on with as be that this it or by an are from
+""".split())
+
+Pasaje = namedtuple("Pasaje", ["origen", "texto"])
+
+
+def tokenizar(texto: str):
+    """Minúsculas, sin acentos y sin palabras vacías."""
+    plano = texto.lower()
+    if not plano.isascii():
+        plano = "".join(
+            c for c in unicodedata.normalize("NFD", plano) if unicodedata.category(c) != "Mn"
+        )
+    return [p for p in _PALABRA.findall(plano) if len(p) > 1 and p not in STOPWORDS]
+
+
+class IndiceBM25:
+    """
+    Índice invertido en memoria con ranking BM25 (Okapi).
+
+    Se pueden agregar pasajes en cualquier momento: los IDF se calculan al
+    buscar, así que el índice de las HUs puede crecer luego con los casos.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.pasajes = []
+        self._longitudes = []
+        self._postings = defaultdict(list)  # término -> [(id_pasaje, frecuencia)]
+        self._longitud_total = 0
+
+    def __len__(self):
+        return len(self.pasajes)
+
+    def agregar(self, origen, texto):
+        # El origen (nombre de archivo, id de caso) también se indexa
+        terminos = tokenizar(f"{origen}\n{texto}")
+        if not terminos:
+            return
+        id_pasaje = len(self.pasajes)
+        self.pasajes.append(Pasaje(origen, texto))
+        self._longitudes.append(len(terminos))
+        self._longitud_total += len(terminos)
+        for termino, frecuencia in Counter(terminos).items():
+            self._postings[termino].append((id_pasaje, frecuencia))
+
+    def buscar(self, consulta, k=DEFAULT_TOP_K):
+        """Devuelve hasta k (puntaje, Pasaje) ordenados de mayor a menor relevancia."""
+        if not self.pasajes:
+            return []
+        total = len(self.pasajes)
+        promedio = self._longitud_total / total
+        puntajes = defaultdict(float)
+
+        for termino in set(tokenizar(consulta)):
+            postings = self._postings.get(termino)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for id_pasaje, frecuencia in postings:
+                normalizacion = self.k1 * (1 - self.b + self.b * self._longitudes[id_pasaje] / promedio)
+                puntajes[id_pasaje] += idf * frecuencia * (self.k1 + 1) / (frecuencia + normalizacion)
+
+        mejores = heapq.nlargest(k, puntajes.items(), key=lambda item: item[1])
+        return [(puntaje, self.pasajes[id_pasaje]) for id_pasaje, puntaje in mejores]
+
+
+def _ventanas_palabras(texto, palabras_por_pasaje):
+    palabras = texto.split()
+    for i in range(0, len(palabras), palabras_por_pasaje):
+        yield " ".join(palabras[i:i + palabras_por_pasaje])
+
+
+def pasajes_hu(nombre, texto, palabras_por_pasaje=DEFAULT_PALABRAS_POR_PASAJE,
+               criterios_por_pasaje=DEFAULT_CRITERIOS_POR_PASAJE):
+    """Parte una HU en pasajes: la narrativa (en ventanas) y los criterios de a grupos."""
+    narrativa, criterios = dividir_hu(texto)
+    for i, ventana in enumerate(_ventanas_palabras(narrativa, palabras_por_pasaje), start=1):
+        yield Pasaje(f"HU {nombre} · descripción" + (f" ({i})" if i > 1 else ""), ventana)
+    for i in range(0, len(criterios), criterios_por_pasaje):
+        grupo = criterios[i:i + criterios_por_pasaje]
+        yield Pasaje(f"HU {nombre} · criterios {i + 1}-{i + len(grupo)}", "\n".join(grupo))
+
+
+def pasaje_caso(caso):
+    pasos = caso.get("pasos", "")
+    if isinstance(pasos, list):
+        pasos = " ".join(pasos)
+    texto = (
+        f"{caso.get('descripcion', '')}\n"
+        f"Tipo: {caso.get('tipo_prueba', '')} · Prioridad: {caso.get('prioridad', '')}\n"
+        f"Criterio: {caso.get('criterio', '')}\n"
+        f"Precondiciones: {caso.get('precondiciones', '')}\n"
+        f"Pasos: {pasos}\n"
+        f"Resultado esperado: {caso.get('resultado_esperado', '')}"
+    )
+    return Pasaje(f"Caso {caso.get('id_caso', '?')} de {caso.get('archivo_hu', '?')}", texto)
+
+
+def construir_indice(hus, casos=()):
+    """hus: iterable de (nombre, texto); casos: dicts de casos generados."""
+    indice = IndiceBM25()
+    for nombre, texto in hus:
+        for pasaje in pasajes_hu(nombre, texto):
+            indice.agregar(*pasaje)
+    agregar_casos(indice, casos)
+    return indice
+
+
+def agregar_casos(indice, casos):
+    for caso in casos:
+        indice.agregar(*pasaje_caso(caso))
+
+
+def formatear_pasajes(resultados, estimar_tokens, max_tokens=1500):
+    """Une los pasajes recuperados (en orden de relevancia) hasta max_tokens."""
+    bloques = []
+    usados = 0
+    for _, pasaje in resultados:
+        bloque = f"[{pasaje.origen}]\n{pasaje.texto}"
+        tokens = estimar_tokens(bloque)
+        if bloques and usados + tokens > max_tokens:
+            break
+        bloques.append(bloque)
+        usados += tokens
+    return "\n\n".join(bloques)
@@ -0,0 +1,169 @@
+import os
+import json
+import codecs
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# ==============================
+# LECTURA PEREZOSA DE HUs
+# ==============================
+
+EXTENSIONES_HU = (".txt", ".md", ".jsonl")
+DEFAULT_LECTORES = 8
+
+# Orden de prueba: cp1252 antes que latin-1 porque los exportes de Windows usan
+# comillas y guiones en 0x80-0x9F, que en latin-1 serían caracteres de control
+CODIFICACIONES = ("utf-8", "cp1252", "latin-1")
+
+CAMPOS_TEXTO_JSONL = ("texto", "text", "contenido", "content", "descripcion", "description", "hu")
+CAMPOS_TITULO_JSONL = ("titulo", "title", "resumen", "summary")
+CAMPOS_ID_JSONL = ("id", "clave", "key", "nombre", "name")
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def decodificar(datos: bytes):
+    """
+    Decodifica bytes de origen desconocido: BOM si lo hay, luego UTF-8,
+    cp1252 y, como último recurso, latin-1 (que nunca falla).
+    Devuelve (texto, codificacion).
+    """
+    for bom, codificacion in _BOMS:
+        if datos.startswith(bom):
+            return datos.decode(codificacion), codificacion
+    for codificacion in CODIFICACIONES:
+        try:
+            return datos.decode(codificacion), codificacion
+        except UnicodeDecodeError:
+            continue
+    raise AssertionError("latin-1 decodifica cualquier secuencia de bytes")
+
+
+def recorrer_archivos(carpeta, extensiones=EXTENSIONES_HU, recursivo=True):
+    """Recorre la carpeta (y subcarpetas) sin listar todo de antemano; orden alfabético por carpeta."""
+    pendientes = [Path(carpeta)]
+    while pendientes:
+        actual = pendientes.pop()
+        with os.scandir(actual) as entradas:
+            entradas = sorted(entradas, key=lambda e: e.name)
+        subcarpetas = []
+        for entrada in entradas:
+            if entrada.name.startswith("."):
+                continue
+            if entrada.is_dir(follow_symlinks=False):
+                subcarpetas.append(Path(entrada.path))
+            elif entrada.is_file() and entrada.name.lower().endswith(extensiones):
+                yield Path(entrada.path)
+        if recursivo:
+            pendientes.extend(reversed(subcarpetas))
+
+
+def _hus_jsonl(nombre, lineas):
+    vistos = set()
+    for numero, linea in enumerate(lineas, start=1):
+        if isinstance(linea, bytes):
+            linea, _ = decodificar(linea)
+        if not linea.strip():
+            continue
+        try:
+            registro = json.loads(linea)
+        except json.JSONDecodeError as e:
+            print(f"   ⚠ {nombre}, línea {numero}: JSON inválido ({e.msg}), se omite")
+            continue
+
+        if isinstance(registro, str):
+            yield f"{nombre}#{numero}", registro
+            continue
+        if not isinstance(registro, dict):
+            print(f"   ⚠ {nombre}, línea {numero}: se esperaba un objeto o un texto, se omite")
+            continue
+
+        cuerpo = next((registro[c] for c in CAMPOS_TEXTO_JSONL if registro.get(c)), None)
+        if not cuerpo:
+            print(f"   ⚠ {nombre}, línea {numero}: sin campo de texto ({', '.join(CAMPOS_TEXTO_JSONL)}), se omite")
+            continue
+        titulo = next((registro[c] for c in CAMPOS_TITULO_JSONL if registro.get(c)), None)
+        identificador = next((registro[c] for c in CAMPOS_ID_JSONL if registro.get(c)), numero)
+        if isinstance(identificador, (dict, list)):
+            print(f"   ⚠ {nombre}, línea {numero}: id no es un valor simple, se usa el número de línea")
+            identificador = numero
+        identificador = str(identificador)
+        if identificador in vistos:
+            # El nombre identifica a la HU en el manifiesto: tiene que ser único
+            identificador = f"{identificador}~{numero}"
+        vistos.add(identificador)
+        yield f"{nombre}#{identificador}", f"{titulo}\n{cuerpo}" if titulo else str(cuerpo)
+
+
+def hus_de_bytes(nombre, datos: bytes):
+    """HUs contenidas en un archivo: una por .txt/.md, una por línea en .jsonl."""
+    if _es_jsonl(nombre):
+        return list(_hus_jsonl(nombre, datos.splitlines()))
+    texto, _ = decodificar(datos)
+    return [(nombre, texto)]
+
+
+def _es_jsonl(nombre):
+    return nombre.lower().endswith(".jsonl")
+
+
+def _hus_jsonl_archivo(ruta, nombre):
+    """Un .jsonl se lee línea a línea (cada una con su propia decodificación)."""
+    try:
+        with open(ruta, "rb") as f:
+            yield from _hus_jsonl(nombre, f)
+    except OSError as e:
+        print(f"   ⚠ No se pudo leer {nombre}: {e}")
+
+
+def _leer_archivo(ruta, nombre):
+    try:
+        return hus_de_bytes(nombre, ruta.read_bytes())
+    except OSError as e:
+        print(f"   ⚠ No se pudo leer {nombre}: {e}")
+        return []
+
+
+def leer_hus(carpeta, extensiones=EXTENSIONES_HU, recursivo=True, max_workers=DEFAULT_LECTORES):
+    """
+    Generador de (nombre, texto) para cada HU de la carpeta.
+
+    Los archivos se leen y decodifican en paralelo con una ventana acotada
+    (max_workers * 4 archivos adelantados), así la primera HU está disponible
+    enseguida y la memoria no crece con el tamaño de la carpeta. El nombre es
+    la ruta relativa a la carpeta (en carpetas planas, el nombre del archivo);
+    las HUs de un .jsonl se nombran archivo.jsonl#id y ese archivo se lee
+    línea a línea.
+    """
+    raiz = Path(carpeta)
+    # Se valida ya, no recién cuando se pide la primera HU
+    if not raiz.is_dir():
+        raise FileNotFoundError(f"La carpeta {carpeta} no existe.")
+    return _generar_hus(raiz, recorrer_archivos(raiz, extensiones, recursivo), max_workers)
+
+
+def _generar_hus(raiz, archivos, max_workers):
+    # La ventana guarda lecturas en curso (futures) y .jsonl pendientes
+    # (generadores, que se recorren recién al llegar su turno para mantener el orden)
+    ventana = deque()
+
+    def siguientes():
+        elemento = ventana.popleft()
+        return elemento if not hasattr(elemento, "result") else elemento.result()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for ruta in archivos:
+            nombre = ruta.relative_to(raiz).as_posix()
+            if _es_jsonl(nombre):
+                ventana.append(_hus_jsonl_archivo(ruta, nombre))
+            else:
+                ventana.append(executor.submit(_leer_archivo, ruta, nombre))
+            if len(ventana) >= max_workers * 4:
+                yield from siguientes()
+        while ventana:
+            yield from siguientes()
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+
+# ==============================
+# MANIFIESTO DE EJECUCIÓN
+# ==============================
+
+DEFAULT_RUTA_MANIFIESTO = "manifiesto_ejecucion.jsonl"
+
+ESTADO_OK = "ok"
+ESTADO_ERROR = "error"
+
+
+def hash_contenido(texto: str):
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def _escribir_atomico(ruta: Path, datos: str):
+    """Escribe a un temporal y lo renombra, para no dejar archivos a medias."""
+    temporal = ruta.with_name(ruta.name + ".tmp")
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+class ManifiestoEjecucion:
+    """
+    Registro persistente por HU de una corrida por lotes: hash del contenido,
+    estado (ok / error), cantidad de casos y archivo con los casos generados.
+
+    Cada HU terminada agrega una línea al manifiesto (JSONL) y la sincroniza
+    con el disco (checkpoint), así una corrida interrumpida se reanuda
+    procesando solo las HUs fallidas, nuevas o modificadas. Al cargarlo, la
+    última línea de cada HU es la que vale; una línea final cortada por la
+    interrupción se descarta.
+    """
+
+    def __init__(self, ruta=DEFAULT_RUTA_MANIFIESTO, carpeta_casos=None):
+        self.ruta = Path(ruta)
+        self.carpeta_casos = Path(carpeta_casos) if carpeta_casos else self.ruta.with_name(self.ruta.stem + "_casos")
+        self.entradas = {}
+        lineas = 0
+        if self.ruta.exists():
+            with open(self.ruta, encoding="utf-8") as f:
+                for linea in f:
+                    if not linea.strip():
+                        continue
+                    try:
+                        registro = json.loads(linea)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entradas[registro.pop("hu")] = registro
+                    lineas += 1
+        # Las HUs reprocesadas dejan líneas viejas: se compacta una vez por corrida
+        if lineas > len(self.entradas):
+            self.compactar()
+
+    def necesita_procesar(self, nombre, hash_hu):
+        """True si la HU no tiene un resultado exitoso para este mismo contenido."""
+        entrada = self.entradas.get(nombre)
+        if not entrada or entrada.get("hash") != hash_hu or entrada.get("estado") != ESTADO_OK:
+            return True
+        return not Path(entrada.get("salida", "")).exists()
+
+    def _ruta_casos(self, nombre, hash_hu):
+        # Por nombre y contenido: dos HUs con el mismo texto no comparten checkpoint
+        return self.carpeta_casos / f"{hash_contenido(nombre + chr(0) + hash_hu)}.json"
+
+    def registrar_exito(self, nombre, hash_hu, casos):
+        self.carpeta_casos.mkdir(parents=True, exist_ok=True)
+        salida = self._ruta_casos(nombre, hash_hu)
+        _escribir_atomico(salida, json.dumps(casos, ensure_ascii=False))
+        self._registrar(nombre, {
+            "hash": hash_hu,
+            "estado": ESTADO_OK,
+            "casos": len(casos),
+            "salida": str(salida),
+            "error": None,
+            "actualizado": time.time(),
+        })
+
+    def registrar_error(self, nombre, hash_hu, error):
+        anterior = self.entradas.get(nombre, {})
+        self._registrar(nombre, {
+            "hash": hash_hu,
+            "estado": ESTADO_ERROR,
+            "casos": 0,
+            "salida": None,
+            "error": str(error),
+            "intentos_fallidos": anterior.get("intentos_fallidos", 0) + 1,
+            "actualizado": time.time(),
+        })
+
+    def casos_guardados(self, nombre):
+        """Casos del último resultado exitoso de la HU ([] si no hay), con archivo_hu = nombre."""
+        entrada = self.entradas.get(nombre)
+        if not entrada or entrada.get("estado") != ESTADO_OK:
+            return []
+        casos = json.loads(Path(entrada["salida"]).read_text(encoding="utf-8"))
+        for caso in casos:
+            caso["archivo_hu"] = nombre
+        return casos
+
+    def _registrar(self, nombre, entrada):
+        self.entradas[nombre] = entrada
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.ruta, "a", encoding="utf-8") as f:
+            f.write(self._linea(nombre, entrada))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _linea(nombre, entrada):
+        return json.dumps({"hu": nombre, **entrada}, ensure_ascii=False) + "\n"
+
+    def compactar(self):
+        """Reescribe el manifiesto con una sola línea por HU."""
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        _escribir_atomico(self.ruta, "".join(self._linea(n, e) for n, e in self.entradas.items()))
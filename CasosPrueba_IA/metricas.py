@@ -0,0 +1,279 @@
+import json
+import time
+import heapq
+import threading
+from pathlib import Path
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from parser_json import MetricasRescate
+
+# ==============================
+# MÉTRICAS DE EJECUCIÓN
+# ==============================
+
+DEFAULT_RUTA_RESUMEN = "resumen_ejecucion.json"
+DEFAULT_RUTA_PROMETHEUS = "metricas.prom"
+
+BUCKETS_SEGUNDOS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PREFIJO = "casos_ia"
+
+
+class _Histograma:
+    """Histograma con buckets fijos más una muestra acotada para percentiles."""
+
+    def __init__(self, max_muestras=10000):
+        self.cuentas = [0] * len(BUCKETS_SEGUNDOS)
+        self.suma = 0.0
+        self.total = 0
+        self.muestras = deque(maxlen=max_muestras)
+
+    def observar(self, valor):
+        self.suma += valor
+        self.total += 1
+        self.muestras.append(valor)
+        for i, limite in enumerate(BUCKETS_SEGUNDOS):
+            if valor <= limite:
+                self.cuentas[i] += 1
+
+    def percentil(self, p):
+        if not self.muestras:
+            return 0.0
+        ordenados = sorted(self.muestras)
+        return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def _leer_uso(uso, campo):
+    if uso is None:
+        return 0
+    if isinstance(uso, dict):
+        return uso.get(campo) or 0
+    return getattr(uso, campo, 0) or 0
+
+
+def tokens_prompt(uso):
+    """(tokens de prompt, cuántos de ellos salieron de la caché de prefijo) de un usage_metadata."""
+    return _leer_uso(uso, "prompt_token_count"), _leer_uso(uso, "cached_content_token_count")
+
+
+class RegistroMetricas:
+    """
+    Registro (seguro entre hilos) de tiempos por etapa, tokens y contadores.
+
+    Cada HU se mide dentro de `with registro.hu(nombre)`; las etapas internas
+    (modelo, parseo, escritura...) se miden con `with registro.medir(etapa)` y
+    quedan asociadas a la HU del hilo actual. Solo se conservan agregados y las
+    HUs más lentas, así la memoria no crece con el tamaño del lote.
+    """
+
+    def __init__(self, max_hus_lentas=20):
+        self.max_hus_lentas = max_hus_lentas
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.inicio = time.time()
+            self.contadores = defaultdict(int)
+            self.histogramas = defaultdict(_Histograma)
+            self.tokens = defaultdict(int)
+            self._hus_lentas = []
+            self._en_curso = {}
+            # Rescate de respuestas rotas/truncadas, por corrida como el resto
+            self.rescate = MetricasRescate()
+
+    # --- Contexto de HU ---
+
+    def hu_actual(self):
+        return getattr(self._local, "hu", None)
+
+    @contextmanager
+    def asociar_hu(self, nombre):
+        """Asocia el hilo actual a una HU ya abierta (p. ej. bloques en paralelo)."""
+        anterior = self.hu_actual()
+        self._local.hu = nombre
+        try:
+            yield
+        finally:
+            self._local.hu = anterior
+
+    @contextmanager
+    def hu(self, nombre):
+        """Mide una HU completa y la registra entre las más lentas si corresponde."""
+        detalle = {"hu": nombre, "etapas": defaultdict(float), "tokens_prompt": 0,
+                   "tokens_respuesta": 0, "error": None}
+        with self._lock:
+            self._en_curso[nombre] = detalle
+        inicio = time.perf_counter()
+        try:
+            with self.asociar_hu(nombre):
+                yield
+        except Exception as e:
+            detalle["error"] = str(e)
+            self.incrementar("hus_error")
+            raise
+        else:
+            self.incrementar("hus_ok")
+        finally:
+            duracion = time.perf_counter() - inicio
+            with self._lock:
+                self._en_curso.pop(nombre, None)
+                self.histogramas["hu_total"].observar(duracion)
+                detalle["total_s"] = round(duracion, 4)
+                detalle["etapas"] = {k: round(v, 4) for k, v in detalle["etapas"].items()}
+                entrada = (duracion, id(detalle), detalle)
+                if len(self._hus_lentas) < self.max_hus_lentas:
+                    heapq.heappush(self._hus_lentas, entrada)
+                else:
+                    heapq.heappushpop(self._hus_lentas, entrada)
+
+    # --- Registro ---
+
+    @contextmanager
+    def medir(self, etapa):
+        """Mide una etapa; si falla, cuenta el error como errores_<etapa>."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.incrementar(f"errores_{etapa}")
+            raise
+        finally:
+            self.observar(etapa, time.perf_counter() - inicio)
+
+    def observar(self, etapa, segundos):
+        with self._lock:
+            self.histogramas[etapa].observar(segundos)
+            detalle = self._en_curso.get(self.hu_actual())
+            if detalle is not None:
+                detalle["etapas"][etapa] += segundos
+
+    def registrar_uso(self, uso):
+        """Suma los tokens del usage_metadata de una respuesta del modelo."""
+        prompt = _leer_uso(uso, "prompt_token_count")
+        respuesta = _leer_uso(uso, "candidates_token_count")
+        cacheados = _leer_uso(uso, "cached_content_token_count")
+        with self._lock:
+            self.tokens["prompt"] += prompt
+            self.tokens["respuesta"] += respuesta
+            self.tokens["prompt_cacheado"] += cacheados
+            detalle = self._en_curso.get(self.hu_actual())
+            if detalle is not None:
+                detalle["tokens_prompt"] += prompt
+                detalle["tokens_respuesta"] += respuesta
+
+    def incrementar(self, contador, valor=1):
+        with self._lock:
+            self.contadores[contador] += valor
+
+    # --- Exportación ---
+
+    def resumen(self, extra=None):
+        with self._lock:
+            duracion = time.time() - self.inicio
+            hus = self.contadores.get("hus_ok", 0) + self.contadores.get("hus_error", 0)
+            datos = {
+                "inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.inicio)),
+                "duracion_s": round(duracion, 3),
+                "hus_por_minuto": round(hus * 60 / duracion, 2) if duracion else 0.0,
+                "contadores": dict(self.contadores),
+                "tokens": dict(self.tokens),
+                "etapas": {
+                    etapa: {
+                        "cantidad": h.total,
+                        "total_s": round(h.suma, 4),
+                        "p50_s": round(h.percentil(50), 4),
+                        "p95_s": round(h.percentil(95), 4),
+                        "p99_s": round(h.percentil(99), 4),
+                    }
+                    for etapa, h in self.histogramas.items()
+                },
+                "hus_mas_lentas": [d for _, _, d in sorted(self._hus_lentas, reverse=True)],
+            }
+        if extra:
+            datos.update(extra)
+        return datos
+
+    def texto_prometheus(self, extra=None):
+        """Exposición en formato de texto de Prometheus."""
+        lineas = []
+        with self._lock:
+            lineas.append(f"# TYPE {PREFIJO}_eventos_total counter")
+            for nombre, valor in sorted(self.contadores.items()):
+                lineas.append(f'{PREFIJO}_eventos_total{{evento="{nombre}"}} {valor}')
+
+            lineas.append(f"# TYPE {PREFIJO}_tokens_total counter")
+            for tipo, valor in sorted(self.tokens.items()):
+                lineas.append(f'{PREFIJO}_tokens_total{{tipo="{tipo}"}} {valor}')
+
+            lineas.append(f"# TYPE {PREFIJO}_duracion_segundos histogram")
+            for etapa, h in sorted(self.histogramas.items()):
+                for limite, cuenta in zip(BUCKETS_SEGUNDOS, h.cuentas):
+                    lineas.append(f'{PREFIJO}_duracion_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {cuenta}')
+                lineas.append(f'{PREFIJO}_duracion_segundos_bucket{{etapa="{etapa}",le="+Inf"}} {h.total}')
+                lineas.append(f'{PREFIJO}_duracion_segundos_sum{{etapa="{etapa}"}} {h.suma:.6f}')
+                lineas.append(f'{PREFIJO}_duracion_segundos_count{{etapa="{etapa}"}} {h.total}')
+
+        if extra:
+            lineas.append(f"# TYPE {PREFIJO}_valor gauge")
+            for grupo, valores in sorted(extra.items()):
+                if not isinstance(valores, dict):
+                    continue
+                for clave, valor in sorted(valores.items()):
+                    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                        lineas.append(f'{PREFIJO}_valor{{grupo="{grupo}",clave="{clave}"}} {valor}')
+
+        return "\n".join(lineas) + "\n"
+
+    def exportar(self, ruta_json=None, ruta_prometheus=None, extra=None):
+        if ruta_json:
+            Path(ruta_json).write_text(
+                json.dumps(self.resumen(extra), indent=2, ensure_ascii=False), encoding="utf-8"
+            )
+        if ruta_prometheus:
+            Path(ruta_prometheus).write_text(self.texto_prometheus(extra), encoding="utf-8")
+
+
+class RegistroPorHilo:
+    """
+    Registro del hilo actual: el global del proceso, salvo dentro de
+    `with METRICAS.usar(registro)`. Así cada trabajo de la app (una sesión de
+    Streamlit) mide en su propio RegistroMetricas aunque el pipeline use
+    METRICAS. Los hilos auxiliares (pool, bloques, hedging) heredan el
+    registro y la HU del hilo que los lanza con propagar(funcion).
+    """
+
+    def __init__(self, por_defecto):
+        self._por_defecto = por_defecto
+        self._local = threading.local()
+
+    def actual(self):
+        return getattr(self._local, "registro", None) or self._por_defecto
+
+    @contextmanager
+    def usar(self, registro):
+        anterior = getattr(self._local, "registro", None)
+        self._local.registro = registro
+        try:
+            yield registro
+        finally:
+            self._local.registro = anterior
+
+    def propagar(self, funcion):
+        """Envuelve funcion para correrla en otro hilo con el registro y la HU del hilo actual."""
+        registro = self.actual()
+        hu = registro.hu_actual()
+
+        def envuelta(*args, **kwargs):
+            with self.usar(registro), registro.asociar_hu(hu):
+                return funcion(*args, **kwargs)
+
+        return envuelta
+
+    def __getattr__(self, nombre):
+        return getattr(self.actual(), nombre)
+
+
+# Registro global del proceso (como el registro por defecto de Prometheus)
+METRICAS = RegistroPorHilo(RegistroMetricas())
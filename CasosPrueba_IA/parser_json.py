@@ -0,0 +1,177 @@
+import re
+import json
+import threading
+from collections import deque, namedtuple
+
+# ==============================
+# PARSER INCREMENTAL DE ARRAYS JSON
+# ==============================
+
+
+class ParserArrayIncremental:
+    """
+    Recibe la respuesta del modelo en fragmentos y entrega cada objeto del
+    array JSON de nivel superior apenas se cierra su llave.
+
+    Ignora el texto previo al primer "[" (por ejemplo ```json) y todo lo que
+    venga después del "]" final. Solo guarda en memoria el objeto en curso.
+    """
+
+    def __init__(self):
+        self.iniciado = False
+        self.terminado = False
+        self._profundidad = 0
+        self._en_string = False
+        self._escape = False
+        self._actual = []
+        self.descartados = []
+
+    def alimentar(self, fragmento: str):
+        """Procesa un fragmento y devuelve la lista de objetos completados en él."""
+        completos = []
+        if self.terminado or not fragmento:
+            return completos
+
+        inicio_objeto = 0 if self._profundidad else None
+        for i, ch in enumerate(fragmento):
+            if not self.iniciado:
+                if ch == "[":
+                    self.iniciado = True
+                continue
+
+            if self._profundidad == 0:
+                if ch == "{":
+                    self._profundidad = 1
+                    inicio_objeto = i
+                elif ch == "]":
+                    self.terminado = True
+                    break
+                continue
+
+            if self._en_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._en_string = False
+            elif ch == '"':
+                self._en_string = True
+            elif ch == "{":
+                self._profundidad += 1
+            elif ch == "}":
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    self._actual.append(fragmento[inicio_objeto:i + 1])
+                    texto_objeto = "".join(self._actual)
+                    self._actual = []
+                    inicio_objeto = None
+                    try:
+                        completos.append(json.loads(texto_objeto))
+                    except json.JSONDecodeError:
+                        # Un objeto mal formado no invalida el resto del array
+                        self.descartados.append(texto_objeto)
+
+        if self._profundidad and inicio_objeto is not None:
+            self._actual.append(fragmento[inicio_objeto:])
+        return completos
+
+    @property
+    def pendiente(self):
+        """Texto del objeto que quedó abierto (útil para diagnosticar cortes)."""
+        return "".join(self._actual)
+
+
+# ==============================
+# RESCATE DE RESPUESTAS ROTAS O TRUNCADAS
+# ==============================
+
+ResultadoRescate = namedtuple("ResultadoRescate", ["casos", "descartados", "truncado"])
+
+_SEPARADOR_OBJETOS = re.compile(r"\}\s*,\s*\{")
+_ID_CASO = re.compile(r'"id_caso"\s*:\s*"([^"]+)"')
+
+
+def describir_descartado(fragmento: str):
+    """Identifica un objeto descartado por su id_caso o, si no lo tiene, por su inicio."""
+    coincidencia = _ID_CASO.search(fragmento)
+    if coincidencia:
+        return coincidencia.group(1)
+    return fragmento.strip()[:60]
+
+
+def rescatar_casos(texto: str):
+    """
+    Recupera todos los objetos completos de un array JSON roto o cortado.
+
+    Decodifica objeto por objeto; si uno está mal formado lo salta hasta el
+    siguiente separador "},{" y sigue. Devuelve ResultadoRescate con los casos
+    recuperados, la descripción de los descartados y si el array quedó sin cerrar.
+    """
+    decoder = json.JSONDecoder()
+    casos = []
+    descartados = []
+    inicio = texto.find("[")
+    pos = inicio + 1 if inicio != -1 else 0
+    truncado = True
+
+    while True:
+        siguiente = texto.find("{", pos)
+        cierre = texto.find("]", pos)
+        if cierre != -1 and (siguiente == -1 or cierre < siguiente) and not texto[pos:cierre].strip(" \t\r\n,"):
+            truncado = False
+            break
+        if siguiente == -1:
+            break
+        try:
+            objeto, fin = decoder.raw_decode(texto, siguiente)
+            if isinstance(objeto, dict):
+                casos.append(objeto)
+            pos = fin
+        except json.JSONDecodeError:
+            separador = _SEPARADOR_OBJETOS.search(texto, siguiente + 1)
+            fin = separador.start() + 1 if separador else len(texto)
+            descartados.append(describir_descartado(texto[siguiente:fin]))
+            pos = fin
+
+    return ResultadoRescate(casos, descartados, truncado)
+
+
+class MetricasRescate:
+    """Contadores (seguros entre hilos) del rescate de respuestas JSON rotas."""
+
+    def __init__(self, max_detalle=200):
+        self._lock = threading.Lock()
+        self.respuestas_rotas = 0
+        self.respuestas_rescatadas = 0
+        self.casos_rescatados = 0
+        self.casos_descartados = 0
+        self.solicitudes_continuacion = 0
+        self.detalle_descartados = deque(maxlen=max_detalle)
+
+    def registrar_rescate(self, resultado, referencia=""):
+        with self._lock:
+            self.respuestas_rotas += 1
+            if resultado.casos:
+                self.respuestas_rescatadas += 1
+            self.casos_rescatados += len(resultado.casos)
+            self.casos_descartados += len(resultado.descartados)
+            for descartado in resultado.descartados:
+                self.detalle_descartados.append({"hu": referencia, "caso": descartado})
+
+    def registrar_continuacion(self):
+        with self._lock:
+            self.solicitudes_continuacion += 1
+
+    def como_dict(self):
+        with self._lock:
+            return {
+                "respuestas_rotas": self.respuestas_rotas,
+                "respuestas_rescatadas": self.respuestas_rescatadas,
+                "tasa_rescate": (self.respuestas_rescatadas / self.respuestas_rotas
+                                 if self.respuestas_rotas else 0.0),
+                "casos_rescatados": self.casos_rescatados,
+                "casos_descartados": self.casos_descartados,
+                "solicitudes_continuacion": self.solicitudes_continuacion,
+                "detalle_descartados": list(self.detalle_descartados),
+            }
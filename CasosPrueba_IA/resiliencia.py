@@ -0,0 +1,486 @@
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from metricas import METRICAS
+
+# ==============================
+# RESILIENCIA: REINTENTOS, CONCURRENCIA ADAPTATIVA Y CIRCUIT BREAKER
+# ==============================
+
+DEFAULT_MAX_INTENTOS = 4
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_MAXIMO = 60.0
+
+CODIGOS_CUOTA = {429}
+CODIGOS_REINTENTABLES = {429, 500, 502, 503, 504}
+CLASES_CUOTA = {"ResourceExhausted", "TooManyRequests"}
+CLASES_REINTENTABLES = CLASES_CUOTA | {
+    "ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+    "BadGateway", "Timeout", "ConnectionError", "ReadTimeout",
+}
+
+
+class CircuitoAbiertoError(RuntimeError):
+    """El modelo sigue fallando después de varias pausas: se corta el lote."""
+
+
+def _codigo(error):
+    codigo = getattr(error, "code", None)
+    if callable(codigo):
+        try:
+            codigo = codigo()
+        except Exception:
+            codigo = None
+    codigo = getattr(codigo, "value", codigo)
+    if isinstance(codigo, tuple):
+        codigo = codigo[0]
+    return codigo if isinstance(codigo, int) else None
+
+
+def es_error_cuota(error):
+    """True para errores de cuota / rate limit (HTTP 429, ResourceExhausted)."""
+    if _codigo(error) in CODIGOS_CUOTA or type(error).__name__ in CLASES_CUOTA:
+        return True
+    mensaje = str(error).lower()
+    return "429" in mensaje or "quota" in mensaje or "rate limit" in mensaje
+
+
+def es_error_reintentable(error):
+    """True para errores transitorios: cuota, 5xx, timeouts y cortes de conexión."""
+    if es_error_cuota(error):
+        return True
+    if _codigo(error) in CODIGOS_REINTENTABLES or type(error).__name__ in CLASES_REINTENTABLES:
+        return True
+    mensaje = str(error).lower()
+    return any(marca in mensaje for marca in ("503", "unavailable", "timeout", "deadline"))
+
+
+class PoliticaReintentos:
+    """
+    Backoff exponencial con jitter completo y presupuesto de reintentos.
+
+    El presupuesto limita los reintentos a una fracción de las solicitudes
+    (más un mínimo fijo), para que una caída del servicio no multiplique la
+    carga sobre la cuota.
+    """
+
+    def __init__(self, max_intentos=DEFAULT_MAX_INTENTOS, base=DEFAULT_BACKOFF_BASE,
+                 maximo=DEFAULT_BACKOFF_MAXIMO, fraccion_presupuesto=0.2, minimo_presupuesto=10,
+                 azar=None):
+        self.max_intentos = max_intentos
+        self.base = base
+        self.maximo = maximo
+        self.fraccion_presupuesto = fraccion_presupuesto
+        self.minimo_presupuesto = minimo_presupuesto
+        self._azar = azar or random.Random()
+        self._lock = threading.Lock()
+        self.solicitudes = 0
+        self.reintentos = 0
+
+    def registrar_solicitud(self):
+        with self._lock:
+            self.solicitudes += 1
+
+    def consumir_reintento(self):
+        """Devuelve False si el presupuesto de reintentos está agotado."""
+        with self._lock:
+            limite = self.minimo_presupuesto + self.fraccion_presupuesto * self.solicitudes
+            if self.reintentos >= limite:
+                return False
+            self.reintentos += 1
+            return True
+
+    def espera(self, intento):
+        """Segundos a esperar antes del reintento número `intento` (1, 2, ...)."""
+        tope = min(self.maximo, self.base * (2 ** (intento - 1)))
+        return self._azar.uniform(0, tope)
+
+
+class ConcurrenciaAdaptativa:
+    """
+    Límite de solicitudes simultáneas con control AIMD: se reduce a la mitad
+    ante un error de cuota y crece de a una solicitud por cada "ventana" de
+    éxitos (tantos éxitos como el límite actual).
+    """
+
+    def __init__(self, inicial=4, minimo=1, maximo=32, factor_reduccion=0.5):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.factor_reduccion = factor_reduccion
+        self.limite = float(max(minimo, min(inicial, maximo)))
+        self.en_vuelo = 0
+        # Límite previo a la última reducción: hasta recuperarlo se está retrocediendo
+        self._limite_previo = self.limite
+        self._condicion = threading.Condition()
+
+    def adquirir(self):
+        with self._condicion:
+            while self.en_vuelo >= int(self.limite):
+                self._condicion.wait()
+            self.en_vuelo += 1
+
+    def liberar(self, exito, error_cuota=False):
+        with self._condicion:
+            self.en_vuelo -= 1
+            if error_cuota:
+                self._limite_previo = max(self._limite_previo, self.limite)
+                self.limite = max(self.minimo, self.limite * self.factor_reduccion)
+            elif exito:
+                self.limite = min(self.maximo, self.limite + 1.0 / self.limite)
+            self._condicion.notify_all()
+
+    @property
+    def retrocediendo(self):
+        """True mientras el límite no recupera el valor que tenía antes del último error de cuota."""
+        with self._condicion:
+            return self.limite < self._limite_previo
+
+
+class InterruptorCircuito:
+    """
+    Circuit breaker: tras `umbral_fallos` errores seguidos se abre y pausa
+    todas las llamadas durante `pausa` segundos; luego deja pasar una prueba
+    (semiabierto). Si se abre `max_aperturas` veces seguidas sin un éxito,
+    las llamadas fallan de inmediato con CircuitoAbiertoError.
+    """
+
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(self, umbral_fallos=5, pausa=30.0, max_aperturas=5,
+                 reloj=time.monotonic, dormir=time.sleep):
+        self.umbral_fallos = umbral_fallos
+        self.pausa = pausa
+        self.max_aperturas = max_aperturas
+        self._reloj = reloj
+        self._dormir = dormir
+        self._lock = threading.Lock()
+        self.estado = self.CERRADO
+        self.fallos_seguidos = 0
+        self.aperturas_seguidas = 0
+        self._reabre_en = 0.0
+        self._prueba_en_curso = False
+
+    def antes_de_llamar(self):
+        """
+        Bloquea mientras el circuito está abierto (pausa el lote). Devuelve
+        True si esta llamada es la prueba del estado semiabierto: quien la
+        hace debe terminarla con registrar_exito, registrar_fallo o
+        liberar_prueba, o las demás llamadas quedan esperando.
+        """
+        while True:
+            with self._lock:
+                if self.aperturas_seguidas >= self.max_aperturas:
+                    raise CircuitoAbiertoError(
+                        f"El modelo falló tras {self.aperturas_seguidas} pausas consecutivas; se detiene el lote."
+                    )
+                if self.estado == self.CERRADO:
+                    return False
+                ahora = self._reloj()
+                if self.estado == self.ABIERTO and ahora >= self._reabre_en:
+                    self.estado = self.SEMIABIERTO
+                if self.estado == self.SEMIABIERTO and not self._prueba_en_curso:
+                    self._prueba_en_curso = True
+                    return True
+                espera = max(self._reabre_en - ahora, 0.05)
+            self._dormir(espera)
+
+    def registrar_exito(self):
+        with self._lock:
+            self.estado = self.CERRADO
+            self.fallos_seguidos = 0
+            self.aperturas_seguidas = 0
+            self._prueba_en_curso = False
+
+    def liberar_prueba(self):
+        """La prueba terminó sin decidir nada (p. ej. un error 4xx): la próxima llamada vuelve a probar."""
+        with self._lock:
+            self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self.fallos_seguidos += 1
+            if self.estado == self.SEMIABIERTO or self.fallos_seguidos >= self.umbral_fallos:
+                if self.estado != self.ABIERTO:
+                    self.aperturas_seguidas += 1
+                    METRICAS.incrementar("aperturas_circuito")
+                self.estado = self.ABIERTO
+                self._reabre_en = self._reloj() + self.pausa
+                self._prueba_en_curso = False
+
+
+class StreamLimitado:
+    """
+    Stream que ocupa su lugar en la ConcurrenciaAdaptativa hasta agotarse,
+    fallar o cerrarse: una generación en streaming cuenta como en vuelo
+    mientras se reciben sus fragmentos, no solo al abrirla. Si se descarta
+    sin consumirlo, el lugar se libera al recolectarlo.
+    """
+
+    def __init__(self, stream, concurrencia):
+        self._stream = stream
+        self._iterador = iter(stream)
+        self._concurrencia = concurrencia
+        self._liberado = False
+        self._lock = threading.Lock()
+
+    def __getattr__(self, nombre):
+        if nombre.startswith("_"):
+            raise AttributeError(nombre)
+        return getattr(self._stream, nombre)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterador)
+        except StopIteration:
+            self._liberar(exito=True)
+            raise
+        except Exception as e:
+            self._liberar(exito=False, error_cuota=es_error_cuota(e))
+            raise
+        except BaseException:
+            self._liberar(exito=False)
+            raise
+
+    def close(self):
+        try:
+            cerrar = getattr(self._iterador, "close", None)
+            if callable(cerrar):
+                cerrar()
+        finally:
+            self._liberar(exito=False)
+
+    def _liberar(self, exito, error_cuota=False):
+        with self._lock:
+            if self._liberado:
+                return
+            self._liberado = True
+        self._concurrencia.liberar(exito=exito, error_cuota=error_cuota)
+
+    def __del__(self):
+        if not getattr(self, "_liberado", True):
+            self._liberar(exito=False)
+
+
+class ModeloResiliente:
+    """
+    Envuelve un GenerativeModel (o cualquier objeto con generate_content) y
+    le agrega reintentos con backoff, concurrencia adaptativa y circuit
+    breaker. Se usa en lugar del modelo: el resto del pipeline no cambia.
+    En streaming solo se reintenta la apertura del stream, pero el lugar en
+    la concurrencia se ocupa hasta terminar de consumirlo (StreamLimitado).
+    """
+
+    def __init__(self, model, politica=None, concurrencia=None, interruptor=None, dormir=time.sleep,
+                 hedging=None):
+        self._model = model
+        self.politica = politica or PoliticaReintentos()
+        self.concurrencia = concurrencia
+        self.interruptor = interruptor or InterruptorCircuito()
+        self._dormir = dormir
+        # El control de hedging aprende la latencia de cada intento (sin backoff) y
+        # no duplica solicitudes mientras el servicio está saturado
+        self.hedging = hedging
+        if hedging is not None:
+            hedging.vincular(self.en_contencion)
+
+    def en_contencion(self):
+        """True con el circuito abierto o semiabierto, o mientras AIMD recupera el límite."""
+        if self.interruptor.estado != InterruptorCircuito.CERRADO:
+            return True
+        return self.concurrencia is not None and self.concurrencia.retrocediendo
+
+    def __getattr__(self, nombre):
+        # model_name, _generation_config, start_chat, ... se delegan al modelo real
+        return getattr(self._model, nombre)
+
+    def generate_content(self, *args, **kwargs):
+        self.politica.registrar_solicitud()
+        intento = 0
+        while True:
+            intento += 1
+            es_prueba = self.interruptor.antes_de_llamar()
+            if self.concurrencia is not None:
+                self.concurrencia.adquirir()
+            inicio = time.perf_counter()
+            try:
+                respuesta = self._model.generate_content(*args, **kwargs)
+            except Exception as e:
+                cuota = es_error_cuota(e)
+                if self.concurrencia is not None:
+                    self.concurrencia.liberar(exito=False, error_cuota=cuota)
+                reintentable = es_error_reintentable(e)
+                if reintentable:
+                    self.interruptor.registrar_fallo()
+                elif es_prueba:
+                    # Un error que no es del servicio no cierra ni reabre el circuito,
+                    # pero la prueba no puede quedar tomada
+                    self.interruptor.liberar_prueba()
+                if cuota:
+                    METRICAS.incrementar("errores_cuota")
+                if (not reintentable or intento >= self.politica.max_intentos
+                        or not self.politica.consumir_reintento()):
+                    raise
+                METRICAS.incrementar("reintentos")
+                self._dormir(self.politica.espera(intento))
+                continue
+            except BaseException:
+                # KeyboardInterrupt, cierre del hilo...: se libera lo tomado antes de salir
+                if self.concurrencia is not None:
+                    self.concurrencia.liberar(exito=False)
+                if es_prueba:
+                    self.interruptor.liberar_prueba()
+                raise
+
+            self.interruptor.registrar_exito()
+            if self.hedging is not None and not kwargs.get("stream"):
+                self.hedging.registrar_latencia(time.perf_counter() - inicio)
+            if self.concurrencia is None:
+                return respuesta
+            if kwargs.get("stream"):
+                return StreamLimitado(respuesta, self.concurrencia)
+            self.concurrencia.liberar(exito=True)
+            return respuesta
+
+
+# ==============================
+# HEDGING: SOLICITUDES DUPLICADAS CONTRA LA COLA DE LATENCIA
+# ==============================
+
+DEFAULT_PERCENTIL_HEDGING = 95
+DEFAULT_TASA_MAXIMA_HEDGING = 0.1
+
+
+class ControlHedging:
+    """
+    Decide cuándo duplicar una solicitud lenta.
+
+    Aprende la latencia de las últimas llamadas y, si una solicitud supera el
+    percentil configurado, autoriza una copia; nunca más de tasa_maxima de
+    las solicitudes. Hasta juntar min_muestras no se duplica nada.
+
+    Vinculado a un ModeloResiliente (ModeloResiliente(..., hedging=control)),
+    aprende la latencia de cada intento, sin esperas de backoff ni
+    reintentos, y no duplica nada mientras el modelo está en contención
+    (circuito no cerrado o AIMD retrocediendo tras errores de cuota): un
+    duplicado ahí solo suma carga a un servicio que ya está limitando.
+    """
+
+    def __init__(self, percentil=DEFAULT_PERCENTIL_HEDGING, tasa_maxima=DEFAULT_TASA_MAXIMA_HEDGING,
+                 min_muestras=20, retraso_minimo=1.0, ventana=200):
+        self.percentil = percentil
+        self.tasa_maxima = tasa_maxima
+        self.min_muestras = min_muestras
+        self.retraso_minimo = retraso_minimo
+        self._latencias = deque(maxlen=ventana)
+        self._lock = threading.Lock()
+        self.solicitudes = 0
+        self.hedges_enviados = 0
+        self.hedges_ganados = 0
+        self.hedges_suspendidos = 0
+        self.por_intento = False
+        self._en_contencion = None
+
+    def vincular(self, en_contencion):
+        """Lo llama ModeloResiliente: desde ahí las latencias llegan por intento."""
+        with self._lock:
+            self.por_intento = True
+            self._en_contencion = en_contencion
+
+    def umbral(self):
+        """Segundos tras los cuales conviene duplicar, o None si aún no hay datos."""
+        with self._lock:
+            if len(self._latencias) < self.min_muestras:
+                return None
+            ordenadas = sorted(self._latencias)
+        indice = min(len(ordenadas) - 1, int(len(ordenadas) * self.percentil / 100))
+        return max(self.retraso_minimo, ordenadas[indice])
+
+    def registrar_solicitud(self):
+        with self._lock:
+            self.solicitudes += 1
+
+    def registrar_latencia(self, segundos):
+        with self._lock:
+            self._latencias.append(segundos)
+
+    def autorizar_hedge(self):
+        """Reserva un hedge si no se supera la tasa máxima y el modelo no está en contención."""
+        en_contencion = self._en_contencion
+        if en_contencion is not None and en_contencion():
+            with self._lock:
+                self.hedges_suspendidos += 1
+            METRICAS.incrementar("hedges_suspendidos")
+            return False
+        with self._lock:
+            if self.hedges_enviados + 1 > self.tasa_maxima * self.solicitudes:
+                return False
+            self.hedges_enviados += 1
+        METRICAS.incrementar("hedges_enviados")
+        return True
+
+    def registrar_ganado(self):
+        with self._lock:
+            self.hedges_ganados += 1
+        METRICAS.incrementar("hedges_ganados")
+
+    def como_dict(self):
+        with self._lock:
+            return {
+                "solicitudes": self.solicitudes,
+                "hedges_enviados": self.hedges_enviados,
+                "hedges_ganados": self.hedges_ganados,
+                "hedges_suspendidos": self.hedges_suspendidos,
+                "tasa_hedging": self.hedges_enviados / self.solicitudes if self.solicitudes else 0.0,
+            }
+
+
+def ejecutar_con_hedging(funcion, control):
+    """
+    Ejecuta funcion() y, si tarda más que el umbral aprendido, lanza una copia.
+    Devuelve el primer resultado válido (sin excepción); la otra ejecución se
+    ignora. Si ambas fallan, se propaga el error de la original.
+    """
+    control.registrar_solicitud()
+
+    def medida():
+        if control.por_intento:
+            # ModeloResiliente ya registra la latencia de cada intento
+            return funcion()
+        inicio = time.perf_counter()
+        resultado = funcion()
+        control.registrar_latencia(time.perf_counter() - inicio)
+        return resultado
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        original = executor.submit(medida)
+        umbral = control.umbral()
+        if umbral is None:
+            return original.result()
+
+        hechos, _ = wait([original], timeout=umbral)
+        if hechos or not control.autorizar_hedge():
+            return original.result()
+
+        duplicado = executor.submit(medida)
+        pendientes = [original, duplicado]
+        while pendientes:
+            hechos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                pendientes.remove(futuro)
+                if futuro.exception() is None:
+                    if futuro is duplicado:
+                        control.registrar_ganado()
+                    return futuro.result()
+        return original.result()
+    finally:
+        # No se espera a la ejecución perdedora: su resultado se descarta
+        executor.shutdown(wait=False, cancel_futures=True)
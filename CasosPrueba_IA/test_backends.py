@@ -0,0 +1,112 @@
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from backends import BackendLocal, BackendRest, ErrorBackend, GrabadorRespuestas
+from Casos_Prueba_IA import generar_casos_lote, dividir_prompt
+from metricas import METRICAS, RegistroMetricas
+from resiliencia import ModeloResiliente, PoliticaReintentos
+
+
+def _hus(cantidad):
+    return [(f"hu{i}.txt", f"Como usuario quiero la función {i}") for i in range(cantidad)]
+
+
+class TestPrefijoCacheable(unittest.TestCase):
+    """El backend local cuenta cuántas veces llega el mismo prefijo, como la caché del proveedor."""
+
+    def _generar(self, modelo, hus, **opciones):
+        registro = RegistroMetricas()
+        with METRICAS.usar(registro):
+            resultados = list(generar_casos_lote(modelo, hus, max_workers=2, **opciones))
+        self.assertTrue(all(r.error is None for r in resultados))
+        return registro.resumen()["tokens"]
+
+    def test_el_prefijo_por_defecto_se_reutiliza_entre_hus(self):
+        modelo = BackendLocal()
+        tokens = self._generar(modelo, _hus(5))
+
+        self.assertEqual(modelo.llamadas, 5)
+        self.assertEqual(len(modelo.usos_prefijo), 1)
+        self.assertEqual(modelo.reutilizaciones_prefijo, 4)
+        # Solo la primera solicitud paga el prefijo completo
+        tokens_prefijo = len(dividir_prompt("").instrucciones) // 4
+        self.assertEqual(tokens["prompt_cacheado"], 4 * tokens_prefijo)
+        self.assertGreater(tokens["prompt"], tokens["prompt_cacheado"])
+
+    def test_prompt_personalizado_sin_marcador_tambien_es_prefijo(self):
+        modelo = BackendLocal()
+        self._generar(modelo, _hus(3), custom_prompt="Generá casos de prueba en JSON para esta HU.")
+
+        self.assertEqual(len(modelo.usos_prefijo), 1)
+        self.assertEqual(modelo.reutilizaciones_prefijo, 2)
+        self.assertTrue(all(p.startswith("HU: ") for p in modelo.prompts))
+
+
+class TestBackendRestPrefijos(unittest.TestCase):
+
+    def test_prefijo_corto_no_crea_cached_content_y_se_avisa_una_vez(self):
+        modelo = BackendRest("clave", "gemini-test", 0.0, cachear_prefijos=True)
+        self.addCleanup(modelo.cerrar)
+        instrucciones = dividir_prompt("").instrucciones
+
+        salida = io.StringIO()
+        with redirect_stdout(salida):
+            self.assertIsNone(modelo._contenido_cacheado(instrucciones))
+            self.assertIsNone(modelo._contenido_cacheado(instrucciones))
+        avisos = [linea for linea in salida.getvalue().splitlines() if "cachedContent" in linea]
+        self.assertEqual(len(avisos), 1)
+        self.assertIn(str(modelo.min_tokens_prefijo), avisos[0])
+
+
+class BackendQueFallaAlAbrir(BackendLocal):
+    """Los primeros `fallos` streams fallan al abrirse, como un 503 del proveedor."""
+
+    def __init__(self, fallos):
+        super().__init__(tamano_fragmento=8)
+        self.fallos = fallos
+
+    def generate_content(self, prompt, stream=False, instrucciones=None):
+        if stream and self.fallos:
+            self.fallos -= 1
+            raise ErrorBackend("503: no disponible", code=503)
+        return super().generate_content(prompt, stream=stream, instrucciones=instrucciones)
+
+
+class TestGrabadorRespuestas(unittest.TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = Path(directorio.name) / "grabacion.jsonl"
+
+    def test_el_stream_se_abre_dentro_de_la_llamada(self):
+        grabador = GrabadorRespuestas(BackendQueFallaAlAbrir(fallos=1), self.ruta)
+        with self.assertRaises(ErrorBackend):
+            grabador.generate_content("hu", stream=True)
+
+    def test_los_reintentos_cubren_la_apertura_del_stream(self):
+        backend = BackendQueFallaAlAbrir(fallos=2)
+        modelo = ModeloResiliente(GrabadorRespuestas(backend, self.ruta),
+                                  politica=PoliticaReintentos(max_intentos=3), dormir=lambda _: None)
+        registro = RegistroMetricas()
+        with METRICAS.usar(registro):
+            texto = "".join(f.text for f in modelo.generate_content("hu", stream=True))
+        self.assertEqual(registro.resumen()["contadores"]["reintentos"], 2)
+        self.assertEqual(backend.llamadas, 1)
+        self.assertTrue(texto)
+
+    def test_graba_los_fragmentos_consumidos_y_se_reproducen(self):
+        grabador = GrabadorRespuestas(BackendLocal(tamano_fragmento=5), self.ruta)
+        stream = grabador.generate_content("hu", stream=True, instrucciones="Instrucciones QA")
+        self.assertFalse(self.ruta.exists())
+        texto = "".join(f.text for f in stream)
+
+        reproduccion = BackendLocal(grabacion=self.ruta, estricto=True)
+        self.assertEqual(reproduccion.generate_content("hu", instrucciones="Instrucciones QA").text, texto)
+
+
+if __name__ == "__main__":
+    unittest.main()
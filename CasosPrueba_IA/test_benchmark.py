@@ -0,0 +1,33 @@
+import os
+import unittest
+
+from benchmark import ejecutar_aislado
+
+
+def _morir(cantidad, config, cola):
+    # Como un proceso que el sistema mata por falta de memoria
+    os._exit(137)
+
+
+class TestEjecutarAislado(unittest.TestCase):
+
+    CONFIG = {"latencia_ms": 0.0, "jitter_ms": 0.0, "tasa_fallos": 0.0, "casos_por_respuesta": 2, "workers": 2}
+
+    def test_escenario_en_proceso_aparte(self):
+        resultado = ejecutar_aislado(5, self.CONFIG, intervalo=0.2)
+        self.assertNotIn("error", resultado)
+        self.assertEqual(resultado["hus"], 5)
+        self.assertEqual(resultado["casos"], 10)
+
+    def test_proceso_que_muere_se_informa_como_fallido(self):
+        resultado = ejecutar_aislado(5, self.CONFIG, intervalo=0.2, objetivo=_morir)
+        self.assertEqual(resultado["hus"], 5)
+        self.assertIn("137", resultado["error"])
+
+    def test_error_del_escenario_se_informa_como_fallido(self):
+        resultado = ejecutar_aislado(5, {}, intervalo=0.2)
+        self.assertIn("KeyError", resultado["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from cache_respuestas import CacheRespuestas
+
+
+class TestCacheRespuestas(unittest.TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = Path(directorio.name) / "cache.sqlite"
+
+    def test_deshabilitada_no_crea_el_archivo(self):
+        cache = CacheRespuestas(self.ruta, habilitada=False)
+        clave = cache.clave("modelo", 0.3, "prompt", "hu")
+        cache.guardar(clave, [{"id_caso": "CP-001"}])
+        self.assertIsNone(cache.obtener(clave))
+        self.assertEqual(cache.estadisticas()["entradas"], 0)
+        cache.limpiar()
+        cache.cerrar()
+        self.assertEqual(list(self.ruta.parent.iterdir()), [])
+
+    def test_guarda_y_recupera_entre_instancias(self):
+        cache = CacheRespuestas(self.ruta)
+        clave = cache.clave("modelo", 0.3, "prompt", "hu")
+        cache.guardar(clave, [{"id_caso": "CP-001"}])
+        cache.cerrar()
+
+        reabierta = CacheRespuestas(self.ruta)
+        self.addCleanup(reabierta.cerrar)
+        self.assertEqual(reabierta.obtener(clave), [{"id_caso": "CP-001"}])
+        self.assertEqual(reabierta.estadisticas()["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
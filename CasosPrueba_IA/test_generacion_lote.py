@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+import unittest
+
+from backends import RespuestaModelo
+from Casos_Prueba_IA import LimitadorTasa, generar_casos_lote
+
+
+class RelojFalso:
+    def __init__(self):
+        self.ahora = 0.0
+        self.esperas = []
+
+    def __call__(self):
+        return self.ahora
+
+    def dormir(self, segundos):
+        self.esperas.append(segundos)
+        self.ahora += segundos
+
+
+class ModeloGuionado:
+    """
+    Modelo falso: a cada HU (buscada por nombre en el prompt) le corresponde
+    una latencia y, opcionalmente, un error. Responde un caso por HU.
+    """
+
+    admite_instrucciones = False
+    model_name = "falso"
+    _generation_config = {}
+
+    def __init__(self, latencias=None, errores=None):
+        self.latencias = latencias or {}
+        self.errores = errores or {}
+        self.en_vuelo = 0
+        self.max_en_vuelo = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False):
+        hu = next((hu for hu in self.latencias.keys() | self.errores.keys() if f"<{hu}>" in prompt), None)
+        with self._lock:
+            self.en_vuelo += 1
+            self.max_en_vuelo = max(self.max_en_vuelo, self.en_vuelo)
+        try:
+            time.sleep(self.latencias.get(hu, 0))
+            if hu in self.errores:
+                raise self.errores[hu]
+            caso = {"criterio": "C1", "id_caso": "CP-001", "tipo_prueba": "Functional",
+                    "descripcion": f"Caso de {hu}", "pasos": ["Paso"], "resultado_esperado": "Ok",
+                    "prioridad": "Media", "Automatizar": "si"}
+            return RespuestaModelo(json.dumps([caso]), {"prompt_token_count": len(prompt) // 4})
+        finally:
+            with self._lock:
+                self.en_vuelo -= 1
+
+
+def _hus(cantidad):
+    return [(f"hu{i}", f"Como usuario quiero <hu{i}>") for i in range(cantidad)]
+
+
+class TestLimitadorTasa(unittest.TestCase):
+
+    def test_limita_solicitudes_por_minuto(self):
+        reloj = RelojFalso()
+        limitador = LimitadorTasa(solicitudes_por_minuto=2, reloj=reloj, dormir=reloj.dormir)
+        for _ in range(5):
+            limitador.adquirir()
+        # 2 por ventana de 60 s: la 3.ª espera al minuto 1 y la 5.ª al minuto 2
+        self.assertEqual(reloj.esperas, [60.0, 60.0])
+        self.assertEqual(reloj.ahora, 120.0)
+
+    def test_limita_tokens_por_minuto(self):
+        reloj = RelojFalso()
+        limitador = LimitadorTasa(tokens_por_minuto=1000, reloj=reloj, dormir=reloj.dormir)
+        limitador.adquirir(600)
+        reloj.ahora = 10.0
+        limitador.adquirir(300)
+        self.assertEqual(reloj.esperas, [])
+        # No cabe hasta que salgan de la ventana los 600 tokens del instante 0
+        limitador.adquirir(500)
+        self.assertEqual(reloj.esperas, [50.0])
+
+    def test_sin_limites_no_espera(self):
+        reloj = RelojFalso()
+        limitador = LimitadorTasa(reloj=reloj, dormir=reloj.dormir)
+        for _ in range(100):
+            limitador.adquirir(10_000)
+        self.assertEqual(reloj.esperas, [])
+
+
+class TestGenerarCasosLote(unittest.TestCase):
+
+    def test_entrega_en_orden_de_entrada_aunque_terminen_desordenadas(self):
+        # La primera HU es la más lenta: las demás terminan antes
+        modelo = ModeloGuionado(latencias={"hu0": 0.3, "hu1": 0.1, "hu2": 0.0, "hu3": 0.05})
+        completadas = []
+        resultados = list(generar_casos_lote(modelo, _hus(4), max_workers=4,
+                                             al_completar=lambda r: completadas.append(r.nombre)))
+
+        self.assertEqual([r.nombre for r in resultados], ["hu0", "hu1", "hu2", "hu3"])
+        self.assertNotEqual(completadas[0], "hu0")
+        self.assertGreater(modelo.max_en_vuelo, 1)
+        for resultado in resultados:
+            self.assertEqual([c["archivo_hu"] for c in resultado.casos], [resultado.nombre])
+
+    def test_un_error_no_afecta_a_las_demas_hus(self):
+        modelo = ModeloGuionado(errores={"hu1": ValueError("respuesta inválida")})
+        resultados = list(generar_casos_lote(modelo, _hus(3), max_workers=2))
+
+        self.assertEqual([r.nombre for r in resultados], ["hu0", "hu1", "hu2"])
+        self.assertIsInstance(resultados[1].error, ValueError)
+        self.assertEqual(resultados[1].casos, [])
+        self.assertIsNone(resultados[0].error)
+        self.assertIsNone(resultados[2].error)
+        self.assertEqual(len(resultados[2].casos), 1)
+
+    def test_cada_solicitud_pasa_por_el_limitador(self):
+        modelo = ModeloGuionado()
+        reloj = RelojFalso()
+        limitador = LimitadorTasa(solicitudes_por_minuto=2, reloj=reloj, dormir=reloj.dormir)
+        resultados = list(generar_casos_lote(modelo, _hus(5), max_workers=3, limitador=limitador))
+
+        self.assertTrue(all(r.error is None for r in resultados))
+        self.assertEqual(len(limitador._registro), 1)
+        self.assertEqual(reloj.ahora, 120.0)
+
+    def test_consume_las_hus_de_forma_perezosa(self):
+        leidas = []
+
+        def hus():
+            for nombre, texto in _hus(20):
+                leidas.append(nombre)
+                yield nombre, texto
+
+        lote = generar_casos_lote(ModeloGuionado(), hus(), max_workers=2)
+        next(lote)
+        # Con 2 workers solo se adelanta una ventana acotada de HUs, no la carpeta entera
+        self.assertLess(len(leidas), 20)
+        lote.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import csv
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from manifiesto import ManifiestoEjecucion, hash_contenido
+
+
+def _casos(archivo_hu, cantidad=2):
+    return [{"archivo_hu": archivo_hu, "id_caso": f"CP-{i:03d}"} for i in range(1, cantidad + 1)]
+
+
+class TestManifiestoEjecucion(unittest.TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        self.ruta = Path(self.directorio.name) / "manifiesto.jsonl"
+
+    def test_hus_con_el_mismo_contenido_no_comparten_checkpoint(self):
+        hash_hu = hash_contenido("Como usuario quiero entrar")
+        manifiesto = ManifiestoEjecucion(self.ruta)
+        manifiesto.registrar_exito("a.txt", hash_hu, _casos("a.txt", 2))
+        manifiesto.registrar_exito("sub/a_copy.txt", hash_hu, _casos("sub/a_copy.txt", 3))
+
+        reanudado = ManifiestoEjecucion(self.ruta)
+        self.assertFalse(reanudado.necesita_procesar("a.txt", hash_hu))
+        self.assertEqual([c["archivo_hu"] for c in reanudado.casos_guardados("a.txt")], ["a.txt"] * 2)
+        self.assertEqual([c["archivo_hu"] for c in reanudado.casos_guardados("sub/a_copy.txt")],
+                         ["sub/a_copy.txt"] * 3)
+
+    def test_registra_una_linea_por_hu_y_la_ultima_gana(self):
+        manifiesto = ManifiestoEjecucion(self.ruta)
+        manifiesto.registrar_error("a.txt", "h1", ValueError("timeout"))
+        manifiesto.registrar_exito("b.txt", "h2", _casos("b.txt"))
+        manifiesto.registrar_exito("a.txt", "h1", _casos("a.txt"))
+        self.assertEqual(len(self.ruta.read_text(encoding="utf-8").splitlines()), 3)
+
+        reanudado = ManifiestoEjecucion(self.ruta)
+        self.assertFalse(reanudado.necesita_procesar("a.txt", "h1"))
+        self.assertTrue(reanudado.necesita_procesar("a.txt", "otro hash"))
+        # Al cargar se compacta: una línea por HU
+        self.assertEqual(len(self.ruta.read_text(encoding="utf-8").splitlines()), 2)
+
+    def test_descarta_la_linea_final_cortada(self):
+        manifiesto = ManifiestoEjecucion(self.ruta)
+        manifiesto.registrar_exito("a.txt", "h1", _casos("a.txt"))
+        with open(self.ruta, "a", encoding="utf-8") as f:
+            f.write('{"hu": "b.txt", "hash": "h2", "est')
+
+        reanudado = ManifiestoEjecucion(self.ruta)
+        self.assertFalse(reanudado.necesita_procesar("a.txt", "h1"))
+        self.assertTrue(reanudado.necesita_procesar("b.txt", "h2"))
+
+    def test_cuenta_los_intentos_fallidos(self):
+        manifiesto = ManifiestoEjecucion(self.ruta)
+        manifiesto.registrar_error("a.txt", "h1", ValueError("uno"))
+        manifiesto.registrar_error("a.txt", "h1", ValueError("dos"))
+        entrada = ManifiestoEjecucion(self.ruta).entradas["a.txt"]
+        self.assertEqual(entrada["intentos_fallidos"], 2)
+        self.assertEqual(entrada["error"], "dos")
+
+
+class TestReanudacionConsola(unittest.TestCase):
+    """Corrida de consola con el backend local, interrumpida y reanudada."""
+
+    def test_reanudar_hus_duplicadas_conserva_archivo_hu(self):
+        from Casos_Prueba_IA import main
+
+        with tempfile.TemporaryDirectory() as directorio:
+            base = Path(directorio)
+            carpeta = base / "HUs"
+            (carpeta / "sub").mkdir(parents=True)
+            texto = "Como usuario quiero iniciar sesión.\nCriterios de aceptación:\n- Acepta la clave correcta\n"
+            (carpeta / "a.txt").write_text(texto, encoding="utf-8")
+            (carpeta / "sub" / "a_copy.txt").write_text(texto, encoding="utf-8")
+
+            def corrida(salida):
+                codigo = main([
+                    "--carpeta", str(carpeta), "--salida", str(base / salida), "--backend", "local",
+                    "--workers", "1", "--sin-cache", "--sin-almacen",
+                    "--manifiesto", str(base / "manifiesto.jsonl"),
+                    "--metricas-json", str(base / "resumen.json"),
+                    "--metricas-prom", str(base / "metricas.prom"),
+                ])
+                self.assertIn(codigo, (0, None))
+                with open(base / salida, encoding="utf-8-sig") as f:
+                    return sorted(fila["archivo_hu"] for fila in csv.DictReader(f, delimiter=";"))
+
+            primera = corrida("primera.csv")
+            reanudada = corrida("reanudada.csv")
+
+        self.assertEqual(reanudada, primera)
+        self.assertEqual(set(reanudada), {"a.txt", str(Path("sub") / "a_copy.txt")})
+
+
+if __name__ == "__main__":
+    unittest.main()
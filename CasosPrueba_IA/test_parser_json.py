@@ -0,0 +1,181 @@
+import json
+import unittest
+
+from parser_json import ParserArrayIncremental, rescatar_casos
+
+
+CASOS = [
+    {"id_caso": "CP-001", "descripcion": 'Dice "hola" y sale', "pasos": ["Abrir {menú}", "Cerrar [x]"]},
+    {"id_caso": "CP-002", "descripcion": "Barra invertida \\ al final\\", "datos": {"anidado": {"n": 1}}},
+    {"id_caso": "CP-003", "descripcion": "Llaves } { y corchetes ] [ dentro del texto"},
+]
+
+
+def fragmentos(texto, tamano):
+    """Generador de fragmentos, como los que entrega un stream del modelo."""
+    for i in range(0, len(texto), tamano):
+        yield texto[i:i + tamano]
+
+
+def alimentar_todo(parser, partes):
+    objetos = []
+    for parte in partes:
+        objetos.extend(parser.alimentar(parte))
+    return objetos
+
+
+class TestParserArrayIncremental(unittest.TestCase):
+
+    def test_mismo_resultado_con_cualquier_tamano_de_fragmento(self):
+        texto = "```json\n" + json.dumps(CASOS, ensure_ascii=False, indent=2) + "\n```"
+        for tamano in (1, 2, 3, 7, 64, len(texto)):
+            with self.subTest(tamano=tamano):
+                parser = ParserArrayIncremental()
+                self.assertEqual(alimentar_todo(parser, fragmentos(texto, tamano)), CASOS)
+                self.assertTrue(parser.terminado)
+                self.assertEqual(parser.descartados, [])
+
+    def test_comillas_escapadas_cortadas_entre_fragmentos(self):
+        # El corte cae justo después de la barra que escapa la comilla
+        texto = '[{"id_caso": "CP-001", "descripcion": "dice \\"}\\" fin"}]'
+        corte = texto.index('\\"') + 1
+        parser = ParserArrayIncremental()
+        objetos = alimentar_todo(parser, [texto[:corte], texto[corte:]])
+        self.assertEqual(objetos, [{"id_caso": "CP-001", "descripcion": 'dice "}" fin'}])
+
+    def test_entrega_cada_objeto_apenas_se_cierra(self):
+        texto = json.dumps(CASOS, ensure_ascii=False)
+        fin_primero = texto.index("}, {") + 1
+        parser = ParserArrayIncremental()
+        self.assertEqual(parser.alimentar(texto[:fin_primero]), [CASOS[0]])
+        self.assertEqual(parser.alimentar(texto[fin_primero:]), CASOS[1:])
+
+    def test_objeto_mal_formado_entre_validos(self):
+        texto = '[{"id_caso": "CP-001"}, {"id_caso": "CP-002", "pasos": [1, 2,]}, {"id_caso": "CP-003"}]'
+        parser = ParserArrayIncremental()
+        objetos = alimentar_todo(parser, fragmentos(texto, 5))
+        self.assertEqual([o["id_caso"] for o in objetos], ["CP-001", "CP-003"])
+        self.assertEqual(len(parser.descartados), 1)
+        self.assertIn("CP-002", parser.descartados[0])
+        self.assertTrue(parser.terminado)
+
+    def test_respuesta_cortada_deja_el_objeto_pendiente(self):
+        texto = json.dumps(CASOS, ensure_ascii=False)
+        corte = texto.index("CP-003") + 10
+        parser = ParserArrayIncremental()
+        objetos = alimentar_todo(parser, fragmentos(texto[:corte], 4))
+        self.assertEqual(objetos, CASOS[:2])
+        self.assertFalse(parser.terminado)
+        self.assertTrue(parser.pendiente.startswith('{"id_caso": "CP-003"'))
+
+    def test_ignora_lo_que_sigue_al_cierre_del_array(self):
+        parser = ParserArrayIncremental()
+        objetos = alimentar_todo(parser, ['texto previo [{"a": 1}', '] y después {"b": 2}'])
+        self.assertEqual(objetos, [{"a": 1}])
+        self.assertEqual(parser.alimentar('{"c": 3}'), [])
+
+
+class TestGeneracionStream(unittest.TestCase):
+
+    def test_stream_en_fragmentos_chicos_da_los_mismos_casos(self):
+        from backends import BackendLocal
+        from Casos_Prueba_IA import generar_casos_prueba, generar_casos_prueba_stream
+
+        hu = "Como usuario quiero recuperar mi clave"
+        completos = generar_casos_prueba(BackendLocal(), hu)
+        for tamano in (1, 5, 64):
+            with self.subTest(tamano=tamano):
+                en_stream = list(generar_casos_prueba_stream(BackendLocal(tamano_fragmento=tamano), hu))
+                self.assertEqual(en_stream, completos)
+
+
+def _caso(numero):
+    return json.dumps({"id_caso": f"CP-{numero:03d}", "descripcion": f"Caso {numero}", "pasos": ["Paso"]})
+
+
+# CP-002 está mal formado y la respuesta se corta en medio de CP-004
+TRUNCADA = ("```json\n[" + _caso(1) + ', {"id_caso": "CP-002", "pasos": [1, 2,]}, ' + _caso(3)
+            + ', {"id_caso": "CP-004", "descrip')
+
+
+class TestRescateCasos(unittest.TestCase):
+
+    def test_rescata_los_objetos_completos_de_un_array_cortado(self):
+        rescate = rescatar_casos(TRUNCADA)
+        self.assertEqual([c["id_caso"] for c in rescate.casos], ["CP-001", "CP-003"])
+        self.assertEqual(rescate.descartados, ["CP-002", "CP-004"])
+        self.assertTrue(rescate.truncado)
+
+    def test_array_cerrado_con_un_objeto_roto(self):
+        rescate = rescatar_casos("[" + _caso(1) + ', {"id_caso": "CP-002" "x": 1}, ' + _caso(3) + "]")
+        self.assertEqual([c["id_caso"] for c in rescate.casos], ["CP-001", "CP-003"])
+        self.assertEqual(rescate.descartados, ["CP-002"])
+        self.assertFalse(rescate.truncado)
+
+
+class TestContinuacionCasos(unittest.TestCase):
+    """Respuesta truncada seguida de solicitudes "continúa desde CP-0NN" guionadas."""
+
+    def _generar(self, respuestas, max_continuaciones, stream=False):
+        from backends import BackendLocal
+        from Casos_Prueba_IA import generar_casos_prueba, generar_casos_prueba_stream
+        from metricas import METRICAS, RegistroMetricas
+
+        guion = list(respuestas)
+        modelo = BackendLocal(respuestas=lambda prompt: guion.pop(0), tamano_fragmento=7)
+        registro = RegistroMetricas()
+        with METRICAS.usar(registro):
+            if stream:
+                casos = list(generar_casos_prueba_stream(modelo, "Como usuario quiero pagar",
+                                                         max_continuaciones=max_continuaciones))
+            else:
+                casos = generar_casos_prueba(modelo, "Como usuario quiero pagar",
+                                             max_continuaciones=max_continuaciones)
+        return casos, modelo, registro.rescate.como_dict()
+
+    def test_una_continuacion_completa_lo_que_falta(self):
+        continuacion = "[" + _caso(3) + ", " + _caso(4) + ", " + _caso(5) + "]"
+        casos, modelo, rescate = self._generar([TRUNCADA, continuacion], max_continuaciones=3)
+
+        # CP-003 ya había llegado: no se repite
+        self.assertEqual([c["id_caso"] for c in casos], ["CP-001", "CP-003", "CP-004", "CP-005"])
+        self.assertEqual(modelo.llamadas, 2)
+        self.assertEqual(rescate["solicitudes_continuacion"], 1)
+        self.assertEqual(rescate["respuestas_rotas"], 1)
+        self.assertEqual(rescate["respuestas_rescatadas"], 1)
+        self.assertEqual(rescate["casos_rescatados"], 2)
+        self.assertEqual(rescate["casos_descartados"], 2)
+        self.assertEqual([d["caso"] for d in rescate["detalle_descartados"]], ["CP-002", "CP-004"])
+
+    def test_las_continuaciones_respetan_el_maximo(self):
+        otra_truncada = "[" + _caso(4) + ', {"id_caso": "CP-005", "pas'
+        casos, modelo, rescate = self._generar([TRUNCADA, otra_truncada, otra_truncada], max_continuaciones=2)
+
+        self.assertEqual([c["id_caso"] for c in casos], ["CP-001", "CP-003", "CP-004"])
+        self.assertEqual(modelo.llamadas, 3)
+        self.assertEqual(rescate["solicitudes_continuacion"], 2)
+        self.assertEqual(rescate["respuestas_rotas"], 3)
+        self.assertEqual([d["caso"] for d in rescate["detalle_descartados"]],
+                         ["CP-002", "CP-004", "CP-005", "CP-005"])
+
+    def test_sin_continuaciones_solo_se_rescata(self):
+        casos, modelo, rescate = self._generar([TRUNCADA], max_continuaciones=0)
+
+        self.assertEqual([c["id_caso"] for c in casos], ["CP-001", "CP-003"])
+        self.assertEqual(modelo.llamadas, 1)
+        self.assertEqual(rescate["solicitudes_continuacion"], 0)
+        self.assertEqual(rescate["casos_rescatados"], 2)
+
+    def test_stream_truncado_se_rescata_y_continua(self):
+        continuacion = "[" + _caso(4) + "]"
+        casos, modelo, rescate = self._generar([TRUNCADA, continuacion], max_continuaciones=1, stream=True)
+
+        self.assertEqual([c["id_caso"] for c in casos], ["CP-001", "CP-003", "CP-004"])
+        self.assertEqual(modelo.llamadas, 2)
+        self.assertEqual(rescate["solicitudes_continuacion"], 1)
+        self.assertEqual(rescate["casos_rescatados"], 2)
+        self.assertEqual([d["caso"] for d in rescate["detalle_descartados"]], ["CP-002", "CP-004"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,320 @@
+import threading
+import time
+import unittest
+
+from backends import ErrorBackend
+from resiliencia import (
+    ConcurrenciaAdaptativa, ControlHedging, InterruptorCircuito, ModeloResiliente, PoliticaReintentos,
+    ejecutar_con_hedging,
+)
+
+
+class RelojFalso:
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+
+class ModeloFalso:
+    """Lanza los errores de la lista en orden; cuando se acaban, responde "ok"."""
+
+    def __init__(self, errores=()):
+        self.errores = list(errores)
+        self.llamadas = 0
+
+    def generate_content(self, prompt, stream=False):
+        self.llamadas += 1
+        if self.errores:
+            raise self.errores.pop(0)
+        return "ok"
+
+
+class AzarMaximo:
+    """Jitter sin azar: siempre la espera máxima del intento."""
+
+    def uniform(self, minimo, maximo):
+        return maximo
+
+
+class ModeloStream:
+    """Stream guionado: entrega los fragmentos y, si se indica, falla al final."""
+
+    def __init__(self, fragmentos=("a", "b"), error=None):
+        self.fragmentos = fragmentos
+        self.error = error
+
+    def generate_content(self, prompt, stream=False):
+        def fragmentos():
+            yield from self.fragmentos
+            if self.error is not None:
+                raise self.error
+        return fragmentos()
+
+
+class TestInterruptorCircuito(unittest.TestCase):
+
+    def setUp(self):
+        self.reloj = RelojFalso()
+        self.esperas = []
+
+        def dormir(segundos):
+            # Un circuito trabado se detecta acá, en lugar de colgar la prueba
+            self.esperas.append(segundos)
+            if len(self.esperas) > 50:
+                raise AssertionError("la llamada quedó bloqueada esperando al circuito")
+            self.reloj.ahora += segundos
+
+        self.interruptor = InterruptorCircuito(umbral_fallos=1, pausa=10.0, reloj=self.reloj, dormir=dormir)
+
+    def _modelo(self, modelo):
+        return ModeloResiliente(modelo, politica=PoliticaReintentos(max_intentos=1),
+                                interruptor=self.interruptor, dormir=lambda _: None)
+
+    def _abrir_circuito(self):
+        with self.assertRaises(ConnectionError):
+            self._modelo(ModeloFalso([ConnectionError("reset")])).generate_content("hu")
+        self.assertEqual(self.interruptor.estado, InterruptorCircuito.ABIERTO)
+
+    def test_prueba_con_error_no_reintentable_libera_el_circuito(self):
+        self._abrir_circuito()
+        self.reloj.ahora += 10.0
+
+        with self.assertRaises(ValueError):
+            self._modelo(ModeloFalso([ValueError("prompt inválido")])).generate_content("hu")
+        self.assertEqual(self.interruptor.estado, InterruptorCircuito.SEMIABIERTO)
+        self.assertFalse(self.interruptor._prueba_en_curso)
+
+        # La siguiente llamada hace de prueba y cierra el circuito, sin quedar esperando
+        self.assertEqual(self._modelo(ModeloFalso()).generate_content("hu"), "ok")
+        self.assertEqual(self.interruptor.estado, InterruptorCircuito.CERRADO)
+        self.assertEqual(self.esperas, [])
+
+    def test_prueba_con_error_reintentable_reabre_el_circuito(self):
+        self._abrir_circuito()
+        self.reloj.ahora += 10.0
+
+        with self.assertRaises(ConnectionError):
+            self._modelo(ModeloFalso([ConnectionError("reset")])).generate_content("hu")
+        self.assertEqual(self.interruptor.estado, InterruptorCircuito.ABIERTO)
+        self.assertFalse(self.interruptor._prueba_en_curso)
+
+
+class TestReintentos(unittest.TestCase):
+
+    def setUp(self):
+        self.esperas = []
+        self.politica = PoliticaReintentos(max_intentos=4, base=1.0, maximo=3.0, azar=AzarMaximo())
+
+    def _modelo(self, modelo, concurrencia=None):
+        return ModeloResiliente(modelo, politica=self.politica, concurrencia=concurrencia,
+                                interruptor=InterruptorCircuito(umbral_fallos=10),
+                                dormir=self.esperas.append)
+
+    def test_backoff_exponencial_con_tope(self):
+        self.assertEqual([self.politica.espera(i) for i in range(1, 5)], [1.0, 2.0, 3.0, 3.0])
+
+    def test_reintenta_errores_429_y_5xx(self):
+        modelo = ModeloFalso([ErrorBackend("429: cuota", code=429), ErrorBackend("503: no disponible", code=503)])
+        self.assertEqual(self._modelo(modelo).generate_content("hu"), "ok")
+        self.assertEqual(modelo.llamadas, 3)
+        self.assertEqual(self.esperas, [1.0, 2.0])
+        self.assertEqual(self.politica.reintentos, 2)
+
+    def test_no_reintenta_errores_del_pedido(self):
+        modelo = ModeloFalso([ErrorBackend("400: prompt inválido", code=400)])
+        with self.assertRaises(ErrorBackend):
+            self._modelo(modelo).generate_content("hu")
+        self.assertEqual(modelo.llamadas, 1)
+        self.assertEqual(self.esperas, [])
+
+    def test_se_rinde_al_agotar_los_intentos(self):
+        modelo = ModeloFalso([ErrorBackend("500: error", code=500)] * 5)
+        with self.assertRaises(ErrorBackend):
+            self._modelo(modelo).generate_content("hu")
+        self.assertEqual(modelo.llamadas, 4)
+        self.assertEqual(self.esperas, [1.0, 2.0, 3.0])
+
+    def test_presupuesto_de_reintentos(self):
+        self.politica.minimo_presupuesto = 1
+        self.politica.fraccion_presupuesto = 0.0
+        modelo = ModeloFalso([ErrorBackend("503", code=503)] * 3)
+        with self.assertRaises(ErrorBackend):
+            self._modelo(modelo).generate_content("hu")
+        # Un solo reintento permitido en todo el lote
+        self.assertEqual(modelo.llamadas, 2)
+
+    def test_error_de_cuota_reduce_la_concurrencia(self):
+        concurrencia = ConcurrenciaAdaptativa(inicial=8, maximo=8)
+        modelo = ModeloFalso([ErrorBackend("429", code=429), ErrorBackend("429", code=429)])
+        self._modelo(modelo, concurrencia).generate_content("hu")
+        self.assertEqual(concurrencia.limite, 2.0 + 1 / 2.0)
+        self.assertEqual(concurrencia.en_vuelo, 0)
+
+
+class TestConcurrenciaAdaptativa(unittest.TestCase):
+
+    def test_reduce_a_la_mitad_ante_cuota_sin_bajar_del_minimo(self):
+        concurrencia = ConcurrenciaAdaptativa(inicial=8, minimo=1, maximo=8)
+        limites = []
+        for _ in range(5):
+            concurrencia.adquirir()
+            concurrencia.liberar(exito=False, error_cuota=True)
+            limites.append(concurrencia.limite)
+        self.assertEqual(limites, [4.0, 2.0, 1.0, 1.0, 1.0])
+
+    def test_crece_de_a_uno_por_ventana_de_exitos(self):
+        concurrencia = ConcurrenciaAdaptativa(inicial=2, maximo=3)
+        for _ in range(2):
+            concurrencia.adquirir()
+            concurrencia.liberar(exito=True)
+        self.assertAlmostEqual(concurrencia.limite, 2.9, places=1)
+        for _ in range(10):
+            concurrencia.adquirir()
+            concurrencia.liberar(exito=True)
+        self.assertEqual(concurrencia.limite, 3.0)
+
+    def test_los_errores_que_no_son_de_cuota_no_cambian_el_limite(self):
+        concurrencia = ConcurrenciaAdaptativa(inicial=4)
+        concurrencia.adquirir()
+        concurrencia.liberar(exito=False)
+        self.assertEqual(concurrencia.limite, 4.0)
+
+    def test_bloquea_al_llegar_al_limite(self):
+        concurrencia = ConcurrenciaAdaptativa(inicial=1)
+        concurrencia.adquirir()
+        adquirido = threading.Event()
+        hilo = threading.Thread(target=lambda: (concurrencia.adquirir(), adquirido.set()))
+        hilo.start()
+        self.assertFalse(adquirido.wait(0.1))
+        concurrencia.liberar(exito=True)
+        self.assertTrue(adquirido.wait(1))
+        hilo.join()
+
+
+class TestStreamConcurrencia(unittest.TestCase):
+
+    def setUp(self):
+        self.concurrencia = ConcurrenciaAdaptativa(inicial=1, maximo=4)
+
+    def _modelo(self, modelo):
+        return ModeloResiliente(modelo, politica=PoliticaReintentos(max_intentos=1),
+                                concurrencia=self.concurrencia, dormir=lambda _: None)
+
+    def test_el_stream_ocupa_su_lugar_hasta_agotarse(self):
+        stream = self._modelo(ModeloStream()).generate_content("hu", stream=True)
+        self.assertEqual(self.concurrencia.en_vuelo, 1)
+        self.assertEqual(next(stream), "a")
+        self.assertEqual(self.concurrencia.en_vuelo, 1)
+        self.assertEqual(list(stream), ["b"])
+        self.assertEqual(self.concurrencia.en_vuelo, 0)
+        self.assertEqual(self.concurrencia.limite, 2.0)
+
+    def test_otra_solicitud_espera_mientras_el_stream_sigue_abierto(self):
+        modelo = self._modelo(ModeloStream())
+        stream = modelo.generate_content("hu", stream=True)
+        respuestas = []
+        hilo = threading.Thread(target=lambda: respuestas.append(list(modelo.generate_content("hu", stream=True))))
+        hilo.start()
+        hilo.join(0.1)
+        self.assertEqual(respuestas, [])
+        list(stream)
+        hilo.join(1)
+        self.assertEqual(respuestas, [["a", "b"]])
+
+    def test_cerrar_el_stream_libera_su_lugar(self):
+        stream = self._modelo(ModeloStream()).generate_content("hu", stream=True)
+        next(stream)
+        stream.close()
+        self.assertEqual(self.concurrencia.en_vuelo, 0)
+        self.assertEqual(self.concurrencia.limite, 1.0)
+        stream.close()
+        self.assertEqual(self.concurrencia.en_vuelo, 0)
+
+    def test_stream_descartado_sin_consumir_libera_su_lugar(self):
+        self._modelo(ModeloStream()).generate_content("hu", stream=True)
+        self.assertEqual(self.concurrencia.en_vuelo, 0)
+
+    def test_error_de_cuota_a_mitad_del_stream_reduce_el_limite(self):
+        self.concurrencia = ConcurrenciaAdaptativa(inicial=4)
+        stream = self._modelo(ModeloStream(error=ErrorBackend("429", code=429))).generate_content("hu", stream=True)
+        with self.assertRaises(ErrorBackend):
+            list(stream)
+        self.assertEqual(self.concurrencia.en_vuelo, 0)
+        self.assertEqual(self.concurrencia.limite, 2.0)
+
+
+class TestHedging(unittest.TestCase):
+
+    def _control(self):
+        return ControlHedging(percentil=50, tasa_maxima=1.0, min_muestras=1, retraso_minimo=0.01)
+
+    def test_aprende_la_latencia_de_cada_intento_sin_el_backoff(self):
+        control = self._control()
+        modelo = ModeloResiliente(ModeloFalso([ErrorBackend("429", code=429)]),
+                                  politica=PoliticaReintentos(max_intentos=2, base=0.2, maximo=0.2,
+                                                              azar=AzarMaximo()),
+                                  hedging=control)
+        inicio = time.perf_counter()
+        ejecutar_con_hedging(lambda: modelo.generate_content("hu"), control)
+        self.assertGreaterEqual(time.perf_counter() - inicio, 0.2)
+
+        # Una sola muestra (el intento exitoso) y sin los 0,2 s de espera
+        self.assertEqual(len(control._latencias), 1)
+        self.assertLess(control._latencias[0], 0.1)
+
+    def test_sin_modelo_vinculado_mide_la_solicitud_completa(self):
+        control = self._control()
+        ejecutar_con_hedging(lambda: time.sleep(0.05), control)
+        self.assertEqual(len(control._latencias), 1)
+        self.assertGreaterEqual(control._latencias[0], 0.05)
+
+    def test_no_duplica_con_el_circuito_semiabierto(self):
+        control = self._control()
+        interruptor = InterruptorCircuito(umbral_fallos=1)
+        ModeloResiliente(ModeloFalso(), interruptor=interruptor, hedging=control)
+        control.registrar_solicitud()
+
+        interruptor.estado = InterruptorCircuito.SEMIABIERTO
+        self.assertFalse(control.autorizar_hedge())
+        interruptor.registrar_exito()
+        self.assertTrue(control.autorizar_hedge())
+        self.assertEqual(control.como_dict()["hedges_suspendidos"], 1)
+
+    def test_no_duplica_mientras_aimd_retrocede(self):
+        control = self._control()
+        concurrencia = ConcurrenciaAdaptativa(inicial=4, maximo=4)
+        modelo = ModeloResiliente(ModeloFalso([ErrorBackend("429", code=429)]), concurrencia=concurrencia,
+                                  dormir=lambda _: None, hedging=control)
+        modelo.generate_content("hu")
+        control.registrar_solicitud()
+        self.assertTrue(concurrencia.retrocediendo)
+        self.assertFalse(control.autorizar_hedge())
+
+        # Al recuperar el límite previo (4) se vuelve a duplicar
+        for _ in range(5):
+            modelo.generate_content("hu")
+        self.assertFalse(concurrencia.retrocediendo)
+        self.assertTrue(control.autorizar_hedge())
+
+    def test_solicitud_lenta_se_duplica_solo_sin_contencion(self):
+        for contencion, hedges in ((False, 1), (True, 0)):
+            with self.subTest(contencion=contencion):
+                control = self._control()
+                control.vincular(lambda: contencion)
+                control.registrar_latencia(0.01)
+                llamadas = []
+
+                def solicitud():
+                    llamadas.append(1)
+                    time.sleep(0.3 if len(llamadas) == 1 else 0.0)
+                    return len(llamadas)
+
+                ejecutar_con_hedging(solicitud, control)
+                self.assertEqual(control.como_dict()["hedges_enviados"], hedges)
+                self.assertEqual(len(llamadas), 1 + hedges)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from backends import BackendLocal
+from trabajo_generacion import TrabajoGeneracion, COMPLETADO
+
+
+class ModeloCompartido(BackendLocal):
+    """Backend local que cuenta los cierres, como el modelo cacheado de la app."""
+
+    def __init__(self):
+        super().__init__()
+        self.cierres = 0
+
+    def cerrar(self):
+        self.cierres += 1
+
+
+class TestTrabajoGeneracion(unittest.TestCase):
+
+    def test_los_trabajos_no_cierran_el_modelo_compartido(self):
+        modelo = ModeloCompartido()
+        hus = [(f"hu{i}.txt", f"Como usuario quiero la función {i}") for i in range(3)]
+        trabajos = [TrabajoGeneracion(modelo, hus, max_workers=2).iniciar() for _ in range(2)]
+        for trabajo in trabajos:
+            self.assertTrue(trabajo.esperar(timeout=30))
+            self.assertEqual(trabajo.estado, COMPLETADO)
+            self.assertEqual(len(trabajo.casos), 9)
+        self.assertEqual(modelo.cierres, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
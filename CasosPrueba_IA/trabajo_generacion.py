@@ -0,0 +1,205 @@
+import io
+import threading
+import time
+
+from Casos_Prueba_IA import generar_casos_lote, EscritorCasos, CAMPOS_CSV
+from almacen_resultados import ORIGEN_APP
+from caso_prueba import CasoPrueba, convertir_casos
+from deduplicacion import aplicar_deduplicacion, DEFAULT_UMBRAL_DUPLICADOS
+from metricas import METRICAS, RegistroMetricas
+
+# ==============================
+# GENERACIÓN EN SEGUNDO PLANO (para la app)
+# ==============================
+
+EN_CURSO = "en_curso"
+COMPLETADO = "completado"
+CANCELADO = "cancelado"
+FALLIDO = "fallido"
+
+
+class TrabajoGeneracion:
+    """
+    Corre generar_casos_lote en un hilo propio para que la interfaz no se
+    congele. La app consulta instantanea() en cada refresco y puede pedir
+    cancelar(): se dejan de enviar HUs nuevas y se esperan solo las que ya
+    están en vuelo.
+
+    Este hilo no toca Streamlit: solo actualiza su propio estado bajo un lock.
+    Al terminar, csv_bytes / jsonl_bytes / casos quedan listos para guardarse
+    en la sesión. opciones_lote se pasan tal cual a generar_casos_lote, salvo
+    en_vivo (mostrar los casos de cada HU apenas termina). Con deduplicar ("marcar" o
+    "fusionar") los casos casi duplicados se tratan al final del lote.
+
+    Los casos se guardan como CasoPrueba (validados y compactos), convertidos
+    una sola vez al llegar del pipeline. Con almacen (AlmacenResultados) el
+    resultado final se agrega al histórico como una corrida más; si eso
+    falla, el error queda en error_almacen y los casos se entregan igual.
+
+    Cada trabajo mide en su propio RegistroMetricas (`metricas`): varias
+    sesiones de la app pueden generar a la vez sin mezclar ni borrar las
+    métricas de las otras.
+
+    El modelo es de quien crea el trabajo (en la app, el recurso cacheado que
+    comparten todas las sesiones): el trabajo nunca lo cierra.
+    """
+
+    def __init__(self, model, hus, campos=CAMPOS_CSV, cache=None, deduplicar=None,
+                 umbral_duplicados=DEFAULT_UMBRAL_DUPLICADOS, almacen=None, **opciones_lote):
+        self.model = model
+        self.hus = list(hus)
+        self.total = len(self.hus)
+        self.campos = campos
+        self.campos_salida = list(campos)
+        self.cache = cache
+        self.deduplicar = deduplicar
+        self.umbral_duplicados = umbral_duplicados
+        self.duplicados = 0
+        self.almacen = almacen
+        self.corrida = None
+        self.error_almacen = None
+        self.opciones_lote = opciones_lote
+
+        self.estado = EN_CURSO
+        self.completados = 0
+        self.ultimo = None
+        self.casos = []
+        self.errores = []  # (nombre, mensaje)
+        self.error_fatal = None
+        self.csv_bytes = b""
+        self.jsonl_bytes = b""
+        self.estadisticas_cache = None
+        self.metricas = RegistroMetricas()
+        self.inicio = time.time()
+        self.fin = None
+
+        self._cancelar = threading.Event()
+        self._lock = threading.Lock()
+        self._hilo = threading.Thread(target=self._ejecutar_con_metricas, name="trabajo-generacion", daemon=True)
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def cancelar(self):
+        self._cancelar.set()
+
+    @property
+    def terminado(self):
+        return self.estado != EN_CURSO
+
+    def esperar(self, timeout=None):
+        self._hilo.join(timeout)
+        return self.terminado
+
+    def instantanea(self, ultimos_casos=50):
+        """Copia del progreso para dibujar sin bloquear al hilo de generación."""
+        with self._lock:
+            return {
+                "estado": self.estado,
+                "cancelando": self._cancelar.is_set() and self.estado == EN_CURSO,
+                "completados": self.completados,
+                "total": self.total,
+                "ultimo": self.ultimo,
+                "casos": len(self.casos),
+                "recientes": list(self.casos[-ultimos_casos:]),
+                "errores": list(self.errores),
+                "segundos": round((self.fin or time.time()) - self.inicio, 1),
+            }
+
+    # --- Hilo de generación ---
+
+    def _hus_pendientes(self):
+        # generar_casos_lote consume las HUs de forma perezosa: al cancelar
+        # simplemente no recibe más
+        for hu in self.hus:
+            if self._cancelar.is_set():
+                return
+            yield hu
+
+    def _al_completar(self, resultado):
+        with self._lock:
+            self.completados += 1
+            self.ultimo = resultado.nombre
+            if resultado.error:
+                self.errores.append((resultado.nombre, str(resultado.error)))
+
+    def _al_caso(self, nombre, caso):
+        caso = CasoPrueba.desde_dict(caso)
+        with self._lock:
+            self.casos.append(caso)
+
+    def _archivar(self, casos):
+        try:
+            if casos:
+                self.corrida = self.almacen.iniciar_corrida(ORIGEN_APP, modelo=getattr(self.model, "model_name", None))
+                self.almacen.agregar(self.corrida, casos)
+                self.almacen.terminar_corrida(self.corrida)
+        except Exception as e:
+            self.error_almacen = e
+        finally:
+            self.almacen.cerrar()
+
+    def _ejecutar_con_metricas(self):
+        with METRICAS.usar(self.metricas):
+            self._ejecutar()
+
+    def _ejecutar(self):
+        csv_buffer = io.StringIO()
+        jsonl_buffer = io.StringIO()
+        escritor_csv = EscritorCasos(csv_buffer, formato="csv", campos=self.campos)
+        escritor_jsonl = EscritorCasos(jsonl_buffer, formato="jsonl", campos=self.campos)
+        en_vivo = self.opciones_lote.pop("en_vivo", True)
+        ordenados = []
+
+        try:
+            for resultado in generar_casos_lote(
+                self.model,
+                self._hus_pendientes(),
+                al_completar=self._al_completar,
+                al_caso=self._al_caso if en_vivo else None,
+                cache=self.cache,
+                **self.opciones_lote
+            ):
+                if resultado.error:
+                    continue
+                escritor_csv.escribir(resultado.casos)
+                escritor_jsonl.escribir(resultado.casos)
+                # Tabla, descargas e histórico salen de los mismos resultados, en orden de
+                # entrada; lo recibido en vivo es solo la vista previa del progreso
+                casos = convertir_casos(resultado.casos)
+                ordenados.extend(casos)
+                if not en_vivo:
+                    with self._lock:
+                        self.casos.extend(casos)
+            estado = CANCELADO if self._cancelar.is_set() else COMPLETADO
+
+            if self.deduplicar and ordenados:
+                ordenados, campos_extra, self.duplicados = aplicar_deduplicacion(
+                    ordenados, self.deduplicar, self.umbral_duplicados
+                )
+                ordenados = convertir_casos(ordenados)
+                self.campos_salida = self.campos + campos_extra
+                # La salida incremental ya no sirve: se reescribe con el resultado final
+                csv_buffer, jsonl_buffer = io.StringIO(), io.StringIO()
+                EscritorCasos(csv_buffer, formato="csv", campos=self.campos_salida).escribir(ordenados)
+                EscritorCasos(jsonl_buffer, formato="jsonl", campos=self.campos_salida).escribir(ordenados)
+        except Exception as e:
+            self.error_fatal = e
+            estado = FALLIDO
+        finally:
+            if self.cache is not None:
+                self.estadisticas_cache = self.cache.estadisticas()
+                self.cache.cerrar()
+
+        if self.almacen is not None:
+            self._archivar(ordenados)
+
+        with self._lock:
+            # El CSV va con BOM, igual que el archivo que genera la consola
+            self.csv_bytes = csv_buffer.getvalue().encode("utf-8-sig")
+            self.jsonl_bytes = jsonl_buffer.getvalue().encode("utf-8")
+            # El resultado final va en orden de entrada
+            self.casos = ordenados
+            self.fin = time.time()
+            self.estado = estado